@@ -0,0 +1,3 @@
+"""nanomongo benchmarks. These are not part of the installed package, run them
+from the repository root eg. ``python -m benchmarks.importtime``
+"""
@@ -0,0 +1,101 @@
+"""
+Run the hot path benchmarks, optionally store results as JSON and compare them with
+a baseline::
+
+    python -m benchmarks --output results.json --baseline benchmarks/baseline.json
+
+Exits with status 1 if any benchmark is slower than the baseline by more than ``--threshold``,
+by default 1.0 (twice as slow): on shared machines timings of the same tree vary by up to
+about 1.9x between runs, lower it on a quiet machine.
+``benchmarks/baseline.json`` is regenerated with ``--output`` along with changes adding
+benchmarks or moving hot path timings; timings only compare on the machine recording them.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+import nanomongo
+
+from .hotpaths import BENCHMARKS
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """Return best per-call seconds of callable ``func`` over ``repeat`` runs, each run
+    after ``func.reset()`` if set
+    """
+    timer = timeit.Timer(func, setup=getattr(func, 'reset', 'pass'))
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 10
+    per_call = getattr(func, 'per_call', 1)
+    return min(timer.repeat(repeat=repeat, number=number)) / number / per_call
+
+
+def run(names=None, repeat=5):
+    results = {}
+    for bench in BENCHMARKS:
+        if names and bench.__name__ not in names:
+            continue
+        results[bench.__name__] = {'seconds': measure(bench(), repeat=repeat)}
+    return {
+        'meta': {
+            'nanomongo': nanomongo.__version__, 'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print a comparison table, return names of benchmarks slower than ``1 + threshold`` times baseline"""
+    regressions = []
+    print('%-28s %14s %14s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+    for name, result in sorted(current['results'].items()):
+        seconds = result['seconds']
+        base = baseline['results'].get(name, {}).get('seconds')
+        if base is None:
+            print('%-28s %14s %12.3fus %8s' % (name, '-', seconds * 1e6, 'new'))
+            continue
+        ratio = seconds / base
+        mark = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = ' SLOWER'
+        elif ratio < 1 - threshold:
+            mark = ' faster'
+        print('%-28s %12.3fus %12.3fus %7.2fx%s' % (name, base * 1e6, seconds * 1e6, ratio, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='nanomongo hot path benchmarks')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, default all')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare results with this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.0, help='allowed slowdown ratio (default 1.0)')
+    args = parser.parse_args(argv)
+
+    current = run(names=args.names, repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(current, fp, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print('regressions: %s' % ', '.join(regressions))
+            return 1
+    else:
+        for name, result in sorted(current['results'].items()):
+            print('%-28s %12.3fus' % (name, result['seconds'] * 1e6))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""
+An in-process stand-in for ``pymongo.MongoClient``, enough for nanomongo's hot paths:
+``insert_one``, ``find``, ``find_one``, ``update_one`` and SON manipulators on find.
+Queries only support top-level equality, documents are stored by ``_id``. Registered with
+:func:`~nanomongo.util.allow_client` on import.
+"""
+import copy
+
+import bson
+
+from nanomongo.util import allow_client
+
+
+def matches(doc, spec):
+    return all(doc.get(key) == value for key, value in spec.items())
+
+
+class FakeCollection(object):
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.documents = database.client.store.setdefault((database.name, name), {})
+
+    def create_indexes(self, indexes):
+        return [index.document['name'] for index in indexes]
+
+    def insert_one(self, document):
+        if '_id' not in document:
+            document['_id'] = bson.ObjectId()
+        self.documents[document['_id']] = copy.deepcopy(dict(document))
+        return document['_id']
+
+    def insert_many(self, documents):
+        return [self.insert_one(document) for document in documents]
+
+    def candidates(self, spec):
+        """Documents possibly matching ``spec``, looked up by ``_id`` when given"""
+        if '_id' in spec:
+            doc = self.documents.get(spec['_id'])
+            return [doc] if doc is not None else []
+        return list(self.documents.values())
+
+    def find(self, spec=None, *args, **kwargs):
+        spec = spec or {}
+        limit = kwargs.get('limit', 0)
+        found = 0
+        for doc in self.candidates(spec):
+            if not matches(doc, spec):
+                continue
+            yield self.database.fix_outgoing(copy.deepcopy(doc), self)
+            found += 1
+            if limit and found >= limit:
+                return
+
+    def find_one(self, spec=None, *args, **kwargs):
+        if spec is not None and not isinstance(spec, dict):
+            spec = {'_id': spec}
+        for doc in self.find(spec, limit=1):
+            return doc
+
+    def update_one(self, query, update):
+        for doc in self.candidates(query):
+            if matches(doc, query):
+                break
+        else:
+            return None
+        for key, value in update.get('$set', {}).items():
+            target, key = self.traverse(doc, key)
+            target[key] = copy.deepcopy(value)
+        for key in update.get('$unset', {}):
+            target, key = self.traverse(doc, key)
+            target.pop(key, None)
+        for key, value in update.get('$addToSet', {}).items():
+            target, key = self.traverse(doc, key)
+            values = target.setdefault(key, [])
+            values.extend(v for v in value['$each'] if v not in values)
+        return 1
+
+    @staticmethod
+    def traverse(doc, dotted_key):
+        keys = dotted_key.split('.')
+        for key in keys[:-1]:
+            doc = doc.setdefault(key, {})
+        return doc, keys[-1]
+
+
+class FakeDatabase(object):
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.manipulators = []
+
+    def add_son_manipulator(self, manipulator):
+        self.manipulators.append(manipulator)
+
+    def fix_outgoing(self, son, collection):
+        for manipulator in reversed(self.manipulators):
+            son = manipulator.transform_outgoing(son, collection)
+        return son
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+
+class FakeClient(object):
+    """Like pymongo, ``client[name]`` returns a new database object on each access, sharing storage"""
+    def __init__(self):
+        self.store = {}  # (database, collection): {_id: document}
+
+    def __getitem__(self, name):
+        return FakeDatabase(self, name)
+
+
+allow_client(FakeClient)
@@ -0,0 +1,197 @@
+"""
+Benchmarks of document hot paths. Each benchmark is a function doing its setup and
+returning the zero-argument callable to be timed, optionally with attributes ``per_call``
+(operations per call) and ``reset`` (run before each measurement). They all run against
+:class:`~benchmarks.fakeclient.FakeClient`, no server needed.
+"""
+import datetime
+import pickle
+
+import six
+
+from nanomongo import BaseDocument, Field
+from nanomongo.util import RecordingDict, check_spec
+
+from .fakeclient import FakeClient
+
+BENCHMARKS = []
+WIDE_FIELDS = 50
+DECODE_DOCUMENTS = 100
+LARGE_ARRAY = 10000
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def wide_class_dict():
+    dct = {'dot_notation': True}
+    for n in range(WIDE_FIELDS):
+        field_type = (int, six.text_type, list, dict, datetime.datetime)[n % 5]
+        default = {int: 0, six.text_type: six.u(''), list: [1, 2], dict: {'a': 1},
+                   datetime.datetime: datetime.datetime(2017, 1, 1)}[field_type]
+        dct['field_%d' % n] = Field(field_type, default=default)
+    return dct
+
+
+class Small(BaseDocument):
+    dot_notation = True
+    foo = Field(six.text_type)
+    bar = Field(int, required=False)
+    tags = Field(list, default=[])
+    sub = Field(dict, default={})
+
+
+Wide = type('Wide', (BaseDocument,), wide_class_dict())
+
+client = FakeClient()
+Small.register(client=client, db='nanobench')
+Wide.register(client=client, db='nanobench')
+
+
+@benchmark
+def init_small():
+    return lambda: Small(foo=six.u('foo'), bar=42)
+
+
+@benchmark
+def init_wide():
+    return lambda: Wide()
+
+
+@benchmark
+def validate_all_wide():
+    return Wide().validate_all
+
+
+@benchmark
+def recordingdict_setitem():
+    d = RecordingDict(foo=0)
+    counter = [0]
+
+    def setitem():
+        counter[0] += 1
+        d['foo'] = counter[0]
+    return setitem
+
+
+@benchmark
+def get_sub_diff():
+    d = Wide()
+    for name, value in d.items():
+        if isinstance(value, dict):
+            value['b'] = 2
+    return d.get_sub_diff
+
+
+@benchmark
+def reset_diff():
+    return Wide().reset_diff
+
+
+@benchmark
+def dot_notation_get():
+    d = Small(foo=six.u('foo'))
+    return lambda: d.foo
+
+
+@benchmark
+def dot_notation_set():
+    d = Small(foo=six.u('foo'))
+    counter = [0]
+
+    def setattr_():
+        counter[0] += 1
+        d.bar = counter[0]
+    return setattr_
+
+
+@benchmark
+def son_decode():
+    """Decode of a find() result through the SON manipulator, per document"""
+    collection = client['nanobench']['decode']
+    collection.documents.clear()
+    for _ in range(DECODE_DOCUMENTS):
+        collection.insert_one(dict(Wide()))
+    manipulator = Wide.get_collection().database.manipulators[0]
+    sons = list(collection.documents.values())
+
+    def decode():
+        for son in sons:
+            manipulator.transform_outgoing(dict(son), collection)
+    decode.per_call = DECODE_DOCUMENTS
+    return decode
+
+
+@benchmark
+def read_only_decode():
+    """Cast of a find(read_only=True) result, per document"""
+    collection = client['nanobench']['decode']
+    collection.documents.clear()
+    for _ in range(DECODE_DOCUMENTS):
+        collection.insert_one(dict(Wide()))
+    sons = list(collection.documents.values())
+
+    def decode():
+        for son in sons:
+            Wide.nanomongo.read_only_document(dict(son))
+    decode.per_call = DECODE_DOCUMENTS
+    return decode
+
+
+@benchmark
+def projection_decode():
+    """Cast of a find(projection=...) result with 3 of the Wide fields, per document"""
+    record_class = Wide.projection('field_0', 'field_1', 'field_3')
+    sons = [dict((key, value) for key, value in Wide().items() if key in record_class.spec)
+            for _ in range(DECODE_DOCUMENTS)]
+
+    def decode():
+        for son in sons:
+            record_class.from_son(son)
+    decode.per_call = DECODE_DOCUMENTS
+    return decode
+
+
+@benchmark
+def pickle_roundtrip():
+    d = Small(foo=six.u('foo'), tags=list(range(100)), sub={'a': 1})
+    d['sub']['b'] = 2
+    return lambda: pickle.loads(pickle.dumps(d, pickle.HIGHEST_PROTOCOL))
+
+
+@benchmark
+def to_json_wide():
+    d = Wide()
+    return d.to_json
+
+
+@benchmark
+def from_json_wide():
+    text = Wide().to_json()
+    return lambda: Wide.from_json(text)
+
+
+@benchmark
+def check_spec_find():
+    spec = {'foo': six.u('foo'), 'bar': {'$gt': 1}, 'sub.key': 1}
+    return lambda: check_spec(Small, spec)
+
+
+@benchmark
+def add_to_set_large_array():
+    d = Small(foo=six.u('foo'), tags=list(range(LARGE_ARRAY)))
+    return lambda: d.add_to_set('tags', LARGE_ARRAY - 1)
+
+
+@benchmark
+def insert_save():
+    def insert_save():
+        d = Small(foo=six.u('foo'))
+        d.insert()
+        d.bar = 42
+        d.sub['key'] = 1
+        d.save()
+    insert_save.reset = Small.get_collection().documents.clear  # per measurement
+    return insert_save
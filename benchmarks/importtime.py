@@ -0,0 +1,106 @@
+"""
+Import-time benchmark, ``python -X importtime`` style.
+
+Measures the cumulative import time of ``nanomongo`` and of a generated models
+module defining many :class:`~nanomongo.document.BaseDocument` subclasses, so
+that :class:`~nanomongo.document.DocumentMeta` overhead (eg. ``_get_bases``)
+is included. Every measurement runs in a fresh interpreter.
+::
+
+    python -m benchmarks.importtime --classes 500 --repeat 5
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+MODEL_HEADER = '''import datetime
+
+import six
+
+from nanomongo import Field, BaseDocument
+
+
+class Base(BaseDocument):
+    dot_notation = True
+    created = Field(datetime.datetime, auto_update=True)
+
+'''
+
+MODEL_TEMPLATE = '''
+class Model{n}(Base):
+    name = Field(six.text_type)
+    count = Field(int, default=0)
+    tags = Field(list, default=[])
+    meta = Field(dict, required=False)
+'''
+
+
+def write_models(directory, classes):
+    """Write a ``nanomodels`` module defining ``classes`` document classes
+    into ``directory``, return the module name
+    """
+    with open(os.path.join(directory, 'nanomodels.py'), 'w') as fp:
+        fp.write(MODEL_HEADER)
+        for n in range(classes):
+            fp.write(MODEL_TEMPLATE.format(n=n))
+    return 'nanomodels'
+
+
+def importtime(module, pythonpath):
+    """Import ``module`` in a fresh interpreter with ``-X importtime``, return
+    ``{module_name: cumulative_microseconds}`` for every module imported
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(pythonpath))
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                            stderr=subprocess.PIPE, env=env)
+    _, stderr = proc.communicate()
+    if proc.returncode:
+        raise RuntimeError(stderr.decode('utf-8', 'replace'))
+    timings = {}
+    for line in stderr.decode('utf-8').splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            timings[match.group(4)] = int(match.group(2))
+    return timings
+
+
+def run(classes=500, repeat=5):
+    """Return best-of-``repeat`` cumulative import times in microseconds"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    tmpdir = tempfile.mkdtemp(prefix='nanobench')
+    try:
+        models = write_models(tmpdir, classes)
+        results = {}
+        for name, module in (('import_nanomongo', 'nanomongo'), ('import_models_%d' % classes, models)):
+            samples = [importtime(module, [root, tmpdir]) for _ in range(repeat)]
+            results[name] = min(sample[module] for sample in samples)
+            heavy = ('motor', 'tornado')
+            results[name + '_heavy_imports'] = sorted(set(
+                mod for sample in samples for mod in sample if mod.split('.')[0] in heavy))
+        results['import_models_%d_classes_only' % classes] = (
+            results['import_models_%d' % classes] - results['import_nanomongo'])
+        return results
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--classes', type=int, default=500, help='number of document classes in models module')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreter runs per measurement')
+    args = parser.parse_args(argv)
+    for name, value in sorted(run(classes=args.classes, repeat=args.repeat).items()):
+        unit = 'us' if isinstance(value, int) else ''
+        print('%-40s %s%s' % (name, value, unit))
+
+
+if __name__ == '__main__':
+    main()
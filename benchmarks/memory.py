@@ -0,0 +1,88 @@
+"""
+Memory benchmark of documents loaded from a cursor, measured with ``tracemalloc``.
+
+Documents with nested dicts are inserted into :class:`~benchmarks.fakeclient.FakeClient`
+and loaded back through ``find()`` (SON manipulator casting included); the bytes still
+allocated while the loaded documents are alive are reported per document, after loading,
+after modifying them and after modifying them again followed by ``reset_diff()``.
+::
+
+    python -m benchmarks.memory --documents 10000
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import tracemalloc
+
+import six
+
+from nanomongo import BaseDocument, Field
+
+from .fakeclient import FakeClient
+
+
+class Loaded(BaseDocument):
+    name = Field(six.text_type)
+    count = Field(int)
+    tags = Field(list)
+    meta = Field(dict)
+    address = Field(dict)
+
+
+def traced(func):
+    """Return ``(result, bytes allocated by func() and still alive)``"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def run(documents=10000):
+    """Return bytes per document retained by loading, by changes and by changes followed by ``reset_diff()``"""
+    client = FakeClient()
+    Loaded.register(client=client, db='nanobench', collection='memory')
+    collection = Loaded.get_collection()
+    for n in range(documents):
+        collection.insert_one({
+            'name': six.u('doc %d') % n, 'count': n, 'tags': [six.u('a'), six.u('b')],
+            'meta': {'source': six.u('bench'), 'version': 1},
+            'address': {'street': six.u('Main St.'), 'geo': {'lat': 1.0, 'lng': 2.0}},
+        })
+    docs, loaded = traced(lambda: list(Loaded.find()))
+
+    def change():
+        for doc in docs:
+            doc['count'] += 1
+            doc['address']['geo']['lat'] = 1.5
+
+    def change_reset():
+        change()
+        for doc in docs:
+            doc.reset_diff()
+    _, changed = traced(change)
+    for doc in docs:
+        doc.reset_diff()
+    _, reset = traced(change_reset)
+    return {
+        'loaded_bytes_per_document': loaded // documents,
+        'changed_bytes_per_document': changed // documents,
+        'reset_bytes_per_document': reset // documents,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=10000, help='number of documents to load')
+    args = parser.parse_args(argv)
+    for name, value in sorted(run(documents=args.documents).items()):
+        print('%-40s %d' % (name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,3 @@
-from .document import Field, BaseDocument  # NOQA
+from .document import Field, BaseDocument, EmbeddedDocument  # NOQA
 
 __version__ = '0.5.0-dev'
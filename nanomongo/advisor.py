@@ -0,0 +1,208 @@
+"""
+Opt-in query/index advisor. Once enabled for a document class with
+:meth:`~nanomongo.document.Nanomongo.set_index_advisor`, every query shape seen by
+:meth:`~nanomongo.document.BaseDocument.find` and
+:meth:`~nanomongo.document.BaseDocument.find_one` is matched against the
+``__indexes__`` declared on the class (plus the implicit ``_id`` index) and recorded
+in a per-class report.
+::
+
+    Doc.nanomongo.set_index_advisor(explain=True)
+    ...
+    for entry in Doc.nanomongo.advisor.report():
+        print(entry['status'], entry['filter'], entry['sort'], entry['reasons'])
+"""
+import threading
+
+import pymongo
+
+from .util import spec_shape
+
+EQUALITY, RANGE = 'equality', 'range'
+RANGE_OPERATORS = frozenset(['$gt', '$gte', '$lt', '$lte', '$ne', '$nin', '$exists', '$regex', '$not', '$type',
+                             '$mod', '$size', '$all', '$elemMatch'])
+# worst first, the order in which report entries are sorted
+STATUSES = ('collscan', 'partial', 'unfiltered', 'optimal')
+
+
+def index_key(index):
+    """Return ``[(field, direction), ...]`` of a ``pymongo.IndexModel`` (or raw key list)"""
+    if isinstance(index, pymongo.IndexModel):
+        return list(index.document['key'].items())
+    return list(index)
+
+
+def classify_spec(spec):
+    """
+    Split a query spec into equality and range predicates by field name. ``$in`` and
+    ``$eq`` count as equality; fields under top-level logical operators (``$or`` etc.)
+    are not analyzed and returned separately.
+    Returns ``(equality_fields, range_fields, unanalyzed_operators)``
+    """
+    equality, ranges, unanalyzed = set(), set(), set()
+    for field, query in spec.items():
+        if field.startswith('$'):
+            unanalyzed.add(field)
+        elif isinstance(query, dict) and any(k.startswith('$') for k in query):
+            if any(op in RANGE_OPERATORS for op in query):
+                ranges.add(field)
+            else:
+                equality.add(field)
+        else:  # plain value or embedded document
+            equality.add(field)
+    return equality, ranges, unanalyzed
+
+
+def match_index(key, equality, sort, ranges):
+    """
+    Match an index key against query predicates in Equality, Sort, Range order.
+    Returns ``(status, reasons)`` where status is one of ``optimal``, ``partial``,
+    ``collscan`` and reasons is a list of strings explaining a non-optimal plan.
+    """
+    names = [name for name, _ in key]
+    pos = 0
+    eq_left = set(equality)
+    while pos < len(names) and names[pos] in eq_left:  # equality prefix
+        eq_left.discard(names[pos])
+        pos += 1
+    eq_used = pos
+    sort_ok = not sort
+    if sort:
+        index_sort = key[pos:pos + len(sort)]
+        if [name for name, _ in index_sort] == [name for name, _ in sort]:
+            directions = [(d_sort, d_index) for (_, d_sort), (_, d_index) in zip(sort, index_sort)]
+            sort_ok = (all(d_sort == d_index for d_sort, d_index in directions) or
+                       all(isinstance(d_index, int) and d_sort == -d_index for d_sort, d_index in directions))
+            pos += len(sort) if sort_ok else 0
+    range_left = set(ranges) - set(names[pos:])
+    range_used = pos < len(names) and names[pos] in ranges
+    if not (eq_used or range_used or (sort and sort_ok)):
+        return 'collscan', ['index prefix "%s" not in query' % names[0]]
+    reasons = []
+    if eq_left:
+        reasons.append('equality fields not in index prefix: %s' % sorted(eq_left))
+    if not sort_ok:
+        reasons.append('in-memory sort')
+    if range_left:
+        reasons.append('range fields not indexed after equality/sort keys: %s' % sorted(range_left))
+    return ('partial' if reasons else 'optimal'), reasons
+
+
+def class_indexes(doc_class):
+    """Return declared index keys of a document class, ``_id`` index included"""
+    indexes = doc_class.__indexes__ if hasattr(doc_class, '__indexes__') else []
+    return [[('_id', pymongo.ASCENDING)]] + [index_key(index) for index in indexes]
+
+
+def sort_supported(indexes, spec, sort):
+    """Return whether one of the index keys can return documents matching ``spec`` in
+    ``sort`` order without an in-memory sort
+    """
+    equality, ranges, _ = classify_spec(spec)
+    for key in indexes:
+        status, reasons = match_index(key, equality, sort, ranges)
+        if 'collscan' != status and 'in-memory sort' not in reasons:
+            return True
+    return False
+
+
+def explain_summary(explain):
+    """Summarize an explain output; winning plan stages, collection scans and
+    documents examined to returned ratio
+    """
+    stages = []
+
+    def walk(plan):
+        stages.append(plan.get('stage'))
+        for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+            if child:
+                walk(child)
+
+    walk(explain.get('queryPlanner', {}).get('winningPlan', {}))
+    stats = explain.get('executionStats', {})
+    examined, returned = stats.get('totalDocsExamined'), stats.get('nReturned')
+    ratio = None
+    if examined is not None and returned is not None:
+        ratio = float(examined) / returned if returned else float(examined)
+    return {
+        'stages': stages, 'collscan': 'COLLSCAN' in stages,
+        'docs_examined': examined, 'n_returned': returned, 'examined_ratio': ratio,
+    }
+
+
+class IndexAdvisor(object):
+    """Records query shapes of a document class and how they match its declared indexes.
+    With ``explain=True``, ``explain()`` is run on first sight of a query shape.
+    """
+    def __init__(self, nanomongo, explain=False):
+        self.nanomongo = nanomongo
+        self.explain = explain
+        self.entries = {}  # (spec shape, sort): report entry
+        self.lock = threading.Lock()
+
+    def indexes(self):
+        """Return declared index keys of the document class, ``_id`` index included"""
+        return class_indexes(self.nanomongo.classref())
+
+    def analyze(self, spec, sort=None):
+        """Return a report entry (without counts) for given spec and sort"""
+        sort = index_key(sort or [])
+        equality, ranges, unanalyzed = classify_spec(spec)
+        entry = {
+            'filter': dict([(f, EQUALITY) for f in equality] + [(f, RANGE) for f in ranges]),
+            'sort': sort, 'count': 0, 'explain': None,
+        }
+        if not (equality or ranges or sort):
+            entry.update(status='unfiltered', index=None,
+                         reasons=['unanalyzed operators: %s' % sorted(unanalyzed)] if unanalyzed else [])
+            return entry
+        best = None
+        for key in self.indexes():
+            status, reasons = match_index(key, equality, sort, ranges)
+            rank = (STATUSES.index(status), -len(reasons))
+            if best is None or rank > best[0]:
+                best = (rank, key, status, reasons)
+        _, key, status, reasons = best
+        if unanalyzed:
+            reasons = reasons + ['unanalyzed operators: %s' % sorted(unanalyzed)]
+        entry.update(status=status, index=key if 'collscan' != status else None, reasons=reasons)
+        return entry
+
+    def observe(self, spec, sort=None):
+        """Record a query. ``spec`` is a find filter, a non-dict is taken as an ``_id`` value"""
+        if spec is None:
+            spec = {}
+        elif not isinstance(spec, dict):
+            spec = {'_id': spec}
+        shape = (spec_shape(spec), tuple(index_key(sort)) if sort else None)
+        entry = self.entries.get(shape)
+        if entry is None:  # analyze outside the lock, explain runs a query
+            entry = self.analyze(spec, sort)
+            if self.explain:
+                entry['explain'] = self.run_explain(spec, sort)
+        with self.lock:
+            self.entries.setdefault(shape, entry)['count'] += 1
+
+    def run_explain(self, spec, sort=None):
+        """Run ``explain()`` for the query, return :func:`~explain_summary` or
+        ``{'error': ...}`` if it fails
+        """
+        try:
+            spec, sort = self.nanomongo.to_db_spec(spec), self.nanomongo.to_db_keys(sort)
+            explain = self.nanomongo.get_collection().find(spec, sort=sort).explain()
+        except pymongo.errors.PyMongoError as e:
+            return {'error': str(e)}
+        if not isinstance(explain, dict):  # eg. motor future
+            return None
+        return explain_summary(explain)
+
+    def report(self):
+        """Return report entries, worst status and most frequent first"""
+        with self.lock:
+            entries = [dict(entry) for entry in self.entries.values()]
+        return sorted(entries, key=lambda e: (STATUSES.index(e['status']), -e['count']))
+
+    def reset(self):
+        """Clear recorded query shapes"""
+        with self.lock:
+            self.entries = {}
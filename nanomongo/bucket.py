@@ -0,0 +1,158 @@
+"""
+Bucketed arrays for append-heavy item streams (comments, events, readings) that would
+otherwise grow a parent document without bound. Items are appended to bucket documents
+in a companion collection, at most ``size`` items per bucket, and the parent keeps at most
+an item count::
+
+    class Entry(BaseDocument):
+        title = Field(str)
+        comment_count = Field(int, default=0)
+        comments = Buckets(size=100, count_field='comment_count')
+
+    entry.comments.push({'text': text, 'author': user.name, 'created': datetime.utcnow()})
+    for comment in entry.comments:  # oldest first, entry.comments.items(reverse=True) for newest
+        print(comment['text'])
+    entry.comments.count()  # entry['comment_count'], no query
+
+Bucket documents look like ``{'_id': ..., 'parent': <parent _id>, 'count': 3, 'items': [...]}``
+and are stored in ``<parent collection>_<attribute name>`` unless ``collection`` is given.
+:meth:`~BucketList.push` is a single upsert, ``$push`` and ``$inc`` of ``count`` on the
+parent's bucket with room, creating a new bucket once the last one is full. Buckets are
+iterated in ``_id`` order, which is their creation order given ObjectIds generated by one
+server. :meth:`~nanomongo.document.BaseDocument.register` creates the ``(parent, _id)``
+index of the bucket collection. Items are stored as given, without validation; buckets
+are not removed along with their parent, see :meth:`~BucketList.clear`. pymongo clients only.
+"""
+import pymongo
+import six
+
+from . import metrics
+from .errors import UnsupportedOperation
+
+
+class Buckets(object):
+    """
+    Class attribute of a document class declaring a bucketed array, see
+    :mod:`~nanomongo.bucket`. On documents it gives a :class:`~BucketList`.
+
+    :Keyword Arguments:
+      - `size`: maximum items per bucket document (default: 100)
+      - `collection`: bucket collection name (default: ``<parent collection>_<attribute name>``)
+      - `count_field`: name of an ``int`` field of the parent kept at the item count, making
+        :meth:`~BucketList.count` free (default: ``None``, counts are summed from buckets)
+    """
+    def __init__(self, size=100, collection=None, count_field=None):
+        if not isinstance(size, six.integer_types) or size < 1:
+            raise TypeError('size expected to be a positive integer')
+        if collection is not None and (not collection or not isinstance(collection, six.string_types)):
+            raise TypeError('collection expected to be a non-empty string')
+        self.size = size
+        self.collection = collection
+        self.count_field = count_field
+        self.doc_class, self.name = None, None
+
+    def bind(self, doc_class, name):
+        """Called by the document class' metaclass with the attribute name"""
+        if doc_class.nanomongo.has_field(name):
+            raise TypeError('%s: Buckets attribute clashes with a field' % name)
+        if self.count_field is not None:
+            field = doc_class.nanomongo.fields.get(self.count_field)
+            if field is None or field.data_type not in six.integer_types:
+                raise TypeError('%s: count_field expected to be an int field, got %s' % (name, self.count_field))
+        self.doc_class, self.name = doc_class, name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return BucketList(self, instance)
+
+    def __set__(self, instance, value):
+        raise UnsupportedOperation('%s is bucketed, use push()' % self.name)
+
+    def get_collection(self, doc_class=None):
+        """Return the bucket collection of parent class ``doc_class`` (default: the class
+        declaring the attribute), in its database. The collection comes from a new database
+        object, bucket documents are returned as is without the parent class' SON manipulator
+        """
+        nanomongo = (doc_class or self.doc_class).nanomongo
+        nanomongo.check_config()
+        return nanomongo.client[nanomongo.database.name][self.collection or '%s_%s' % (nanomongo.collection, self.name)]
+
+    def create_indexes(self, doc_class=None):
+        """Create the ``(parent, _id)`` index, run by the parent class' ``register()``"""
+        self.get_collection(doc_class).create_index([('parent', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)])
+
+
+class BucketList(object):
+    """The bucketed array of one parent document, see :mod:`~nanomongo.bucket`"""
+    def __init__(self, buckets, parent):
+        self.buckets = buckets
+        self.parent = parent
+
+    def get_collection(self):
+        return self.buckets.get_collection(self.parent.__class__)
+
+    def parent_id(self):
+        if '_id' not in self.parent:
+            raise UnsupportedOperation('%s: parent document has no _id, insert it first' % self.buckets.name)
+        return self.parent['_id']
+
+    def push(self, item):
+        """Append ``item`` to the last bucket, starting a new bucket if it is full.
+        Increments the parent's ``count_field`` in the database and in the document
+        """
+        buckets, parent_id = self.buckets, self.parent_id()
+        doc_class = self.parent.__class__
+        with metrics.operation(doc_class, 'bucket_push', {'parent': parent_id}) as op:
+            with op.phase('driver'):
+                self.get_collection().update_one(
+                    {'parent': parent_id, 'count': {'$lt': buckets.size}},
+                    {'$push': {'items': item}, '$inc': {'count': 1}}, upsert=True)
+            if buckets.count_field is not None:
+                nanomongo = doc_class.nanomongo
+                with op.phase('driver'):
+                    doc_class.get_collection().update_one(nanomongo.to_db_spec(nanomongo.identity(self.parent)),
+                                                          {'$inc': {nanomongo.db_key(buckets.count_field): 1}})
+                # not a change to save, the database is already up to date
+                dict.__setitem__(self.parent, buckets.count_field, (self.parent.get(buckets.count_field) or 0) + 1)
+            op.result(1)
+
+    def extend(self, items):
+        """:meth:`~push` each of ``items``"""
+        for item in items:
+            self.push(item)
+
+    def items(self, reverse=False):
+        """Return a generator of the items, bucket by bucket; oldest first, newest first with
+        ``reverse=True``
+        """
+        direction = pymongo.DESCENDING if reverse else pymongo.ASCENDING
+        cursor = self.get_collection().find({'parent': self.parent_id()}, {'items': 1, '_id': 0},
+                                            sort=[('_id', direction)])
+        for bucket in cursor:
+            for item in (reversed(bucket['items']) if reverse else bucket['items']):
+                yield item
+
+    def __iter__(self):
+        return self.items()
+
+    def count(self):
+        """Return the number of items; the parent's ``count_field`` value if declared,
+        otherwise the sum of the bucket counts
+        """
+        if self.buckets.count_field is not None:
+            return self.parent.get(self.buckets.count_field) or 0
+        cursor = self.get_collection().find({'parent': self.parent_id()}, {'count': 1, '_id': 0})
+        return sum(bucket['count'] for bucket in cursor)
+
+    __len__ = count
+
+    def clear(self):
+        """Delete the buckets of the parent document and reset its ``count_field``"""
+        buckets, doc_class = self.buckets, self.parent.__class__
+        self.get_collection().delete_many({'parent': self.parent_id()})
+        if buckets.count_field is not None:
+            nanomongo = doc_class.nanomongo
+            doc_class.get_collection().update_one(nanomongo.to_db_spec(nanomongo.identity(self.parent)),
+                                                  {'$set': {nanomongo.db_key(buckets.count_field): 0}})
+            dict.__setitem__(self.parent, buckets.count_field, 0)
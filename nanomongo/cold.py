@@ -0,0 +1,94 @@
+"""
+Hot/cold field split. Values of fields declared with ``cold=True`` are stored in a companion
+collection, ``<collection>_cold``, in documents keyed by the ``_id`` of their document, so
+large, rarely read values (raw payloads, rendered HTML) are not read by ``find()`` and do not
+take room in the main collection's working set::
+
+    class Page(BaseDocument):
+        url = Field(str)
+        title = Field(str)
+        html = Field(str, cold=True)
+
+    page = Page.find_one({'url': url})  # without html
+    page['html']  # fetched now, one query for this field
+    for page in Page.find({'site': site}, cold=True):  # or cold=['html']
+        render(page['html'])  # fetched with one query per 100 documents
+    Page.load_cold(pages, 'html')  # one query for a list of documents
+
+``insert()``, ``insert_many()`` and deferred inserts write cold values to the companion
+collection after the document itself (after the documents that went in when a batch
+fails); ``save()`` splits the diff and sends cold changes as an upsert to the companion
+collection once the update matched the document. ``doc[field]`` and dot notation access
+fetch cold fields not loaded yet, ``get()`` and ``in`` do not. Read-only documents,
+projection records, aggregations and ``find_one_and_*`` results hold hot fields only. ``find_one_and_update()``
+can not write cold fields, ``find_one_and_replace()`` replaces the companion document with
+the cold values of a replacement with ``_id`` and ``find_one_and_delete()`` deletes it.
+Companion documents are not removed by other deletes. Cold fields can not have a
+default, be ``_id`` or part of the shard key or time-series options. pymongo clients only.
+"""
+import itertools
+
+from .util import TypedCursor
+
+BATCH_SIZE = 100  # documents per cold fields query of ColdCursor
+
+
+def cold_collection_name(collection):
+    return '%s_cold' % collection
+
+
+def split(cold_keys, son):
+    """Return ``(hot, cold)`` copies of database document ``son``, ``cold`` holding the values
+    of the db keys in ``cold_keys``
+    """
+    hot, cold = {}, {}
+    for key, value in son.items():
+        if key in cold_keys:
+            cold[key] = value
+        else:
+            hot[key] = value
+    return hot, cold
+
+
+def split_update(cold_keys, update):
+    """Return ``(hot, cold)`` update documents of database ``update``, split by the top-level
+    key of each updated field; empty operators are left out
+    """
+    hot, cold = {}, {}
+    for operator, fields in update.items():
+        for key, value in fields.items():
+            target = cold if key.partition('.')[0] in cold_keys else hot
+            target.setdefault(operator, {})[key] = value
+    return hot, cold
+
+
+class ColdCursor(TypedCursor):
+    """Wraps a cursor of documents and fetches their cold ``fields`` as iterated, with one
+    query per ``batch_size`` documents, see :meth:`~nanomongo.document.BaseDocument.load_cold()`
+    """
+    def __init__(self, cursor, doc_class, fields, batch_size=BATCH_SIZE):
+        super(ColdCursor, self).__init__(cursor, None)
+        self.doc_class = doc_class
+        self.fields = fields
+        self.batch_size = batch_size
+        self.loaded = iter(())
+
+    def wrap(self, cursor):
+        return self.__class__(cursor, self.doc_class, self.fields, batch_size=self.batch_size)
+
+    def decode(self, doc):
+        """Fetch the cold fields of a single document, ``cursor[index]``"""
+        self.doc_class.load_cold([doc], *self.fields)
+        return doc
+
+    def __next__(self):
+        for doc in self.loaded:
+            return doc
+        batch = list(itertools.islice(self.cursor, self.batch_size))
+        if not batch:
+            raise StopIteration
+        self.doc_class.load_cold(batch, *self.fields)
+        self.loaded = iter(batch)
+        return next(self.loaded)
+
+    next = __next__
@@ -1,17 +1,35 @@
+import datetime
 import importlib
+import logging
 import weakref
 
+import pymongo
 import six
 
-from bson import ObjectId, DBRef
+from bson import ObjectId, DBRef, SON
+from bson.codec_options import TypeRegistry
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
 
+from . import metrics, pagination
+from .advisor import IndexAdvisor
+from .bucket import Buckets
+from .cold import ColdCursor, cold_collection_name, split as split_cold, split_update as split_cold_update
 from .errors import ConfigurationError, DBRefNotSetError, ExtraFieldError, UnsupportedOperation, ValidationError
 from .field import Field
+from .fieldtypes import type_codecs
+from .materialized import MaterializedCollection
+from .projection import Projection, make_projection, split_projection
+from .serialization import JSONCodec
+from .writer import DeferredWriter
 from .util import (
-    RecordingDict, DotNotationMixin, valid_client, NanomongoSONManipulator,
-    check_spec,
+    RecordingDict, DotNotationMixin, FrozenDict, valid_client, NanomongoSONManipulator, recording,
+    freeze, thaw, restore, check_spec, check_pipeline, check_update, TypedCursor, TimedCursor,
+    CHECK_SPEC_LEVELS, COLLECTION_OPTIONS, SHAPE_PRESERVING_STAGES, make_collection_options,
 )
 
+TIMESERIES_OPTIONS = ('timeField', 'metaField', 'granularity', 'bucketMaxSpanSeconds', 'bucketRoundingSeconds',
+                      'expireAfterSeconds')
+
 
 def ref_getter_maker(field_name, document_class=None):
     """create dereference methods for given ``field_name`` to be bound
@@ -39,7 +57,11 @@ def ref_getter_maker(field_name, document_class=None):
                 raise UnsupportedOperation(err_str % (dbref, classes, field_name))
             cls = classes.pop()
         # we don't use dereference since BaseDocument.find_one handles type casting nicely
-        return cls.find_one(dbref.id)
+        with metrics.operation(cls, 'dereference', {'_id': dbref.id}) as op:
+            doc = op.defer(cls.find_one(dbref))  # targeted with the shard key values carried by the DBRef
+            if doc is None or isinstance(doc, dict):  # not a motor future
+                op.result(0 if doc is None else 1)
+            return doc
     return ref_getter
 
 
@@ -60,10 +82,58 @@ class Nanomongo(object):
         self.classref = None
         self.registered = False
         self.client, self.database, self.collection = None, None, None
+        self.collection_options = {}  # read_preference, max_staleness, read_concern, write_concern
+        self.collection_cache = {}  # options key: collection with options applied
+        self.check_spec_level = None  # use global level, see util.set_check_spec_level()
+        self.slow_threshold_ms = None  # use the slow log's threshold, see set_slow_threshold()
+        self.spec_cache = {}  # query shape: check_spec problems
+        self.checked_sorts = set()  # (query shape, sort) checked for a supporting index by paginate()
+        self.advisor = None  # opt-in, see set_index_advisor()
+        self.materialized = None  # opt-in, see materialize()
+        self.writer = None  # DeferredWriter, see BaseDocument.writer()
+        self.read_only_class = None  # created on first use, see read_only_view()
+        self.json_codecs = {}  # mode: JSONCodec, created on first use, see json_codec()
         self.transforms = {}  # save auto_update fields so we don't keep looping
+        self.aliases = {}  # field name: db_field, only for fields with a db_field
+        self.shard_key = []  # [(field name, 1 or 'hashed')], see set_shard_key()
+        self.timeseries = None  # time-series collection options, see set_timeseries()
+        self.capped = None  # capped collection options, see set_capped()
+        self.buckets = {}  # attribute name: Buckets, see nanomongo.bucket
+        self.cold_fields = set()  # names of fields stored in the companion collection, see nanomongo.cold
+        # document construction templates, see BaseDocument.__init__()
+        self.defaults = {}  # field name: non-callable default value
+        self.default_factories = []  # (field name, callable returning the default value)
         for field_name, field in self.fields.items():
             if hasattr(field, 'auto_update'):
                 self.transforms[field_name] = field.auto_update
+            if hasattr(field, 'db_field') and field.db_field != field_name:
+                self.aliases[field_name] = field.db_field
+            if hasattr(field, 'cold'):
+                self.cold_fields.add(field_name)
+            if hasattr(field, 'default_copier'):  # returns RecordingDict for dicts
+                self.default_factories.append((field_name, field.default_copier))
+            elif hasattr(field, 'default_value') and callable(field.default_value):
+                self.default_factories.append((field_name, lambda factory=field.default_value: recording(factory())))
+            elif hasattr(field, 'default_value'):
+                self.defaults[field_name] = field.default_value
+        self.db_fields = dict((db_field, field_name) for field_name, db_field in self.aliases.items())
+        self.cold_db_keys = set(self.aliases.get(field_name, field_name) for field_name in self.cold_fields)
+        if '_id' in self.cold_fields:
+            raise TypeError('_id can not be a cold field')
+        # field name: EmbeddedDocument subclass
+        self.embedded_fields = dict((field_name, field.data_type) for field_name, field in self.fields.items()
+                                    if getattr(field.data_type, '__nanoembedded__', False))
+        field_types = dict((field_name, field.field_type) for field_name, field in self.fields.items()
+                           if hasattr(field, 'field_type'))
+        self.type_codecs = type_codecs(set(field_types.values()))  # for the collections' TypeRegistry
+        # field name: FieldType for types decoded after the BSON layer
+        self.field_decoders = dict((field_name, field_type) for field_name, field_type in field_types.items()
+                                   if not field_type.decode_in_bson)
+        if '_id' in self.aliases or len(self.db_fields) != len(self.aliases):
+            raise TypeError('db_field can not be set on _id or used twice: %s' % self.aliases)
+        clashes = set(self.db_fields) & (set(self.fields) - set(self.aliases))
+        if clashes:
+            raise TypeError('db_field values clash with field names: %s' % sorted(clashes))
 
     @classmethod
     def from_dicts(cls, *args):
@@ -91,11 +161,428 @@ class Nanomongo(object):
         """Validate field input"""
         return self.fields[field_name].validator(value, field_name=field_name)
 
+    def db_key(self, key):
+        """Return ``key`` (may be dotted) with its top-level field name replaced by its db_field"""
+        top_level, dot, rest = key.partition('.')
+        if top_level in self.aliases:
+            return self.aliases[top_level] + dot + rest
+        return key
+
+    def set_shard_key(self, shard_key):
+        """Set the shard key of the collection, a list of top-level field names or
+        ``(field name, 1 or 'hashed')`` pairs, declared as ``__shard_key__``; cold and
+        ``auto_update`` fields can not be part of it
+        """
+        if not isinstance(shard_key, (list, tuple)) or not shard_key:
+            raise TypeError('__shard_key__: non-empty list of field names or (field name, direction) pairs expected')
+        normalized = []
+        for item in shard_key:
+            field_name, direction = (item, 1) if isinstance(item, six.string_types) else tuple(item)
+            if not self.has_field(field_name) or direction not in (1, 'hashed'):
+                raise TypeError('__shard_key__: %s is not a (field, 1 or "hashed") of %s' % (item, self.list_fields()))
+            if field_name in self.cold_fields:
+                raise TypeError('__shard_key__: %s is a cold field' % field_name)
+            if field_name in self.transforms:
+                # shard key values are immutable, save() would set a new value each time
+                raise TypeError('__shard_key__: %s is an auto_update field' % field_name)
+            normalized.append((field_name, direction))
+        if len(set(field_name for field_name, _ in normalized)) != len(normalized):
+            raise TypeError('__shard_key__: repeated field in %s' % (shard_key,))
+        self.shard_key = normalized
+
+    def shard_values(self, doc):
+        """Return ``{field name: value}`` of the shard key fields other than ``_id`` of ``doc``,
+        raise :class:`~nanomongo.errors.ValidationError` if a field is missing
+        """
+        values = {}
+        for field_name, _ in self.shard_key:
+            if field_name == '_id':
+                continue
+            if field_name not in doc:
+                raise ValidationError('shard key field "%s" missing, can not target %s' % (field_name, self.classref()))
+            values[field_name] = doc[field_name]
+        return values
+
+    def identity(self, doc_or_dbref):
+        """Return the query matching exactly the given document: ``_id`` and the shard key
+        values. Shard key values are taken from the extra fields of a ``DBRef`` when present,
+        refs without them give an ``_id`` only query
+        """
+        if isinstance(doc_or_dbref, DBRef):
+            query = {'_id': doc_or_dbref.id}
+            extras = doc_or_dbref.as_doc()
+            query.update((field_name, extras[field_name]) for field_name, _ in self.shard_key if field_name in extras)
+            return query
+        query = {'_id': doc_or_dbref['_id']}
+        if self.shard_key:
+            query.update(self.shard_values(doc_or_dbref))
+        return query
+
+    def check_shard_key_update(self, update):
+        """Raise :class:`~nanomongo.errors.ValidationError` if ``update`` operators change a
+        shard key field
+        """
+        for operator, fields in update.items():
+            for key in fields:
+                top_level = key.partition('.')[0]
+                if any(top_level == field_name for field_name, _ in self.shard_key):
+                    raise ValidationError('shard key field "%s" can not be changed: %s' % (top_level, {operator: fields}))
+
+    def check_shard_key(self):
+        """Raise :class:`~nanomongo.errors.ConfigurationError` unless the collection is sharded
+        on the declared shard key, as recorded in the cluster's ``config.collections``
+        """
+        namespace = '%s.%s' % (self.database.name, self.collection)
+        sharded = self.client['config']['collections'].find_one({'_id': namespace, 'dropped': {'$ne': True}})
+        declared = [(self.db_key(field_name), direction) for field_name, direction in self.shard_key]
+        if sharded is None:
+            raise ConfigurationError('%s is not sharded, declared shard key %s' % (namespace, declared))
+        if list(sharded['key'].items()) != declared:
+            raise ConfigurationError('%s is sharded on %s, declared shard key %s' % (namespace, sharded['key'], declared))
+
+    def set_timeseries(self, timeseries):
+        """Set the time-series options of the collection, declared as ``__timeseries__``:
+        ``timeField`` (a ``datetime`` field), optional ``metaField``, ``granularity``,
+        ``bucketMaxSpanSeconds``, ``bucketRoundingSeconds`` and ``expireAfterSeconds``.
+        Field names are translated to their db_field names on creation
+        """
+        if not isinstance(timeseries, dict) or 'timeField' not in timeseries:
+            raise TypeError('__timeseries__: dict with a timeField expected')
+        if self.capped is not None:
+            raise TypeError('__timeseries__: time-series collections can not be capped')
+        unknown = set(timeseries) - set(TIMESERIES_OPTIONS)
+        if unknown:
+            raise TypeError('__timeseries__: unknown options %s, expected %s' % (sorted(unknown), TIMESERIES_OPTIONS))
+        time_field, meta_field = timeseries['timeField'], timeseries.get('metaField')
+        if not self.has_field(time_field) or self.fields[time_field].data_type is not datetime.datetime:
+            raise TypeError('__timeseries__: timeField expected to be a datetime field, got %s' % time_field)
+        if meta_field is not None and (not self.has_field(meta_field) or meta_field in ('_id', time_field)):
+            raise TypeError('__timeseries__: metaField expected to be a field other than _id and timeField')
+        if set([time_field, meta_field]) & self.cold_fields:
+            raise TypeError('__timeseries__: timeField and metaField can not be cold fields')
+        if timeseries.get('granularity', 'seconds') not in ('seconds', 'minutes', 'hours'):
+            raise TypeError('__timeseries__: granularity expected one of seconds, minutes, hours')
+        for option in ('bucketMaxSpanSeconds', 'bucketRoundingSeconds', 'expireAfterSeconds'):
+            value = timeseries.get(option, 1)
+            if not isinstance(value, six.integer_types) or isinstance(value, bool) or value < 1:
+                raise TypeError('__timeseries__: %s expected to be a positive integer' % option)
+        self.timeseries = dict(timeseries)
+
+    def set_capped(self, capped):
+        """Set the capped collection options, declared as ``__capped__``: ``size`` in bytes
+        and optionally ``max`` documents
+        """
+        if not isinstance(capped, dict) or 'size' not in capped or set(capped) - set(['size', 'max']):
+            raise TypeError('__capped__: dict with size and optionally max expected')
+        if self.timeseries is not None:
+            raise TypeError('__capped__: time-series collections can not be capped')
+        for option, value in capped.items():
+            if not isinstance(value, six.integer_types) or isinstance(value, bool) or value < 1:
+                raise TypeError('__capped__: %s expected to be a positive integer' % option)
+        self.capped = dict(capped)
+
+    def create_options(self):
+        """Return the ``create`` command options of the declared time-series or capped
+        collection, an empty ``dict`` if there are none
+        """
+        if self.capped is not None:
+            return dict(self.capped, capped=True)
+        if self.timeseries is None:
+            return {}
+        timeseries = dict(self.timeseries)
+        options = {}
+        if 'expireAfterSeconds' in timeseries:
+            options['expireAfterSeconds'] = timeseries.pop('expireAfterSeconds')
+        for key in ('timeField', 'metaField'):
+            if key in timeseries:
+                timeseries[key] = self.db_key(timeseries[key])
+        options['timeseries'] = timeseries
+        return options
+
+    def create_collection(self):
+        """Create the collection with the options of :meth:`~create_options()` unless it
+        exists. Returns ``True`` if it was created; raises
+        :class:`~nanomongo.errors.ConfigurationError` if it exists but is not a time-series
+        (or capped) collection as declared. pymongo clients only; with motor clients a warning
+        is logged and the collection is left to be created by other means
+        """
+        options = self.create_options()
+        if not options:
+            return False
+        cursor = self.database.list_collections(filter={'name': self.collection})
+        if hasattr(cursor, '__aiter__'):  # motor
+            logging.warning('%s: collection options are not applied with motor clients, create %s with pymongo',
+                            self.classref(), self.collection)
+            return False
+        info = next(iter(cursor), None)
+        if info is None:
+            try:
+                self.database.create_collection(self.collection, **options)
+                return True
+            except CollectionInvalid:  # created concurrently
+                return False
+        existing = info.get('options', {})
+        if 'capped' in options and not existing.get('capped'):
+            raise ConfigurationError('%s exists and is not capped' % self.collection)
+        if 'timeseries' in options and \
+                existing.get('timeseries', {}).get('timeField') != options['timeseries']['timeField']:
+            raise ConfigurationError('%s exists and is not a time-series collection on %s' % (
+                self.collection, options['timeseries']['timeField']))
+        return False
+
+    def order_batch(self, docs):
+        """Return documents of an ``insert_many`` batch in insert order; for time-series
+        collections grouped by ``metaField`` value (in order of first appearance) and sorted by
+        ``timeField`` within groups, so that consecutive documents land in the same buckets
+        """
+        if self.timeseries is None or len(docs) < 2:
+            return docs
+        time_field, meta_field = self.timeseries['timeField'], self.timeseries.get('metaField')
+        groups = {}  # meta value key: [(time, position, doc)]
+        for position, doc in enumerate(docs):
+            meta = doc.get(meta_field) if meta_field is not None else None
+            try:
+                hash(meta)
+                key = meta
+            except TypeError:  # dict meta values
+                key = repr(meta)
+            groups.setdefault(key, []).append((doc.get(time_field), position, doc))
+        ordered = []
+        for group in sorted(groups.values(), key=lambda group: group[0][1]):
+            try:
+                group.sort(key=lambda item: item[:2])
+            except TypeError:  # missing or mixed naive and aware times, left as they are
+                pass
+            ordered.extend(doc for _, _, doc in group)
+        return ordered
+
+    def insert_batch(self, docs, op, ordered=None, **kwargs):
+        """Insert validated documents ``docs`` with one ``insert_many`` in the order of
+        :meth:`~order_batch()`, timed by metrics operation ``op``. ``ordered`` defaults to
+        ``False`` for time-series collections, ``True`` otherwise as in pymongo. ``inserted_ids``
+        of the result follow the order of ``docs``
+        """
+        if ordered is None:
+            ordered = self.timeseries is None
+        given = docs
+        docs = self.order_batch(docs)
+        for doc in docs:
+            self.set_id(doc)
+        to_insert, cold = [self.to_db(doc) for doc in docs], None
+        if self.cold_fields and to_insert:
+            to_insert, cold = zip(*[split_cold(self.cold_db_keys, son) for son in to_insert])
+        try:
+            with op.phase('driver'):
+                insert_many_result = op.defer(self.get_collection().insert_many(to_insert, ordered=ordered, **kwargs))
+        except BulkWriteError as error:
+            # the documents that went in still get their cold values and are marked inserted
+            failed = sorted(write_error['index'] for write_error in error.details.get('writeErrors', ()))
+            if ordered and failed:
+                inserted = list(range(failed[0]))
+            else:
+                inserted = [position for position in range(len(docs)) if position not in set(failed)]
+            self.batch_inserted(docs, to_insert, cold, inserted, op)
+            op.result(len(inserted))
+            raise
+        self.batch_inserted(docs, to_insert, cold, range(len(docs)), op)
+        op.result(len(docs))
+        if docs is not given and hasattr(insert_many_result, 'inserted_ids'):  # not a motor future
+            insert_many_result = insert_many_result.__class__([doc['_id'] for doc in given],
+                                                              insert_many_result.acknowledged)
+        return insert_many_result
+
+    def batch_inserted(self, docs, to_insert, cold, positions, op):
+        """Insert the cold values of the documents of an :meth:`~insert_batch()` batch at
+        ``positions``, which went in, and reset their diffs
+        """
+        if cold:
+            cold_docs = [dict(cold[i], _id=to_insert[i]['_id']) for i in positions if cold[i]]
+            if cold_docs:
+                with op.phase('driver'):
+                    self.cold_collection().insert_many(cold_docs, ordered=False)
+        for i in positions:
+            docs[i].reset_diff()
+            if self.cold_fields:
+                docs[i].__dict__['_nanocold'] = set(self.cold_fields)
+
+    def set_id(self, doc):
+        """Set a new ``ObjectId`` as ``_id`` of ``doc`` if it has none, as the driver would on
+        insert; done before copying ``doc`` for the database so that both share it, motor
+        assigns it later on its executor thread
+        """
+        if '_id' not in doc:
+            dict.__setitem__(doc, '_id', ObjectId())
+
+    def to_db(self, doc):
+        """Return a ``dict`` copy of ``doc`` with db_field keys, ``doc`` itself if no field
+        has a db_field
+        """
+        if not self.aliases:
+            return doc
+        return dict((self.aliases.get(k, k), v) for k, v in doc.items())
+
+    def cold_collection(self):
+        """Return the companion collection of cold fields, with the collection's options,
+        see :mod:`~nanomongo.cold`
+        """
+        key = ('cold', self.collection)
+        if key not in self.collection_cache:
+            collection = self.get_collection()
+            # a new database object, without the SON manipulator of register()
+            self.collection_cache[key] = self.client[self.database.name].get_collection(
+                cold_collection_name(self.collection), codec_options=collection.codec_options,
+                read_preference=collection.read_preference, write_concern=collection.write_concern,
+                read_concern=collection.read_concern)
+        return self.collection_cache[key]
+
+    def check_not_cold(self, field_names):
+        """Raise :class:`~nanomongo.errors.UnsupportedOperation` if any of ``field_names``
+        is a cold field, for operations on the main collection only
+        """
+        cold = self.cold_fields.intersection(field_names)
+        if cold:
+            raise UnsupportedOperation('cold fields %s can not be written with this operation, use save()' % (
+                ', '.join(sorted(cold))))
+
+    def cold_field_names(self, cold):
+        """Return the cold field names of a ``cold`` argument: ``True`` for all cold fields,
+        a list of cold field names, or ``False``/``None`` for none
+        """
+        if cold is True:
+            return sorted(self.cold_fields)
+        if not cold:
+            return []
+        if not isinstance(cold, (list, tuple)) or not set(cold) <= self.cold_fields:
+            raise TypeError('cold expected to be True or a list of cold fields of %s, got %s' % (
+                sorted(self.cold_fields), cold))
+        return list(cold)
+
+    def from_db(self, son):
+        """Rename db_field keys of a document from the database to field names and decode
+        field types not decoded by the BSON layer, in place
+        """
+        for db_field, field_name in self.db_fields.items():
+            if db_field in son:
+                son[field_name] = son.pop(db_field)
+        for field_name, field_type in self.field_decoders.items():
+            value = son.get(field_name)
+            if value is not None and not isinstance(value, field_type.python_type):
+                son[field_name] = field_type.transform_bson(value)
+        return son
+
+    def read_only_view(self):
+        """Return the read-only view class of the document class, see :class:`~ReadOnlyDocument`"""
+        if self.read_only_class is None:
+            self.read_only_class = make_read_only_class(self.classref())
+        return self.read_only_class
+
+    def read_only_document(self, son):
+        """Return a raw document from the database as a read-only document, without
+        validation or change tracking
+        """
+        doc = self.read_only_view()(self.from_db(son))
+        metrics.documents_decoded(self.classref())
+        return doc
+
+    def json_codec(self, mode='relaxed'):
+        """Return the :class:`~nanomongo.serialization.JSONCodec` of the document class for
+        Extended JSON ``mode``, ``'relaxed'`` or ``'canonical'``
+        """
+        codec = self.json_codecs.get(mode)
+        if codec is None:
+            codec = self.json_codecs[mode] = JSONCodec(self, mode=mode)
+        return codec
+
+    def codec_options(self):
+        """Return the database's codec options with a ``TypeRegistry`` of the field types
+        used by this class, ``None`` if it uses none
+        """
+        if not self.type_codecs:
+            return None
+        return self.database.codec_options.with_options(type_registry=TypeRegistry(self.type_codecs))
+
+    def to_db_spec(self, spec):
+        """Return a query spec with db_field keys, also under ``$and``, ``$or`` and ``$nor``"""
+        if not self.aliases or not isinstance(spec, dict):
+            return spec
+        db_spec = {}
+        for key, query in spec.items():
+            if key in ('$and', '$or', '$nor') and isinstance(query, list):
+                db_spec[key] = [self.to_db_spec(sub_spec) for sub_spec in query]
+            else:
+                db_spec[self.db_key(key)] = query
+        return db_spec
+
+    def to_db_keys(self, keys):
+        """Return a sort or projection (key, ``(key, value)`` list or dict) with db_field keys"""
+        if not self.aliases or keys is None:
+            return keys
+        elif isinstance(keys, six.string_types):
+            return self.db_key(keys)
+        elif isinstance(keys, dict):
+            return dict((self.db_key(k), v) for k, v in keys.items())
+        return [(self.db_key(k[0]),) + tuple(k[1:]) if isinstance(k, (list, tuple)) else self.db_key(k)
+                for k in keys]
+
+    def to_db_update(self, update):
+        """Return update operators with db_field keys"""
+        if not self.aliases:
+            return update
+        return dict((operator, dict((self.db_key(k), v) for k, v in fields.items()))
+                    for operator, fields in update.items())
+
+    def to_db_find_args(self, args, kwargs):
+        """Return ``(args, kwargs)`` of a ``find`` call with spec, projection and sort keys
+        translated to db_field names
+        """
+        if not self.aliases:
+            return args, kwargs
+        args = list(args)
+        if args:
+            args[0] = self.to_db_spec(args[0])
+        if len(args) > 1:
+            args[1] = self.to_db_keys(args[1])
+        for key, translate in (('filter', self.to_db_spec), ('projection', self.to_db_keys),
+                               ('sort', self.to_db_keys)):
+            if key in kwargs:
+                kwargs[key] = translate(kwargs[key])
+        return tuple(args), kwargs
+
+    def to_db_pipeline(self, pipeline):
+        """Return an aggregation pipeline with db_field keys in its leading ``$match`` and
+        ``$sort`` stages, up to the first stage that may reshape documents. Later stages
+        must use db_field names
+        """
+        if not self.aliases:
+            return pipeline
+        db_pipeline = list(pipeline)
+        for i, stage in enumerate(db_pipeline):
+            operator, value = next(iter(stage.items()))
+            if operator not in SHAPE_PRESERVING_STAGES:
+                break
+            elif '$match' == operator:
+                db_pipeline[i] = {operator: self.to_db_spec(value)}
+            elif '$sort' == operator:
+                db_pipeline[i] = {operator: SON(self.to_db_keys(list(value.items())))}
+        return db_pipeline
+
+    def to_db_indexes(self, indexes):
+        """Return ``pymongo.IndexModel`` list with db_field keys. Index names are kept"""
+        if not self.aliases:
+            return indexes
+        db_indexes = []
+        for index in indexes:
+            options = dict(index.document)
+            keys = self.to_db_keys(list(options.pop('key').items()))
+            db_indexes.append(pymongo.IndexModel(keys, **options))
+        return db_indexes
+
     def set_client(self, client):
         """Set client, a Client from pymongo or motor expected"""
         if not valid_client(client):
             raise TypeError('pymongo or motor Client expected')
         self.client = client
+        self.collection_cache = {}
 
     def set_db(self, db_string):
         """Set database, string expected"""
@@ -104,12 +591,65 @@ class Nanomongo(object):
         if not self.client:
             raise ConfigurationError('Mongo client not set')
         self.database = self.client[db_string]
+        self.collection_cache = {}
 
     def set_collection(self, col_string):
         """Set collection, string expected"""
         if not col_string or not isinstance(col_string, six.string_types):
             raise TypeError('Expected collection string')
         self.collection = col_string
+        self.collection_cache = {}
+
+    def set_collection_options(self, **options):
+        """Set default collection options for this document class; ``read_preference``,
+        ``max_staleness``, ``read_concern`` and ``write_concern``. See
+        :func:`~nanomongo.util.make_collection_options` for accepted values
+        """
+        options = dict((k, v) for k, v in options.items() if v is not None)
+        make_collection_options(**options)  # validate
+        self.collection_options = options
+        self.collection_cache = {}
+
+    def set_check_spec_level(self, level):
+        """Set :func:`~nanomongo.util.check_spec` level for this document class, one of
+        ``off``, ``sampled``, ``warn_once``, ``warn``, ``strict`` or ``None`` to use the
+        global level. See :func:`~nanomongo.util.set_check_spec_level`
+        """
+        if level is not None and level not in CHECK_SPEC_LEVELS:
+            raise TypeError('check_spec level expected one of %s' % (CHECK_SPEC_LEVELS,))
+        self.check_spec_level = level
+
+    def set_slow_threshold(self, threshold_ms):
+        """Set the :mod:`~nanomongo.slowlog` threshold in milliseconds for this document class,
+        ``None`` to use the slow log's threshold
+        """
+        if threshold_ms is not None and (not isinstance(threshold_ms, (int, float)) or threshold_ms < 0):
+            raise TypeError('threshold_ms expected to be a non-negative number or None')
+        self.slow_threshold_ms = threshold_ms
+
+    def set_index_advisor(self, enabled=True, explain=False):
+        """Enable (or disable) the :class:`~nanomongo.advisor.IndexAdvisor` for this
+        document class. With ``explain=True``, ``explain()`` is run on first sight of
+        each query shape. Report is available at ``.advisor.report()``
+        """
+        self.advisor = IndexAdvisor(self, explain=explain) if enabled else None
+
+    def materialize(self, enabled=True, refresh='poll', interval=60):
+        """Keep an in-memory copy of the collection to answer supported ``find`` and
+        ``find_one`` queries locally, see :class:`~nanomongo.materialized.MaterializedCollection`.
+
+        :Keyword Arguments:
+          - `refresh`: ``'poll'`` to reload every ``interval`` seconds, ``'change_stream'``
+            to follow a change stream (replica set required) or ``None`` to only load once
+          - `interval`: seconds between polls, or between change stream reconnects
+        """
+        if self.materialized is not None:
+            self.materialized.stop()
+            self.materialized = None
+        if enabled:
+            materialized = MaterializedCollection(self, refresh=refresh, interval=interval)
+            materialized.start()
+            self.materialized = materialized
 
     def check_config(self):
         """Check if client, database and collection attributes are set"""
@@ -138,28 +678,49 @@ class Nanomongo(object):
         manipulator = NanomongoSONManipulator(self.classref(), transforms=transforms)
         self.database.add_son_manipulator(manipulator)
 
-    def register(self, client=None, db_string=None, collection=None):
+    def register(self, client=None, db_string=None, collection=None, check_shard_key=False, **options):
         """register the class. this is called from defined documents'
         :meth:`~BaseDocument.register()` method. Note that this also
-        runs :meth:`~pymongo.collection.Collection.create_indexes()`
+        runs :meth:`~pymongo.collection.Collection.create_indexes()`, after creating declared
+        time-series or capped collections (see :meth:`~create_collection()`). With
+        ``check_shard_key=True`` the declared shard key is checked, see :meth:`~check_shard_key()`
         """
         self.set_client(client) if client else None
         self.set_db(db_string) if db_string else None
         self.set_collection(collection) if collection else None
+        self.set_collection_options(**options) if options else None
         self.check_config()
+        if check_shard_key:
+            self.check_shard_key()
         self.add_son_manipulator()
+        self.create_collection()
         # indexes
         doc_class = self.classref()
         indexes = doc_class.__indexes__ if hasattr(doc_class, '__indexes__') else []
         if indexes:
-            self.get_collection().create_indexes(indexes)
+            self.get_collection().create_indexes(self.to_db_indexes(indexes))
+        for buckets in self.buckets.values():
+            buckets.create_indexes(doc_class)
         # mark as registered
         self.registered = True
 
-    def get_collection(self):
-        """Returns collection"""
+    def get_collection(self, **options):
+        """Returns collection, with the class' collection options and given overrides
+        applied through ``with_options()``. Collections are cached per option combination
+        """
         self.check_config()
-        return self.database[self.collection]
+        if not options and not self.collection_options and not self.type_codecs:
+            return self.database[self.collection]
+        merged = dict(self.collection_options)
+        merged.update((k, v) for k, v in options.items() if v is not None)
+        key = (self.collection,) + tuple(sorted((k, repr(getattr(v, 'document', v))) for k, v in merged.items()))
+        if key not in self.collection_cache:
+            collection = self.database[self.collection]
+            if merged or self.type_codecs:
+                collection = collection.with_options(codec_options=self.codec_options(),
+                                                     **make_collection_options(**merged))
+            self.collection_cache[key] = collection
+        return self.collection_cache[key]
 
 
 class DocumentMeta(type):
@@ -174,6 +735,11 @@ class DocumentMeta(type):
             raise TypeError('field name "nanomongo" is not allowed')
         if '__indexes__' in dct and not isinstance(dct['__indexes__'], list):
             raise TypeError('__indexes__: list of Index instances expected')
+        if '__shard_key__' in dct and not isinstance(dct['__shard_key__'], (list, tuple)):
+            raise TypeError('__shard_key__: list of field names or (field name, direction) pairs expected')
+        for attr in ('__timeseries__', '__capped__'):
+            if attr in dct and not isinstance(dct[attr], dict):
+                raise TypeError('%s: dict of collection options expected' % attr)
         use_dot_notation = kwargs.pop('dot_notation') if 'dot_notation' in kwargs else None
         if 'dot_notation' in dct:
             use_dot_notation = dct.pop('dot_notation')
@@ -196,6 +762,24 @@ class DocumentMeta(type):
         for field_name, field_value in dct.items():
             if isinstance(field_value, Field):
                 delattr(cls, field_name)
+        # get_<field_name>_field methods for DBRef fields
+        for field_name, field in cls.nanomongo.fields.items():
+            if field.data_type in [DBRef] + DBRef.__subclasses__():
+                doc_class = field.document_class if hasattr(field, 'document_class') else None
+                setattr(cls, 'get_%s_field' % field_name, ref_getter_maker(field_name, document_class=doc_class))
+        if hasattr(cls, '__shard_key__'):
+            cls.nanomongo.set_shard_key(cls.__shard_key__)
+        for base in bases:
+            if hasattr(base, 'nanomongo'):
+                cls.nanomongo.buckets.update(base.nanomongo.buckets)
+        for attr_name, value in dct.items():
+            if isinstance(value, Buckets):
+                value.bind(cls, attr_name)
+                cls.nanomongo.buckets[attr_name] = value
+        if hasattr(cls, '__timeseries__'):
+            cls.nanomongo.set_timeseries(cls.__timeseries__)
+        if hasattr(cls, '__capped__'):
+            cls.nanomongo.set_capped(cls.__capped__)
         # client, database, collection
         cls.nanomongo.classref = weakref.ref(cls)
 
@@ -211,6 +795,11 @@ class DocumentMeta(type):
             delattr(cls, arg)
             return retval
 
+        if _check_arg('check_spec_level'):
+            cls.nanomongo.set_check_spec_level(_get_arg('check_spec_level'))
+        options = dict((arg, _get_arg(arg)) for arg in COLLECTION_OPTIONS if _check_arg(arg))
+        if options:
+            cls.nanomongo.set_collection_options(**options)
         if _check_arg('client'):
             cls.nanomongo.set_client(_get_arg('client'))
         if _check_arg('db'):
@@ -246,11 +835,18 @@ class DocumentMeta(type):
                 yield child_base
 
 
+class ReadOnlyView(object):
+    """Descriptor for ``Doc.read_only``, the read-only view class of a document class"""
+    def __get__(self, instance, owner):
+        return owner.nanomongo.read_only_view()
+
+
 @six.add_metaclass(DocumentMeta)
 class BaseDocument(RecordingDict):
     """BaseDocument class. Subclasses should be used. See
     :meth:`~BaseDocument.__init__()`
     """
+    read_only = ReadOnlyView()  # read-only view class, see ReadOnlyDocument
 
     def __init__(self, *args, **kwargs):
         """Inits the document with given data and validates the fields
@@ -275,57 +871,388 @@ class BaseDocument(RecordingDict):
                 if field_name not in kwargs:
                     kwargs[field_name] = field_value
         super(BaseDocument, self).__init__()
-        for field_name, field in self.nanomongo.fields.items():
-            if hasattr(field, 'default_value'):
-                val = field.default_value
-                dict.__setitem__(self, field_name, val() if callable(val) else val)
-            # attach get_<field_name>_field methods for DBRef fields
-            if field.data_type in [DBRef] + DBRef.__subclasses__():
-                getter_name = 'get_%s_field' % field_name
-                doc_class = field.document_class if hasattr(field, 'document_class') else None
-                getter = ref_getter_maker(field_name, document_class=doc_class)
-                setattr(self, getter_name, six.create_bound_method(getter, self))
-        for field_name in kwargs:
-            if self.nanomongo.has_field(field_name):
-                self.nanomongo.validate(field_name, kwargs[field_name])
-                dict.__setitem__(self, field_name, kwargs[field_name])
+        nanomongo = self.nanomongo
+        # defaults from the per-class templates, dict defaults are created as RecordingDict
+        dict.update(self, nanomongo.defaults)
+        for field_name, factory in nanomongo.default_factories:
+            if field_name not in kwargs:
+                dict.__setitem__(self, field_name, factory())
+        fields, embedded_fields = nanomongo.fields, nanomongo.embedded_fields
+        for field_name, field_value in kwargs.items():
+            if field_name in embedded_fields:
+                # validated like other fields once cast, then cached until changed, see EmbeddedDocument
+                field_value = embedded(embedded_fields[field_name], field_value)
+                fields[field_name].validator(field_value, field_name=field_name)
+                dict.__setitem__(self, field_name, field_value)
+            elif field_name in fields:
+                fields[field_name].validator(field_value, field_name=field_name)
+                # transform dict to RecordingDict so we can track diff in embedded docs
+                dict.__setitem__(self, field_name, recording(field_value))
             else:
-                raise ExtraFieldError('Undefined field %s=%s in %s' %
-                                      (field_name, kwargs[field_name], self.__class__))
-        for field_name, field_value in self.items():
-            # transform dict to RecordingDict so we can track diff in embedded docs
-            if isinstance(field_value, dict):
-                dict.__setitem__(self, field_name, RecordingDict(field_value))
+                raise ExtraFieldError('Undefined field %s=%s in %s' % (field_name, field_value, self.__class__))
 
     @classmethod
-    def register(cls, client=None, db=None, collection=None):
+    def register(cls, client=None, db=None, collection=None, check_shard_key=False, **options):
         """Register this document. Sets client, database, collection
-        information, creates indexes and sets SON manipulator
+        information, creates indexes and sets SON manipulator. Collection options
+        ``read_preference``, ``max_staleness``, ``read_concern`` and ``write_concern``
+        can also be given, see :meth:`~Nanomongo.set_collection_options()`. With
+        ``check_shard_key=True`` raises :class:`~nanomongo.errors.ConfigurationError` unless
+        the collection is sharded on ``__shard_key__``
         """
         if cls.nanomongo.registered:
             err_str = '''%s is already registered. This is automatic if you have defined
 your document class with client, db, collection.''' % cls
             raise ConfigurationError(err_str)
-        cls.nanomongo.register(client=client, db_string=db, collection=collection)
+        cls.nanomongo.register(client=client, db_string=db, collection=collection, check_shard_key=check_shard_key,
+                               **options)
 
     @classmethod
-    def get_collection(cls):
-        """Returns collection as set in :attr:`~cls.nanomongo`"""
-        return cls.nanomongo.get_collection()
+    def get_collection(cls, **options):
+        """Returns collection as set in :attr:`~cls.nanomongo`, optionally with collection
+        option overrides such as ``read_preference='secondary'``
+        """
+        return cls.nanomongo.get_collection(**options)
+
+    @classmethod
+    def writer(cls, **options):
+        """Return the :class:`~nanomongo.writer.DeferredWriter` of this document class used by
+        ``insert(deferred=True)``. Given options (``batch_size``, ``flush_interval``, ``max_queue``,
+        ``on_error``, ``ordered``) replace the current writer, which is flushed and closed
+        """
+        if options or cls.nanomongo.writer is None or cls.nanomongo.writer.closed:
+            if cls.nanomongo.writer is not None:
+                cls.nanomongo.writer.close()
+            cls.nanomongo.writer = DeferredWriter(cls, **options)
+        return cls.nanomongo.writer
+
+    @classmethod
+    def insert_many(cls, documents, ordered=None, **kwargs):
+        """
+        Runs auto updates and validates ``documents`` of this class, then inserts them with a
+        single ``insert_many``. Returns ``pymongo.results.InsertManyResult``.
+
+        ``ordered`` defaults to ``True`` as in pymongo, ``False`` for time-series collections,
+        whose documents are inserted grouped by ``metaField`` and sorted by ``timeField``
+        (see :meth:`~Nanomongo.order_batch()`); ``inserted_ids`` follow the order of ``documents``
+        """
+        documents = list(documents)
+        with metrics.operation(cls, 'insert_many') as op:
+            for doc in documents:
+                if not isinstance(doc, cls):
+                    raise TypeError('%s instance expected, got %s' % (cls, type(doc)))
+                with op.phase('run_auto_updates'):
+                    doc.run_auto_updates()
+                with op.phase('validate_all'):
+                    doc.validate_all()
+                doc.validate()
+            return cls.nanomongo.insert_batch(documents, op, ordered=ordered, **kwargs)
 
     @classmethod
     def find(cls, *args, **kwargs):
-        """``pymongo.Collection().find`` wrapper for this document"""
+        """``pymongo.Collection().find`` wrapper for this document. Also accepts
+        ``read_preference``, ``max_staleness``, ``read_concern`` and ``write_concern``
+        keyword arguments to override the class' collection options.
+
+        With ``read_only=True`` documents are returned as instances of :attr:`~read_only`,
+        without validation or change tracking, see :class:`~ReadOnlyDocument`. A projection
+        class (see :meth:`~projection()`) given as ``projection`` returns its records.
+        ``cold=True`` (or a list of cold fields) fetches cold fields per batch of documents as
+        the cursor is iterated, see :mod:`~nanomongo.cold`
+
+        Returns a :class:`~nanomongo.util.TimedCursor` wrapping the driver's cursor, motor
+        cursors are returned as they are
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        read_only = kwargs.pop('read_only', False)
+        cold = cls.nanomongo.cold_field_names(kwargs.pop('cold', None))
         if args and isinstance(args[0], dict):
             check_spec(cls, args[0])
-        return cls.get_collection().find(*args, **kwargs)
+        if cls.nanomongo.advisor is not None:
+            cls.nanomongo.advisor.observe(args[0] if args else None, kwargs.get('sort'))
+        spec = args[0] if args else None
+        args, kwargs, cast = cls.find_cast(args, kwargs, read_only)
+        if cold and cast is not None:
+            raise TypeError('cold fields can not be loaded into read-only documents or projection records')
+        args, kwargs = cls.nanomongo.to_db_find_args(args, kwargs)
+        cursor = None
+        if cls.nanomongo.materialized is not None:
+            try:
+                cursor = cls.nanomongo.materialized.find(*args, read_only=read_only, **kwargs)
+            except UnsupportedOperation:
+                pass  # not supported in memory, query the database
+        if cursor is None:
+            if cast is not None:
+                kwargs['manipulate'] = False
+            cursor = cls.get_collection(**options).find(*args, **kwargs)
+            if hasattr(cursor, '__aiter__'):  # motor, returned raw like aggregate(), not timed
+                return cursor
+            # the query is sent on iteration, timed up to the first document
+            cursor = TimedCursor(cursor, cast, cls, spec)
+        return ColdCursor(cursor, cls, cold) if cold else cursor
 
     @classmethod
     def find_one(cls, *args, **kwargs):
-        """``pymongo.Collection().find_one`` wrapper for this document"""
+        """``pymongo.Collection().find_one`` wrapper for this document, accepts collection
+        option overrides, ``read_only`` and projection classes like :meth:`~find()`. Given a
+        ``DBRef`` (see :meth:`~get_dbref()`) finds the document by :meth:`~Nanomongo.identity()`,
+        with shard key values. ``cold=True`` (or a list of cold fields) fetches cold fields
+        along, see :mod:`~nanomongo.cold`
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        read_only = kwargs.pop('read_only', False)
+        cold = cls.nanomongo.cold_field_names(kwargs.pop('cold', None))
+        if args and isinstance(args[0], DBRef):
+            args = (cls.nanomongo.identity(args[0]),) + args[1:]
         if args and isinstance(args[0], dict):
             check_spec(cls, args[0])
-        return cls.get_collection().find_one(*args, **kwargs)
+        if cls.nanomongo.advisor is not None:
+            cls.nanomongo.advisor.observe(args[0] if args else None, kwargs.get('sort'))
+        spec = args[0] if args else None
+        args, kwargs, cast = cls.find_cast(args, kwargs, read_only)
+        if cold and cast is not None:
+            raise TypeError('cold fields can not be loaded into read-only documents or projection records')
+        args, kwargs = cls.nanomongo.to_db_find_args(args, kwargs)
+        with metrics.operation(cls, 'find_one', spec) as op:
+            if cls.nanomongo.materialized is not None:
+                try:
+                    result = cls.nanomongo.materialized.find_one(*args, read_only=read_only, **kwargs)
+                    op.result(0 if result is None else 1)
+                    if cold and isinstance(result, cls):
+                        cls.load_cold([result], *cold)
+                    return result
+                except UnsupportedOperation:
+                    pass  # not supported in memory, query the database
+            if cast is None:
+                result = op.defer(cls.get_collection(**options).find_one(*args, **kwargs))
+            else:
+                result = op.defer(cls.get_collection(**options).find_one(*args, manipulate=False, **kwargs))
+            if result is None or isinstance(result, dict):  # not a motor future
+                op.result(0 if result is None else 1)
+            if cold and isinstance(result, cls):
+                cls.load_cold([result], *cold)
+            # None and non-dict results (motor futures) are returned as they are
+            return cast(result) if cast is not None and isinstance(result, dict) else result
+
+    @classmethod
+    def find_cast(cls, args, kwargs, read_only):
+        """Return ``(args, kwargs, cast)`` of a find call; ``cast`` builds results from raw
+        documents for projection classes and ``read_only``, ``None`` for the SON manipulator
+        """
+        args, kwargs, record_class = split_projection(args, kwargs)
+        if record_class is not None:
+            if not issubclass(cls, record_class.document_class):
+                raise TypeError('%s is a projection of %s' % (record_class, record_class.document_class))
+            return args, kwargs, record_class.from_son
+        return args, kwargs, cls.nanomongo.read_only_document if read_only else None
+
+    @classmethod
+    def load_cold(cls, documents, *fields):
+        """
+        Fetch cold ``fields`` (default: all cold fields) of ``documents`` of this class with
+        one query on the companion collection and set them without recording changes. Fields
+        without a stored value stay missing. Returns the number of companion documents found,
+        see :mod:`~nanomongo.cold`
+        """
+        nanomongo = cls.nanomongo
+        fields = nanomongo.cold_field_names(list(fields) if fields else True)
+        documents = [doc for doc in documents if isinstance(doc, cls) and '_id' in doc]
+        if not fields or not documents:
+            return 0
+        by_id = {}
+        for doc in documents:
+            by_id.setdefault(doc['_id'], []).append(doc)
+        spec = {'_id': {'$in': list(by_id)}}
+        with metrics.operation(cls, 'load_cold', spec) as op:
+            with op.phase('driver'):
+                sons = list(nanomongo.cold_collection().find(spec, dict((nanomongo.db_key(f), 1) for f in fields)))
+            for son in sons:
+                son = nanomongo.from_db(son)
+                for doc in by_id.get(son['_id'], ()):
+                    for field_name in fields:
+                        if field_name not in son:
+                            continue
+                        if field_name in nanomongo.embedded_fields:
+                            value = embedded(nanomongo.embedded_fields[field_name], son[field_name])
+                        else:
+                            value = recording(son[field_name])
+                        dict.__setitem__(doc, field_name, value)
+            op.result(len(sons))
+        for doc in documents:
+            doc.__dict__.setdefault('_nanocold', set()).update(fields)
+        return len(sons)
+
+    @classmethod
+    def projection(cls, *fields, **kwargs):
+        """
+        Return a projection record class of the top-level ``fields``, see
+        :mod:`~nanomongo.projection`. ``_id`` is included unless ``with_id=False``; ``name``
+        sets the class name::
+
+            UserSummary = User.projection('name', 'following')
+            summaries = User.find({'active': True}, projection=UserSummary)
+        """
+        return make_projection(cls, fields, **kwargs)
+
+    @classmethod
+    def aggregate(cls, pipeline, as_class=None, **kwargs):
+        """``pymongo.Collection().aggregate`` wrapper for this document. ``$match`` stages are
+        checked like :meth:`~find()` specs until the first stage that may reshape documents
+        (see :func:`~nanomongo.util.check_pipeline`). Keyword arguments such as ``allowDiskUse``,
+        ``batchSize`` and ``maxTimeMS`` are passed along, collection option overrides are
+        accepted like :meth:`~find()`.
+
+        Returns a cursor streaming results batch by batch. Results are instances of
+        ``as_class``: this class by default (results with undefined fields stay raw, see
+        :meth:`~from_result()`), another document class, a projection class (see
+        :meth:`~projection()`), any callable taking a dict, or
+        ``dict`` for the raw driver cursor. Motor cursors are returned raw.
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        check_pipeline(cls, pipeline)
+        if cls.nanomongo.advisor is not None and pipeline and '$match' in pipeline[0]:
+            sort = pipeline[1].get('$sort') if len(pipeline) > 1 else None
+            cls.nanomongo.advisor.observe(pipeline[0]['$match'], list(sort.items()) if sort else None)
+        as_class = cls if as_class is None else as_class
+        pipeline = cls.nanomongo.to_db_pipeline(pipeline)
+        with metrics.operation(cls, 'aggregate') as op:
+            with op.phase('driver'):
+                cursor = op.defer(cls.get_collection(**options).aggregate(pipeline, **kwargs))
+        if dict is as_class or hasattr(cursor, '__aiter__'):
+            return cursor
+        if isinstance(as_class, type) and issubclass(as_class, BaseDocument):
+            return TypedCursor(cursor, as_class.from_result)
+        if isinstance(as_class, type) and issubclass(as_class, Projection):
+            return TypedCursor(cursor, as_class.from_son)
+        return TypedCursor(cursor, as_class)
+
+    @classmethod
+    def paginate(cls, spec=None, sort=None, page_size=20, after=None, **kwargs):
+        """
+        Keyset pagination over :meth:`~find()`. Returns ``(documents, token)`` with up to
+        ``page_size`` documents and an opaque token to pass as ``after`` for the next page,
+        ``None`` on the last page. ``_id`` is added to ``sort`` as a tie-breaker and the next
+        page is selected with range predicates on the sort keys instead of ``skip``, so deep
+        pages cost the same as the first one. Logs a warning if no ``__indexes__`` entry
+        supports the sort. Other keyword arguments are passed to :meth:`~find()`; a projection
+        class must include the sort fields. See :mod:`~nanomongo.pagination`
+        """
+        if page_size < 1:
+            raise TypeError('page_size expected to be positive')
+        spec = spec or {}
+        sort = pagination.full_sort(sort)
+        record_class = kwargs.get('projection')
+        if isinstance(record_class, type) and issubclass(record_class, Projection):
+            missing = [field for field, _ in sort if field.split('.')[0] not in record_class.fields]
+            if missing:
+                raise TypeError('%s does not include sort fields %s' % (record_class.__name__, missing))
+        pagination.check_sort(cls, spec, sort)
+        if after is not None:
+            spec = pagination.after_spec(spec, sort, pagination.decode_token(after, sort))
+        documents = list(cls.find(spec, sort=sort, limit=page_size + 1, **kwargs))
+        if len(documents) <= page_size:
+            return documents, None
+        documents = documents[:page_size]
+        last = documents[-1].as_dict() if isinstance(documents[-1], Projection) else documents[-1]
+        return documents, pagination.encode_token(sort, last)
+
+    @classmethod
+    def from_result(cls, result):
+        """Cast a raw document returned by a command the SON manipulator does not see
+        (eg. ``find_one_and_update``) into this class, with a clean diff. Like the SON
+        manipulator, documents with undefined fields are returned as is, so are ``None``
+        and non-dict results (motor futures)
+        """
+        if not isinstance(result, dict) or isinstance(result, cls):
+            return result
+        try:
+            doc = cls(cls.nanomongo.from_db(result))
+        except ExtraFieldError:
+            return result
+        doc.reset_diff()
+        metrics.documents_decoded(cls)
+        return doc
+
+    @classmethod
+    def find_one_and_update(cls, spec, update, **kwargs):
+        """``pymongo.Collection().find_one_and_update`` wrapper for this document. The spec is
+        checked like in :meth:`~find()`, update operators are validated against the fields
+        (see :func:`~nanomongo.util.check_update`) and ``auto_update`` fields not in ``update``
+        are ``$set``. Returns an instance of this class (before the update unless
+        ``return_document=ReturnDocument.AFTER``) or ``None``. Accepts collection option
+        overrides like :meth:`~find()`. Cold fields can not be updated, use :meth:`~save()`
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        check_spec(cls, spec)
+        check_update(cls, update)
+        cls.nanomongo.check_not_cold(field.split('.')[0] for fields in update.values() for field in fields)
+        updated = set(field.split('.')[0] for fields in update.values() for field in fields)
+        auto_updates = dict((field_name, updater()) for field_name, updater in cls.nanomongo.transforms.items()
+                            if field_name not in updated)
+        if auto_updates:
+            update = dict(update, **{'$set': dict(update.get('$set', {}), **auto_updates)})
+        spec, update = cls.nanomongo.to_db_spec(spec), cls.nanomongo.to_db_update(update)
+        kwargs = cls.nanomongo.to_db_find_args((), kwargs)[1]
+        with metrics.operation(cls, 'find_one_and_update') as op:
+            with op.phase('driver'):
+                result = op.defer(cls.get_collection(**options).find_one_and_update(spec, update, **kwargs))
+            return cls.from_result(result)
+
+    @classmethod
+    def find_one_and_replace(cls, spec, replacement, **kwargs):
+        """``pymongo.Collection().find_one_and_replace`` wrapper for this document. The
+        replacement (a dict or an instance of this class) has its auto updates run and is
+        validated like on :meth:`~insert()`. Returns an instance of this class like
+        :meth:`~find_one_and_update()`. Cold field values of the replacement replace the
+        companion collection document, which requires the replacement's ``_id``
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        check_spec(cls, spec)
+        if not isinstance(replacement, cls):
+            replacement = cls(replacement)
+        if '_id' not in replacement and cls.nanomongo.cold_fields.intersection(dict.keys(replacement)):
+            raise UnsupportedOperation('replacing cold fields requires the _id of the replacement')
+        with metrics.operation(cls, 'find_one_and_replace') as op:
+            with op.phase('run_auto_updates'):
+                replacement.run_auto_updates()
+            with op.phase('validate_all'):
+                replacement.validate_all()
+            replacement.validate()
+            spec, replacement = cls.nanomongo.to_db_spec(spec), cls.nanomongo.to_db(replacement)
+            cold = None
+            if cls.nanomongo.cold_fields:
+                replacement, cold = split_cold(cls.nanomongo.cold_db_keys, replacement)
+            kwargs = cls.nanomongo.to_db_find_args((), kwargs)[1]
+            with op.phase('driver'):
+                result = op.defer(cls.get_collection(**options).find_one_and_replace(spec, replacement, **kwargs))
+                if cold and (result is not None or kwargs.get('upsert')):  # matched or upserted
+                    cls.nanomongo.cold_collection().replace_one({'_id': replacement['_id']}, cold, upsert=True)
+            return cls.from_result(result)
+
+    @classmethod
+    def find_one_and_delete(cls, spec, **kwargs):
+        """``pymongo.Collection().find_one_and_delete`` wrapper for this document. Returns
+        the deleted document as an instance of this class or ``None``. The companion document
+        of cold fields is deleted along, unless a ``projection`` leaves out ``_id``
+        """
+        options = dict((k, kwargs.pop(k)) for k in COLLECTION_OPTIONS if k in kwargs)
+        check_spec(cls, spec)
+        spec = cls.nanomongo.to_db_spec(spec)
+        kwargs = cls.nanomongo.to_db_find_args((), kwargs)[1]
+        with metrics.operation(cls, 'find_one_and_delete') as op:
+            with op.phase('driver'):
+                result = op.defer(cls.get_collection(**options).find_one_and_delete(spec, **kwargs))
+                if cls.nanomongo.cold_fields and isinstance(result, dict) and '_id' in result:
+                    cls.nanomongo.cold_collection().delete_one({'_id': result['_id']})
+            return cls.from_result(result)
+
+    def __missing__(self, key):
+        """Fetch cold field ``key`` on first access, see :mod:`~nanomongo.cold`"""
+        if key in self.nanomongo.cold_fields and key not in self.__dict__.get('_nanocold', ()):
+            self.load_cold([self], key)
+            if key in self:
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
 
     def __dir__(self):
         """Add defined Fields to dir"""
@@ -364,8 +1291,8 @@ your document class with client, db, collection.''' % cls
         * field values are of correct data type
         * required fields are not unset
         """
-        sets = self.__nanodiff__['$set']
-        unsets = self.__nanodiff__['$unset']
+        diff = self._nanodiff or {}  # None if nothing was recorded
+        sets, unsets = diff.get('$set', {}), diff.get('$unset', {})
 
         for field_name, field_value in sets.items():
             if not self.nanomongo.has_field(field_name):
@@ -380,56 +1307,105 @@ your document class with client, db, collection.''' % cls
             else:
                 raise ValidationError('Can not unset undefined field "{}"'.format(field_name))
 
+        for field_name in self.nanomongo.embedded_fields:  # changed in place, unchanged ones are cached
+            field_value = self.get(field_name)
+            if field_name not in sets and isinstance(field_value, EmbeddedDocument):
+                self.nanomongo.fields[field_name].validator(field_value, field_name=field_name)
+
     def run_auto_updates(self):
         """Runs auto_update functions in ``.nanomongo.transforms``."""
         # TODO: This would override any preceding $set on the field
         for field_name, updater in self.nanomongo.transforms.items():
             self[field_name] = updater()
 
-    def insert(self, **kwargs):
+    def insert(self, deferred=False, **kwargs):
         """
         Runs auto updates, validates the document, and inserts into database.
-        Returns ``pymongo.results.InsertOneResult``.
+        Returns ``pymongo.results.InsertOneResult``. Cold field values are inserted into the
+        companion collection after the document, which is deleted again if that fails, see
+        :mod:`~nanomongo.cold`.
+
+        With ``deferred=True`` the validated document is queued to be inserted in a batch
+        by :meth:`~writer()` in the background, returns ``None``; only the ``block`` and
+        ``timeout`` arguments of :meth:`~nanomongo.writer.DeferredWriter.put()` are accepted.
         """
-        self.run_auto_updates()
-        self.validate_all()
-        self.validate()
-        insert_one_result = self.get_collection().insert_one(self, **kwargs)
+        if deferred:
+            unexpected = set(kwargs) - set(['block', 'timeout'])
+            if unexpected:
+                raise TypeError('deferred insert does not take %s' % ', '.join(sorted(unexpected)))
+            return self.writer().put(self, **kwargs)
+        with metrics.operation(self.__class__, 'insert') as op:
+            with op.phase('run_auto_updates'):
+                self.run_auto_updates()
+            with op.phase('validate_all'):
+                self.validate_all()
+            self.validate()
+            self.nanomongo.set_id(self)
+            to_insert, cold = self.nanomongo.to_db(self), None
+            if self.nanomongo.cold_fields:
+                to_insert, cold = split_cold(self.nanomongo.cold_db_keys, to_insert)
+            with op.phase('driver'):
+                insert_one_result = op.defer(self.get_collection().insert_one(to_insert, **kwargs))
+                if cold:
+                    try:
+                        self.nanomongo.cold_collection().insert_one(dict(cold, _id=to_insert['_id']))
+                    except PyMongoError:  # no document without its cold values
+                        self.get_collection().delete_one(self.nanomongo.to_db_spec(self.nanomongo.identity(self)))
+                        raise
+            op.result(1)
         self.reset_diff()
-        for field_name, field_value in self.items():
-            if isinstance(field_value, dict):  # cast dicts
-                field_value = RecordingDict(field_value)
+        if self.nanomongo.cold_fields:
+            self.__dict__['_nanocold'] = set(self.nanomongo.cold_fields)  # all known, nothing to fetch
         return insert_one_result
 
     def save(self, **kwargs):
         """
         Runs auto updates, validates the document, and saves the changes into database.
-        Returns ``pymongo.results.UpdateResult``.
+        Returns ``pymongo.results.UpdateResult``. Changes of cold fields are upserted into
+        the companion collection once the update matched the document, see :mod:`~nanomongo.cold`.
         """
         if '_id' not in self:
             raise ValidationError('insert first; save does partial updates')
-        if '_id' in self.__nanodiff__['$set']:
+        if self._nanodiff and '_id' in self._nanodiff['$set']:
             raise ValidationError('_id seems to be manually set, do insert')
-        self.run_auto_updates()
-        self.validate_diff()
-        self.validate()
-        assert 3 == len(self.__nanodiff__), '__nanodiff__: %s' % self.__nanodiff__
-        query = {'_id': self['_id']}
-        diff = self.__nanodiff__
-        # get subdiff containing dotted keys, merge into diff
-        subdiff = self.get_sub_diff()
-        for operator, value in subdiff.items():
-            diff[operator].update(value)
-        # remove empty update ops, MongoDB 2.6 returns error for them
-        for operator in list(diff.keys()):
-            if not diff[operator]:
-                diff.pop(operator)
-        if not diff:
+        with metrics.operation(self.__class__, 'save', {'_id': self['_id']}) as op:
+            with op.phase('run_auto_updates'):
+                self.run_auto_updates()
+            with op.phase('validate_diff'):
+                self.validate_diff()
+            self.validate()
+            assert 3 == len(self.__nanodiff__), '__nanodiff__: %s' % self.__nanodiff__
+            query = self.nanomongo.to_db_spec(self.nanomongo.identity(self))
+            diff = self.__nanodiff__
+            # get subdiff containing dotted keys, merge into diff
+            with op.phase('get_sub_diff'):
+                subdiff = self.get_sub_diff()
+            if self.nanomongo.shard_key:
+                self.nanomongo.check_shard_key_update(diff)
+                self.nanomongo.check_shard_key_update(subdiff)
+            for operator, value in subdiff.items():
+                diff[operator].update(value)
+            # remove empty update ops, MongoDB 2.6 returns error for them
+            for operator in list(diff.keys()):
+                if not diff[operator]:
+                    diff.pop(operator)
+            if not diff:
+                self.reset_diff()
+                return
+            diff, cold = self.nanomongo.to_db_update(diff), None
+            if self.nanomongo.cold_fields:
+                diff, cold = split_cold_update(self.nanomongo.cold_db_keys, diff)
+            with op.phase('driver'):
+                update_result = op.defer(self.get_collection().update_one(query, diff, **kwargs)) if diff else None
+                if cold and update_result is None:  # only cold fields changed, the document must exist
+                    update_result = self.get_collection().update_one(query, {'$setOnInsert': {'_id': self['_id']}}, **kwargs)
+                if cold and (not getattr(update_result, 'acknowledged', False) or update_result.matched_count):
+                    # no companion document for a document deleted or not matching the shard key
+                    self.nanomongo.cold_collection().update_one({'_id': self['_id']}, cold, upsert=True)
+            if getattr(update_result, 'acknowledged', False):  # not a motor future
+                op.result(update_result.matched_count)
             self.reset_diff()
-            return
-        update_result = self.get_collection().update_one(query, diff, **kwargs)
-        self.reset_diff()
-        return update_result
+            return update_result
 
     def add_to_set(self, field, value):
         """
@@ -467,46 +1443,261 @@ your document class with client, db, collection.''' % cls
             elif value not in self.__nanodiff__['$addToSet'][field]['$each']:
                 self.__nanodiff__['$addToSet'][field]['$each'].append(value)
 
-        if field.startswith('$') or '.$' in field:
-            err_str = 'MongoDB does not allow fields starting with $. "%s"'
-            raise ValidationError(err_str % field)
-        # if top-level
-        if '.' not in field:
-            if ((self.nanomongo.has_field(field) and
-                 list == self.nanomongo.fields[field].data_type)):
-                top_level_add(self, field, value)  # add & record
-            elif self.nanomongo.has_field(field):
-                err_str = 'Cannot apply $addToSet modifier to non-array: %s=%s'
-                err_str = err_str % (field, self.nanomongo.fields[field].data_type)
-                raise ValidationError(err_str)
+        with metrics.operation(self.__class__, 'add_to_set'):
+            if field.startswith('$') or '.$' in field:
+                err_str = 'MongoDB does not allow fields starting with $. "%s"'
+                raise ValidationError(err_str % field)
+            # if top-level
+            if '.' not in field:
+                if ((self.nanomongo.has_field(field) and
+                     list == self.nanomongo.fields[field].data_type)):
+                    top_level_add(self, field, value)  # add & record
+                elif self.nanomongo.has_field(field):
+                    err_str = 'Cannot apply $addToSet modifier to non-array: %s=%s'
+                    err_str = err_str % (field, self.nanomongo.fields[field].data_type)
+                    raise ValidationError(err_str)
+                else:
+                    raise ValidationError('Undefined field: "%s"' % field)
+            # if deep-level
             else:
-                raise ValidationError('Undefined field: "%s"' % field)
-        # if deep-level
-        else:
-            try:
-                top_key, deep_key = field.split('.')
-            except ValueError:
-                err_str = '''Only top level and one level deep keus supported for \
+                try:
+                    top_key, deep_key = field.split('.')
+                except ValueError:
+                    err_str = '''Only top level and one level deep keus supported for \
 $addToSet: "%s"'''
-                raise UnsupportedOperation(err_str, field)
-            if not self.nanomongo.has_field(top_key):
-                raise ValidationError('Undefined field: "%s"' % top_key)
-            elif dict != self.nanomongo.fields[top_key].data_type:
-                raise ValidationError('"%s" is not a dict' % top_key)
-            # field name ok, ensure top level value is RecordingDict type
-            if top_key not in self:  # not set yet, do it
-                dict.__setitem__(self, top_key, RecordingDict())
-            elif not isinstance(self[top_key], RecordingDict):
-                # what did you do, use dict.__setitem__ ? :)
-                err_str = '''Dotted key's target is not a RecordingDict: %s=%s \
+                    raise UnsupportedOperation(err_str, field)
+                if not self.nanomongo.has_field(top_key):
+                    raise ValidationError('Undefined field: "%s"' % top_key)
+                top_type = self.nanomongo.fields[top_key].data_type
+                if not issubclass(top_type, dict):
+                    raise ValidationError('"%s" is not a dict' % top_key)
+                elif top_key in self.nanomongo.embedded_fields and not (
+                        top_type.nanomongo.has_field(deep_key) and list == top_type.nanomongo.fields[deep_key].data_type):
+                    raise ValidationError('"%s" is not a list field of %s' % (deep_key, top_type))
+                # field name ok, ensure top level value is RecordingDict type
+                if top_key not in self:  # not set yet, do it
+                    dict.__setitem__(self, top_key, RecordingDict())
+                elif not isinstance(self[top_key], RecordingDict):
+                    # what did you do, use dict.__setitem__ ? :)
+                    err_str = '''Dotted key's target is not a RecordingDict: %s=%s \
 If you've just set it as a new dict; FYI: you can't $set and $addToSet together'''
-                raise ValidationError(err_str % (top_key, self[top_key]))
-            # make sure we have no $set or $unset on top_key
-            self.check_can_update('$addToSet', top_key)
-            top_level_add(self[top_key], deep_key, value)  # add & record
+                    raise ValidationError(err_str % (top_key, self[top_key]))
+                # make sure we have no $set or $unset on top_key
+                self.check_can_update('$addToSet', top_key)
+                top_level_add(self[top_key], deep_key, value)  # add & record
+                if isinstance(self[top_key], EmbeddedDocument):
+                    self[top_key].invalidate()
+
+    def to_json(self, mode='relaxed'):
+        """Return the document as MongoDB Extended JSON, ``mode`` is ``'relaxed'`` or
+        ``'canonical'``. See :mod:`~nanomongo.serialization`
+        """
+        return self.nanomongo.json_codec(mode).dumps(self)
+
+    @classmethod
+    def from_json(cls, text):
+        """Return a document of Extended JSON ``text`` in either mode, created and validated
+        like ``cls(data)``
+        """
+        return cls(cls.nanomongo.json_codec().loads(text))
 
     def get_dbref(self):
-        """Return a ``bson.DBRef`` instance for this :class:`~BaseDocument` instance"""
+        """Return a ``bson.DBRef`` instance for this :class:`~BaseDocument` instance. Values of
+        ``__shard_key__`` fields are added as extra DBRef fields, used by :meth:`~find_one()`
+        """
         assert '_id' in self and self['_id'], 'Cannot get DBRef for document with no _id'
         collection = self.get_collection()
-        return DBRef(collection.name, self['_id'], database=collection.database.name)
+        return DBRef(collection.name, self['_id'], database=collection.database.name,
+                     **self.nanomongo.shard_values(self))
+
+
+def embedded(embedded_class, value):
+    """Return a dict ``value`` of an embedded document field as an instance of ``embedded_class``"""
+    if isinstance(value, dict) and not isinstance(value, embedded_class):
+        return embedded_class(value)
+    return value
+
+
+def restore_embedded(cls, data, diff, verified):
+    """Unpickle :class:`~EmbeddedDocument` instances, linking embedded documents in ``data``"""
+    doc = restore(cls, data, diff)
+    doc.__nanoparent__, doc.__nanoverified__ = None, verified
+    for value in data.values():
+        if isinstance(value, EmbeddedDocument):
+            value.__nanoparent__ = doc
+    return doc
+
+
+class EmbeddedDocumentMeta(type):
+    """Embedded document metaclass. Collects :class:`~nanomongo.field.Field` definitions into
+    a :class:`~Nanomongo` holding only fields. Classes get empty ``__slots__`` unless they
+    define their own, embedded documents carry no instance ``__dict__``
+    """
+    def __new__(cls, name, bases, dct):
+        if 'nanomongo' in dct:
+            raise TypeError('nanomongo attribute not allowed')
+        dct.setdefault('__slots__', ())
+        return super(EmbeddedDocumentMeta, cls).__new__(cls, name, bases, dct)
+
+    def __init__(cls, name, bases, dct):
+        super(EmbeddedDocumentMeta, cls).__init__(name, bases, dct)
+        if hasattr(cls, 'nanomongo'):
+            cls.nanomongo = Nanomongo.from_dicts(cls.nanomongo.fields, dct)
+        else:
+            cls.nanomongo = Nanomongo.from_dicts(dct)
+        if cls.nanomongo.aliases or cls.nanomongo.transforms or cls.nanomongo.cold_fields:
+            raise TypeError('db_field, auto_update and cold are not supported in embedded documents')
+        for field_name, field_value in dct.items():
+            if isinstance(field_value, Field):
+                delattr(cls, field_name)
+
+
+@six.add_metaclass(EmbeddedDocumentMeta)
+class EmbeddedDocument(RecordingDict):
+    """
+    Base class of embedded documents, used as Field data types. Fields are declared like in
+    :class:`~BaseDocument`::
+
+        class Address(EmbeddedDocument):
+            street = Field(str)
+            zip_code = Field(str, required=False)
+
+        class User(BaseDocument):
+            address = Field(Address)
+
+        user = User(address=Address(street='Main St.'))
+        user.address['zip_code'] = '12345'  # saved as {'$set': {'address.zip_code': '12345'}}
+
+    Dict values of embedded document fields are cast to the embedded class and validated when
+    documents are created. Embedded documents are validated with their parent's
+    ``validate_all()`` and ``validate_diff()``; a successfully validated embedded document is
+    marked verified and not walked again until it, or an embedded document in it, is changed
+    through ``__setitem__`` or ``__delitem__``. Embedded documents holding list or dict values
+    are not marked, those can change in place.
+    """
+    __nanoembedded__ = True
+    __slots__ = ('__nanoparent__', '__nanoverified__')
+
+    def __init__(self, *args, **kwargs):
+        super(EmbeddedDocument, self).__init__(*args, **kwargs)
+        self.__nanoparent__ = None  # containing EmbeddedDocument
+        self.__nanoverified__ = False
+        for field_name, embedded_class in self.nanomongo.embedded_fields.items():
+            if field_name in self:
+                value = embedded(embedded_class, dict.__getitem__(self, field_name))
+                dict.__setitem__(self, field_name, value)
+                if isinstance(value, EmbeddedDocument):
+                    value.__nanoparent__ = self
+
+    def __reduce__(self):
+        return restore_embedded, (self.__class__, dict(self), self._nanodiff, self.__nanoverified__)
+
+    def __setitem__(self, key, value):
+        if key in self.nanomongo.embedded_fields:
+            value = embedded(self.nanomongo.embedded_fields[key], value)
+        super(EmbeddedDocument, self).__setitem__(key, value)
+        if isinstance(value, EmbeddedDocument):
+            value.__nanoparent__ = self
+        self.invalidate()
+
+    def __delitem__(self, key):
+        super(EmbeddedDocument, self).__delitem__(key)
+        self.invalidate()
+
+    def invalidate(self):
+        """Unmark this and containing embedded documents as verified"""
+        node = self
+        while node is not None and node.__nanoverified__:
+            node.__nanoverified__ = False
+            node = node.__nanoparent__
+
+    def validate(self):
+        """
+        **Override** this to add extra validation, called by :meth:`~validate_all()`
+        """
+        pass
+
+    def validate_all(self, field_name=''):
+        """
+        Check fields like :meth:`~BaseDocument.validate_all()`, embedded documents recursively.
+        Skipped if unchanged since the last successful validation. ``field_name`` is the
+        (dotted) name of this document, used for better error reporting
+        """
+        if self.__nanoverified__:
+            return
+        prefix = field_name + '.' if field_name else ''
+        cacheable = True
+        for key, value in self.items():
+            if not self.nanomongo.has_field(key):
+                raise ValidationError('Extra undefined field "{}{}" with value "{}"'.format(prefix, key, value))
+            self.nanomongo.fields[key].validator(value, field_name=prefix + key)
+            if isinstance(value, (dict, list)) and not isinstance(value, EmbeddedDocument):
+                cacheable = False  # changed in place without invalidate()
+        for key, field in self.nanomongo.fields.items():
+            if field.required and key not in self:
+                raise ValidationError('Required field "{}{}" is missing'.format(prefix, key))
+        self.validate()
+        self.__nanoverified__ = cacheable
+
+
+def restore_read_only(doc_class, data):
+    """Unpickle read-only documents of ``doc_class``, see :class:`~ReadOnlyDocument`"""
+    return doc_class.nanomongo.read_only_view()(data)
+
+
+def make_read_only_class(doc_class):
+    """Create the read-only view class of ``doc_class``, see :class:`~ReadOnlyDocument`"""
+    attrs = {'__slots__': (), 'nanomongo': doc_class.nanomongo, 'document_class': doc_class}
+    for field_name, field in doc_class.nanomongo.fields.items():
+        if field.data_type in [DBRef] + DBRef.__subclasses__():
+            getter_name = 'get_%s_field' % field_name
+            attrs[getter_name] = six.get_unbound_function(getattr(doc_class, getter_name))
+    bases = (ReadOnlyDocument,)
+    if issubclass(doc_class, DotNotationMixin):
+        bases = (DotNotationMixin,) + bases
+    return type('ReadOnly%s' % doc_class.__name__, bases, attrs)
+
+
+class ReadOnlyDocument(FrozenDict):
+    """
+    Base class of read-only views of document classes. ``Doc.read_only`` is the view class of
+    ``Doc``, created on first use; ``Doc.find(..., read_only=True)`` and ``find_one`` return its
+    instances::
+
+        for article in Article.find({'author': author}, read_only=True):
+            print(article['title'], article.title)  # dot notation if Article uses it
+        article = Article.read_only(raw_dict)
+
+    Read-only documents skip validation, ``RecordingDict`` wrapping and diff tracking; item
+    assignment and deletion raise :class:`~nanomongo.errors.UnsupportedOperation`. Nested
+    dicts are frozen too, lists are left as they are. Undefined fields are kept, and embedded
+    document fields are frozen dicts rather than :class:`~EmbeddedDocument` instances. DBRef
+    getters (``get_<field_name>_field``) are available. Use :meth:`~mutable()` to get a
+    change tracking copy.
+    """
+    __slots__ = ()
+    nanomongo = None  # Nanomongo of the document class
+    document_class = None
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        freeze(self)  # nested dicts are copied, the given ones stay mutable
+
+    def __reduce__(self):
+        # view classes are created at runtime, pickled through the document class
+        return restore_read_only, (self.document_class, dict(self))
+
+    def mutable(self):
+        """Return an instance of the document class with a copy of this document's data"""
+        return self.document_class(thaw(self))
+
+    def to_json(self, mode='relaxed'):
+        """Return the document as MongoDB Extended JSON, see :meth:`~BaseDocument.to_json()`"""
+        return self.nanomongo.json_codec(mode).dumps(self)
+
+    def get_dbref(self):
+        """Return a ``bson.DBRef`` instance for this document"""
+        assert '_id' in self and self['_id'], 'Cannot get DBRef for document with no _id'
+        collection = self.document_class.get_collection()
+        return DBRef(collection.name, self['_id'], database=collection.database.name,
+                     **self.nanomongo.shard_values(self))
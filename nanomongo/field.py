@@ -1,12 +1,33 @@
 import copy
 import datetime
+import functools
 
 import six
 
 from bson import DBRef, ObjectId
 
 from .errors import ValidationError
-from .util import check_keys
+from .fieldtypes import FieldType, DecimalType, UUIDType
+from .util import RecordingDict, check_keys, recording
+
+IMMUTABLE_TYPES = (type(None), bool, float, six.binary_type, six.text_type, datetime.datetime, ObjectId) + six.integer_types
+
+
+def default_copier(value):
+    """Return a callable returning copies of a ``list`` or ``dict`` default ``value``. Lists and
+    dicts of immutable values are copied with ``list()`` and ``RecordingDict()``, others with
+    ``copy.deepcopy``; dicts, including subclasses such as ``SON``, are returned as
+    :class:`~nanomongo.util.RecordingDict`, embedded documents as they are
+    """
+    items = value.values() if isinstance(value, dict) else value
+    flat = all(isinstance(item, IMMUTABLE_TYPES) for item in items)
+    if list is type(value) and flat:
+        return functools.partial(list, value)
+    elif recording(value) is value:  # not a dict, or a RecordingDict subclass
+        return functools.partial(copy.deepcopy, value)
+    elif flat:
+        return functools.partial(RecordingDict, value)
+    return lambda: RecordingDict(copy.deepcopy(value))
 
 
 class Field(object):
@@ -16,6 +37,8 @@ class Field(object):
         field_name = Field(str, default='cheeseburger')
         foo = Field(datetime, auto_update=True)
         bar = Field(list, required=False)
+        price = Field(Decimal)  # registered field type, see register_type()
+        color = Field(EnumType(Color))
 
     """
     allowed_types = (bool, int, float, six.binary_type, six.text_type,
@@ -24,11 +47,22 @@ class Field(object):
     allowed_kwargs = {
         'default': lambda v: True,
         'required': lambda v: isinstance(v, bool),
+        'db_field': lambda v: isinstance(v, six.string_types) and v and '.' not in v and not v.startswith('$'),
+        'cold': lambda v: isinstance(v, bool),
     }
     extra_kwargs = {
         datetime.datetime: {'auto_update': lambda v: isinstance(v, bool)},
         DBRef: {'document_class': lambda v: isinstance(v, six.string_types)},
     }
+    field_types = {}  # python_type: FieldType, see register_type()
+
+    @classmethod
+    def register_type(cls, field_type):
+        """Register a :class:`~nanomongo.fieldtypes.FieldType` so its ``python_type`` can be
+        used as a Field data type; ``Field(field_type)`` uses it for one field only"""
+        if not isinstance(field_type, FieldType):
+            raise TypeError('FieldType instance expected, got %s' % (field_type,))
+        cls.field_types[field_type.python_type] = field_type
 
     def __init__(self, *args, **kwargs):
         """Field kwargs are checked for correctness and field validator is set,
@@ -39,20 +73,37 @@ class Field(object):
           - `required`: if ``True`` field must exist and not be ``None`` (default: ``True``)
           - `auto_update`: set value to ``datetime.utcnow()`` before inserts/saves;
             only valid for datetime fields (default: ``False``)
+          - `db_field`: (short) field name used in the database, python code keeps using
+            the attribute name (default: the attribute name)
+          - `cold`: store the value in the companion collection and leave it out of
+            normal reads, see :mod:`~nanomongo.cold`. Can not be combined with
+            ``default`` (default: ``False``)
 
         """
         if not args:
             raise TypeError('Field definition incorrect, please provide type')
+        field_type = None
+        if isinstance(args[0], FieldType):
+            field_type = args[0]  # this field only, register_type() makes it global
+            args = (field_type.python_type,) + args[1:]
         elif not isinstance(args[0], type):
             raise TypeError('Field input not a type')
         self.data_type = args[0]
-        if ((self.data_type not in self.allowed_types and
-             not issubclass(self.data_type, self.allowed_types))):
+        if field_type is not None or self.data_type in self.field_types:
+            self.field_type = self.field_types[self.data_type] if field_type is None else field_type
+        elif ((self.data_type not in self.allowed_types and
+               not issubclass(self.data_type, self.allowed_types))):
             raise TypeError('Field input type %s is not allowed' % self.data_type)
         self.check_kwargs(kwargs, self.data_type)
         # attributes
         if 'auto_update' in kwargs and kwargs['auto_update']:
             self.auto_update = self.data_type.utcnow  # datetime.datetime
+        if 'db_field' in kwargs:
+            self.db_field = kwargs['db_field']
+        if 'cold' in kwargs and kwargs['cold']:
+            if 'default' in kwargs:
+                raise TypeError('cold fields can not have a default, it would hide the stored value')
+            self.cold = True
         if 'document_class' in kwargs and kwargs['document_class']:
             self.document_class = kwargs['document_class']
         self.validator = self.generate_validator(self.data_type, **kwargs)
@@ -70,9 +121,7 @@ class Field(object):
                     raise TypeError(new_err)
                 # check if dict/list type and wrap copy in callable
                 if isinstance(self.default_value, (dict, list)):
-                    def default_value_wrapper():
-                        return copy.deepcopy(kwargs['default'])
-                    self.default_value = default_value_wrapper
+                    self.default_value = self.default_copier = default_copier(self.default_value)
 
     @classmethod
     def check_kwargs(cls, kwargs, data_type):
@@ -104,7 +153,15 @@ class Field(object):
             if not isinstance(val, t):
                 raise ValidationError('%s: "%s" not an instance of %s but an instance of %s' %
                                       (field_name, val, t, type(val)))
-            if isinstance(val, dict):
+            if getattr(t, '__nanoembedded__', False):
+                val.validate_all(field_name=field_name)  # EmbeddedDocument, cached when unchanged
+            elif isinstance(val, dict):
                 check_keys(val)  # check against . & $ in keys
+            if hasattr(self, 'field_type'):
+                self.field_type.validate(val, field_name=field_name)
             return True
         return validator
+
+
+Field.register_type(DecimalType())
+Field.register_type(UUIDType())
@@ -0,0 +1,145 @@
+"""
+Pluggable field types. A :class:`~FieldType` is a ``bson.codec_options.TypeCodec`` with
+optional extra validation; once registered with :meth:`~nanomongo.field.Field.register_type`
+its ``python_type`` can be used as a Field data type, given directly to ``Field`` it types
+that field only::
+
+    class Product(BaseDocument):
+        price = Field(Decimal)  # DecimalType is registered by default
+        color = Field(EnumType(Color))
+
+Encoding is done by the BSON layer: collections of document classes using the type get a
+``TypeRegistry`` with the codec in their codec options, so values are converted while
+encoding documents, queries and updates. Decoding is done by the BSON layer too when the
+``bson_type`` is only produced by this type (eg. ``Decimal128``); otherwise (``decode_in_bson
+= False``, eg. enums stored as strings) ``transform_bson`` is applied to the fields of that
+type after decoding.
+"""
+import decimal
+import uuid
+
+from bson.codec_options import TypeCodec, TypeDecoder, TypeEncoder, TypeRegistry
+from bson.decimal128 import Decimal128
+
+from .errors import ValidationError
+
+
+class FieldType(TypeCodec):
+    """Base class of field types. Subclasses set (or define properties for) ``python_type``
+    and ``bson_type`` and implement ``transform_python`` and ``transform_bson``
+    """
+    decode_in_bson = True
+
+    def validate(self, value, field_name=''):
+        """**Override** for validation beyond the ``isinstance`` check, raise
+        :class:`~nanomongo.errors.ValidationError` for invalid values
+        """
+        pass
+
+    def encoded_natively(self):
+        """``True`` if ``python_type`` is encoded by ``bson`` itself; ``TypeRegistry`` does
+        not allow encoders for those (eg. ``uuid.UUID`` or a ``str`` enum)
+        """
+        try:
+            TypeRegistry([self])
+        except TypeError:
+            return True
+        return False
+
+
+class DecimalType(FieldType):
+    """``decimal.Decimal`` stored as ``Decimal128``"""
+    python_type = decimal.Decimal
+    bson_type = Decimal128
+
+    def transform_python(self, value):
+        return Decimal128(value)
+
+    def transform_bson(self, value):
+        return value.to_decimal()
+
+    def validate(self, value, field_name=''):
+        try:
+            Decimal128(value)
+        except (ValueError, decimal.DecimalException):
+            raise ValidationError('%s: "%s" can not be stored as Decimal128' % (field_name, value))
+
+
+class UUIDType(FieldType):
+    """``uuid.UUID``, encoded and decoded natively by ``bson`` with the client's ``uuidRepresentation``"""
+    python_type = uuid.UUID
+    bson_type = uuid.UUID
+    decode_in_bson = False
+
+    def transform_python(self, value):
+        return value
+
+    def transform_bson(self, value):
+        return value
+
+
+class EnumType(FieldType):
+    """An ``enum.Enum`` class stored by member value; decoded per field since the values'
+    BSON type (eg. string) is shared with other fields
+    """
+    decode_in_bson = False
+
+    def __init__(self, enum_class):
+        self.enum_class = enum_class
+
+    @property
+    def python_type(self):
+        return self.enum_class
+
+    @property
+    def bson_type(self):
+        return type(list(self.enum_class)[0].value)
+
+    def transform_python(self, value):
+        return value.value
+
+    def transform_bson(self, value):
+        try:
+            return self.enum_class(value)
+        except ValueError:
+            return value  # left for validation to report
+
+
+class Encoder(TypeEncoder):
+    """The encoding half of a :class:`~FieldType`"""
+    def __init__(self, field_type):
+        self.field_type = field_type
+
+    @property
+    def python_type(self):
+        return self.field_type.python_type
+
+    def transform_python(self, value):
+        return self.field_type.transform_python(value)
+
+
+class Decoder(TypeDecoder):
+    """The decoding half of a :class:`~FieldType`"""
+    def __init__(self, field_type):
+        self.field_type = field_type
+
+    @property
+    def bson_type(self):
+        return self.field_type.bson_type
+
+    def transform_bson(self, value):
+        return self.field_type.transform_bson(value)
+
+
+def type_codecs(field_types):
+    """Return the codecs of given field types to be used in a ``TypeRegistry``"""
+    codecs = []
+    for field_type in field_types:
+        encode, decode = not field_type.encoded_natively(), field_type.decode_in_bson
+        if encode and decode:
+            codecs.append(field_type)
+        elif encode:
+            codecs.append(Encoder(field_type))
+        elif decode:
+            codecs.append(Decoder(field_type))
+    return codecs
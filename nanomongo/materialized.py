@@ -0,0 +1,529 @@
+"""
+In-memory materialized collections for small, read-heavy reference data (categories,
+feature flags, plans ...). Once enabled with :meth:`~nanomongo.document.Nanomongo.materialize`,
+the whole collection is loaded into a local store and
+:meth:`~nanomongo.document.BaseDocument.find` and :meth:`~nanomongo.document.BaseDocument.find_one`
+are answered in-process when the query is supported:
+
+* equality (including embedded documents and array elements), ``$eq``, ``$in``, ``$ne``, ``$nin``
+* ranges ``$gt``, ``$gte``, ``$lt``, ``$lte`` and ``$exists``
+* ``sort``, ``skip`` and ``limit`` keyword arguments, arrays sort by their smallest
+  (ascending) or largest (descending) element like in MongoDB
+
+Query operands of field types (see :mod:`~nanomongo.fieldtypes`) are encoded to their
+stored form first. Anything else (other operators, operands of types without a known
+MongoDB order such as ``uuid.UUID``, projections, other keyword arguments) is sent to the
+database as usual. Hash and sorted indexes are built for ``_id`` and the first key of every
+index in ``__indexes__``. The store is refreshed by periodic polling or a change stream.
+::
+
+    Category.nanomongo.materialize(refresh='poll', interval=60)
+    Category.find({'parent': None}, sort=[('name', 1)])  # no round trip
+"""
+import bisect
+import copy
+import datetime
+import decimal
+import threading
+
+import pymongo
+import six
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+
+from .errors import ExtraFieldError, UnsupportedOperation
+from .serialization import write_jsonl
+
+REFRESH_MODES = (None, 'poll', 'change_stream')
+QUERY_OPERATORS = frozenset(['$eq', '$in', '$ne', '$nin', '$gt', '$gte', '$lt', '$lte', '$exists'])
+FIND_KWARGS = frozenset(['filter', 'sort', 'skip', 'limit'])
+NUMBER_TYPES = six.integer_types + (float, decimal.Decimal, Decimal128)
+UNKNOWN_RANK = 20  # types without a known MongoDB order, ordered by repr
+
+
+def comparable(value):
+    """Return ``value`` comparable with other values of its type rank, ``Decimal128`` as ``Decimal``"""
+    return value.to_decimal() if isinstance(value, Decimal128) else value
+
+
+def type_rank(value):
+    """Rank of the value's type in MongoDB comparison order"""
+    if value is None:
+        return 1
+    elif isinstance(value, bool):
+        return 8
+    elif isinstance(value, NUMBER_TYPES):
+        return 2
+    elif isinstance(value, six.text_type):
+        return 3
+    elif isinstance(value, six.binary_type):
+        return 3 if six.PY2 else 6
+    elif isinstance(value, dict):
+        return 4
+    elif isinstance(value, (list, tuple)):
+        return 5
+    elif isinstance(value, ObjectId):
+        return 7
+    elif isinstance(value, datetime.datetime):
+        return 9
+    return UNKNOWN_RANK
+
+
+def sort_key(value):
+    """Return a key ordering values of mixed types like MongoDB does"""
+    rank = type_rank(value)
+    if 2 == rank:
+        value = comparable(value)
+        return (rank, 0, 0) if value != value else (rank, 1, value)  # NaN before other numbers
+    elif 4 == rank:
+        return (rank, tuple((k, sort_key(v)) for k, v in value.items()))
+    elif 5 == rank:
+        return (rank, tuple(sort_key(v) for v in value))
+    elif UNKNOWN_RANK == rank:
+        return (rank, repr(value))
+    return (rank, value)
+
+
+def field_sort_key(doc, field, descending=False):
+    """Return the sort key of ``doc`` on ``field`` like MongoDB: the smallest element of array
+    values (largest when ``descending``), missing fields as ``None`` and empty arrays before it
+    """
+    keys, empty = [], False
+    for value in resolve(doc, field):
+        if isinstance(value, list):
+            empty = empty or not value
+            keys.extend(sort_key(v) for v in value)
+        else:
+            keys.append(sort_key(value))
+    if not keys:
+        return (0,) if empty else sort_key(None)
+    return max(keys) if descending else min(keys)
+
+
+def freeze(value):
+    """Return a hashable version of ``value`` to be used as hash index key"""
+    if isinstance(value, dict):
+        return (dict, tuple((k, freeze(v)) for k, v in value.items()))
+    elif isinstance(value, (list, tuple)):
+        return (list, tuple(freeze(v) for v in value))
+    return (type_rank(value), comparable(value))  # equal numbers hash alike
+
+
+def resolve(doc, path):
+    """Return the values at dotted ``path``, traversing arrays of embedded documents"""
+    values = [doc]
+    for part in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                found.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+        values = found
+    return values
+
+
+def expand(values):
+    """Values plus elements of array values, as matched by MongoDB queries"""
+    expanded = list(values)
+    for value in values:
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+def equals(values, query):
+    if query is None and not values:
+        return True  # {'field': None} matches missing fields
+    rank, query = type_rank(query), comparable(query)
+    return any(rank == type_rank(v) and comparable(v) == query for v in expand(values))
+
+
+def compare(values, query, op):
+    rank, key = type_rank(query), sort_key(query)
+    return any(rank == type_rank(v) and op(sort_key(v), key) for v in expand(values))
+
+
+OPERATORS = {
+    '$eq': equals,
+    '$ne': lambda values, arg: not equals(values, arg),
+    '$in': lambda values, arg: any(equals(values, a) for a in arg),
+    '$nin': lambda values, arg: not any(equals(values, a) for a in arg),
+    '$gt': lambda values, arg: compare(values, arg, lambda a, b: a > b),
+    '$gte': lambda values, arg: compare(values, arg, lambda a, b: a >= b),
+    '$lt': lambda values, arg: compare(values, arg, lambda a, b: a < b),
+    '$lte': lambda values, arg: compare(values, arg, lambda a, b: a <= b),
+    '$exists': lambda values, arg: bool(values) == bool(arg),
+}
+
+
+def is_operator_query(query):
+    return isinstance(query, dict) and bool(query) and all(k.startswith('$') for k in query)
+
+
+def check_operand(value):
+    """Raise :class:`~nanomongo.errors.UnsupportedOperation` for a query operand of a type
+    without a known MongoDB order, eg. ``uuid.UUID``
+    """
+    if isinstance(value, dict):
+        for v in value.values():
+            check_operand(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            check_operand(v)
+    elif UNKNOWN_RANK == type_rank(value):
+        raise UnsupportedOperation('%s query values not supported in memory' % type(value).__name__)
+
+
+def check_supported(spec):
+    """Raise :class:`~nanomongo.errors.UnsupportedOperation` if spec can not be answered in memory"""
+    for field, query in spec.items():
+        if field.startswith('$'):
+            raise UnsupportedOperation('operator %s not supported in memory' % field)
+        if is_operator_query(query):
+            unsupported = set(query) - QUERY_OPERATORS
+            if unsupported:
+                raise UnsupportedOperation('operators %s not supported in memory' % sorted(unsupported))
+        check_operand(query)
+
+
+def matches(doc, spec):
+    """Return ``True`` if ``doc`` matches the (supported) query ``spec``"""
+    for field, query in spec.items():
+        values = resolve(doc, field)
+        if is_operator_query(query):
+            if not all(OPERATORS[op](values, arg) for op, arg in query.items()):
+                return False
+        elif not equals(values, query):
+            return False
+    return True
+
+
+class Index(object):
+    """Hash and sorted index on a (possibly dotted) field, array elements indexed separately"""
+    def __init__(self, field):
+        self.field = field
+        self.hashed = {}  # frozen value: set of _id
+        self.keys, self.ids = [], []  # sorted by (sort_key(value), sort_key(_id))
+
+    def index_values(self, doc):
+        values = expand(resolve(doc, self.field))
+        return values if values else [None]
+
+    def add(self, _id, doc):
+        for value in self.index_values(doc):
+            self.hashed.setdefault(freeze(value), set()).add(_id)
+            key = (sort_key(value), sort_key(_id))
+            pos = bisect.bisect_left(self.keys, key)
+            self.keys.insert(pos, key)
+            self.ids.insert(pos, _id)
+
+    def remove(self, _id, doc):
+        for value in self.index_values(doc):
+            frozen = freeze(value)
+            ids = self.hashed.get(frozen, set())
+            ids.discard(_id)
+            if not ids:
+                self.hashed.pop(frozen, None)
+            key = (sort_key(value), sort_key(_id))
+            pos = bisect.bisect_left(self.keys, key)
+            if pos < len(self.keys) and self.keys[pos] == key:
+                del self.keys[pos]
+                del self.ids[pos]
+
+    def candidates(self, query):
+        """Return a set of candidate ``_id`` for the field's query, ``None`` if the index can't help"""
+        if not is_operator_query(query):
+            return set(self.hashed.get(freeze(query), ()))
+        if '$eq' in query:
+            return set(self.hashed.get(freeze(query['$eq']), ()))
+        if '$in' in query:
+            return set().union(*[self.hashed.get(freeze(v), ()) for v in query['$in']])
+        bounds = [(op, arg) for op, arg in query.items() if op in ('$gt', '$gte', '$lt', '$lte')]
+        if not bounds:
+            return None
+        rank = type_rank(bounds[0][1])
+        low, high = ((rank,),), ((rank + 1,),)  # ranges only match values of the same type
+        for op, arg in bounds:
+            if op in ('$gt', '$gte') and (sort_key(arg),) > low:
+                low = (sort_key(arg),)
+            elif op in ('$lt', '$lte') and (sort_key(arg), (99,)) < high:
+                high = (sort_key(arg), (99,))  # after every _id of an equal value
+        start = bisect.bisect_left(self.keys, low)
+        end = bisect.bisect_right(self.keys, high)
+        return set(self.ids[start:end])  # bounds are inclusive, exact check in matches()
+
+
+class MaterializedCollection(object):
+    """Local copy of a document class' collection, see the module documentation"""
+    def __init__(self, nanomongo, refresh='poll', interval=60):
+        if refresh not in REFRESH_MODES:
+            raise TypeError('refresh expected one of %s' % (REFRESH_MODES,))
+        self.nanomongo = nanomongo
+        self.refresh_mode = refresh
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.documents = {}  # _id: raw document
+        self.indexes = {}  # field: Index
+        self.stopping = threading.Event()
+        self.thread = None
+        self.loaded_at = None
+
+    def index_fields(self):
+        doc_class = self.nanomongo.classref()
+        indexes = doc_class.__indexes__ if hasattr(doc_class, '__indexes__') else []
+        fields = [list(index.document['key'].keys())[0] for index in self.nanomongo.to_db_indexes(indexes)]
+        return ['_id'] + [f for f in fields if '_id' != f]
+
+    def raw_collection(self):
+        """Collection from a new database object, without nanomongo's SON manipulator"""
+        self.nanomongo.check_config()
+        collection = self.nanomongo.client[self.nanomongo.database.name][self.nanomongo.collection]
+        codec_options = self.nanomongo.codec_options()
+        return collection.with_options(codec_options=codec_options) if codec_options else collection
+
+    def refresh(self):
+        """(Re)load the whole collection and rebuild indexes"""
+        documents = dict((doc['_id'], doc) for doc in self.raw_collection().find())
+        indexes = dict((field, Index(field)) for field in self.index_fields())
+        for _id, doc in documents.items():
+            for index in indexes.values():
+                index.add(_id, doc)
+        with self.lock:
+            self.documents, self.indexes = documents, indexes
+            self.loaded_at = datetime.datetime.utcnow()
+
+    def put(self, doc):
+        """Insert or replace a raw document in the store"""
+        with self.lock:
+            self.remove(doc['_id'])
+            self.documents[doc['_id']] = doc
+            for index in self.indexes.values():
+                index.add(doc['_id'], doc)
+
+    def remove(self, _id):
+        """Remove a document from the store by ``_id``"""
+        with self.lock:
+            doc = self.documents.pop(_id, None)
+            if doc is not None:
+                for index in self.indexes.values():
+                    index.remove(_id, doc)
+
+    def apply_change(self, change):
+        """Apply a change stream event"""
+        operation = change['operationType']
+        if operation in ('insert', 'replace', 'update'):
+            if change.get('fullDocument') is not None:
+                self.put(change['fullDocument'])
+            else:  # deleted since
+                self.remove(change['documentKey']['_id'])
+        elif 'delete' == operation:
+            self.remove(change['documentKey']['_id'])
+        else:  # drop, rename, invalidate ...
+            self.refresh()
+
+    def start(self):
+        """Load the collection and start the refresh thread, if any"""
+        self.refresh()
+        if self.refresh_mode is None:
+            return
+        target = self.poll if 'poll' == self.refresh_mode else self.watch
+        self.stopping.clear()
+        self.thread = threading.Thread(target=target, name='nanomongo-materialized-%s' % self.nanomongo.collection)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the refresh thread"""
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def poll(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.refresh()
+            except pymongo.errors.PyMongoError:
+                pass  # keep serving the current copy, retry next interval
+
+    def watch(self):
+        while not self.stopping.is_set():
+            try:
+                with self.raw_collection().watch(full_document='updateLookup', max_await_time_ms=1000) as stream:
+                    self.refresh()  # changes before the stream opened
+                    while not self.stopping.is_set():
+                        change = stream.try_next()
+                        if change is not None:
+                            self.apply_change(change)
+            except pymongo.errors.PyMongoError:
+                self.stopping.wait(self.interval)
+
+    def query(self, spec=None, sort=None, skip=0, limit=0):
+        """Return raw documents matching ``spec``, sorted, skipped and limited"""
+        spec = spec or {}
+        check_supported(spec)
+        with self.lock:
+            candidates = None
+            for field, query in spec.items():
+                if field in self.indexes:
+                    ids = self.indexes[field].candidates(query)
+                    if ids is not None:
+                        candidates = ids if candidates is None else candidates & ids
+            if candidates is None:
+                docs = list(self.documents.values())
+            else:
+                docs = [self.documents[_id] for _id in candidates]
+            docs = [doc for doc in docs if matches(doc, spec)]
+        if sort:
+            for field, direction in reversed(sort):
+                descending = direction == pymongo.DESCENDING
+                docs.sort(key=lambda doc: field_sort_key(doc, field, descending), reverse=descending)
+        elif candidates is not None:
+            docs.sort(key=lambda doc: sort_key(doc['_id']))  # deterministic, natural order otherwise
+        docs = docs[skip:]
+        return docs[:limit] if limit else docs
+
+    def encode(self, value):
+        """Return query operand ``value`` in its stored form, values of the class' field
+        types encoded like the BSON layer does for the database
+        """
+        if isinstance(value, dict):
+            return dict((k, self.encode(v)) for k, v in value.items())
+        elif isinstance(value, (list, tuple)):
+            return [self.encode(v) for v in value]
+        for codec in self.nanomongo.type_codecs:
+            if hasattr(codec, 'python_type') and isinstance(value, codec.python_type):
+                return codec.transform_python(value)
+        return value
+
+    def to_document(self, raw):
+        """Cast a copy of a raw document to the document class, like the SON manipulator does"""
+        raw = self.nanomongo.from_db(copy.deepcopy(raw))
+        try:
+            return self.nanomongo.classref()(raw)
+        except ExtraFieldError:
+            return raw
+
+    def to_read_only(self, raw):
+        """Cast a copy of a raw document to the document class' read-only view"""
+        return self.nanomongo.read_only_document(copy.deepcopy(raw))
+
+    def find(self, *args, **kwargs):
+        """``find`` with ``pymongo.Collection.find`` arguments, returns a :class:`~MaterializedCursor`.
+        Raises :class:`~nanomongo.errors.UnsupportedOperation` for anything not supported in memory.
+        With ``read_only=True`` the cursor returns read-only documents
+        """
+        read_only = kwargs.pop('read_only', False)
+        if len(args) > 1 or set(kwargs) - FIND_KWARGS:
+            raise UnsupportedOperation('only filter, sort, skip, limit supported in memory')
+        spec = args[0] if args else kwargs.get('filter')
+        if spec is not None and not isinstance(spec, dict):
+            raise UnsupportedOperation('filter must be a dict')
+        spec = self.encode(spec) if spec else spec
+        check_supported(spec or {})
+        return MaterializedCursor(self, spec, sort=kwargs.get('sort'), skip=kwargs.get('skip', 0),
+                                  limit=kwargs.get('limit', 0), cast=self.to_read_only if read_only else None)
+
+    def find_one(self, *args, **kwargs):
+        """``find_one`` with ``pymongo.Collection.find_one`` arguments, non-dict filter is an ``_id``"""
+        if args and args[0] is not None and not isinstance(args[0], dict):
+            args = ({'_id': args[0]},) + args[1:]
+        kwargs['limit'] = 1
+        for doc in self.find(*args, **kwargs):
+            return doc
+        return None
+
+
+class MaterializedCursor(object):
+    """A minimal cursor over a :class:`~MaterializedCollection` query; supports ``sort()``,
+    ``skip()``, ``limit()`` and slicing before iteration, indexing, ``count()``, ``clone()``,
+    ``rewind()`` and ``close()`` like ``pymongo.cursor.Cursor``
+    """
+    def __init__(self, materialized, spec, sort=None, skip=0, limit=0, cast=None):
+        self.materialized = materialized
+        self.spec = spec
+        self.cast = cast or materialized.to_document
+        self._sort, self._skip, self._limit = sort, skip, limit
+        self.empty = False  # sliced to no documents
+        self.docs, self.position = None, 0  # query results once iterated
+
+    def sort(self, key_or_list, direction=pymongo.ASCENDING):
+        self._sort = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        if with_limit_and_skip:
+            if self.empty:
+                return 0
+            return len(self.materialized.query(self.spec, skip=self._skip, limit=self._limit))
+        return len(self.materialized.query(self.spec))
+
+    def __getitem__(self, index):
+        """``cursor[index]`` returns a document, ``cursor[start:stop]`` sets skip and limit"""
+        if isinstance(index, slice):
+            if index.step is not None or (index.start or 0) < 0 or (index.stop or 0) < 0:
+                raise IndexError('slice steps and negative indexes are not supported')
+            self._skip = index.start or 0
+            self._limit = index.stop - self._skip if index.stop is not None else 0
+            self.empty = self._limit <= 0 and index.stop is not None
+            return self
+        if index < 0 or self.empty or (self._limit and index >= self._limit):
+            raise IndexError('no such item for Cursor instance')
+        docs = self.materialized.query(self.spec, sort=self._sort, skip=self._skip + index, limit=1)
+        if not docs:
+            raise IndexError('no such item for Cursor instance')
+        return self.cast(docs[0])
+
+    def clone(self):
+        clone = MaterializedCursor(self.materialized, self.spec, sort=self._sort, skip=self._skip,
+                                   limit=self._limit, cast=self.cast)
+        clone.empty = self.empty
+        return clone
+
+    def rewind(self):
+        self.docs, self.position = None, 0
+        return self
+
+    def close(self):
+        self.docs, self.position = [], 0
+
+    @property
+    def alive(self):
+        return self.docs is None or self.position < len(self.docs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.docs is None:
+            self.docs = [] if self.empty else self.materialized.query(self.spec, sort=self._sort, skip=self._skip,
+                                                                      limit=self._limit)
+        if self.position >= len(self.docs):
+            raise StopIteration
+        self.position += 1
+        return self.cast(self.docs[self.position - 1])
+
+    next = __next__  # PY2
+
+    def to_jsonl(self, fp, mode='relaxed'):
+        """Write the documents to the text file ``fp`` as Extended JSON lines, see
+        :meth:`~nanomongo.util.TypedCursor.to_jsonl()`
+        """
+        return write_jsonl(self, fp, mode=mode)
@@ -0,0 +1,317 @@
+"""
+Per document class operation metrics. Disabled by default; when disabled every hook
+is a no-op on a shared null object. Enable with :func:`~enable`::
+
+    from nanomongo import metrics
+
+    collector = metrics.enable()
+    # optional, server side durations and BSON bytes through pymongo command monitoring
+    client = pymongo.MongoClient(event_listeners=[collector.command_listener()])
+    ...
+    print(collector.prometheus())
+
+Recorded per document class and operation (``find``, ``find_one``, ``insert``, ``save``,
+``add_to_set``, ``dereference``, ``find_one_and_update`` ...):
+
+* latency histograms
+* time spent in phases such as ``run_auto_updates``, ``validate_all``, ``validate_diff``,
+  ``get_sub_diff`` and ``driver`` (the pymongo/motor call)
+* documents decoded (by the SON manipulator)
+* BSON bytes sent and received (command monitoring only, this re-encodes commands and replies)
+
+``find()`` returns a cursor sending the query once iterated; its latency is the time to
+fetch the first document (the first batch), later batches are not timed; ``cursor[index]``,
+clones and rewound cursors are timed like a new query. Operations of
+motor clients are recorded once their future is done; motor cursors (``find()``,
+``aggregate()``) are lazy and not recorded.
+"""
+import threading
+import time
+
+import bson
+from pymongo import monitoring
+
+# seconds, prometheus default buckets
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+collector = None  # the active MetricsCollector, None when disabled
+slow_log = None  # the active slowlog.SlowLog, None when disabled, see nanomongo.slowlog
+context = threading.local()  # the running nanomongo Operation
+clock = getattr(time, 'perf_counter', time.time)  # for durations, monotonic on python 3
+
+
+class Histogram(object):
+    """A cumulative histogram with fixed upper bounds"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return ``[(upper_bound, cumulative_count), ...]`` with ``+Inf`` bound last"""
+        total, result = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float('inf'), self.count))
+        return result
+
+
+class NullOperation(object):
+    """Returned by :func:`~operation` while metrics are disabled, does nothing"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def phase(self, name):
+        return self
+
+    def result(self, count):
+        pass
+
+    def defer(self, result):
+        return result
+
+
+NULL_OPERATION = NullOperation()
+
+
+class Phase(object):
+    __slots__ = ('operation', 'name', 'start')
+
+    def __init__(self, operation, name):
+        self.operation, self.name = operation, name
+
+    def __enter__(self):
+        self.start = clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        op = self.operation
+        op.collector.add_phase(op.cls_name, op.operation, self.name, clock() - self.start)
+        return False
+
+
+class Operation(object):
+    """Times a nanomongo operation, see :func:`~operation`"""
+    __slots__ = ('collector', 'slow_log', 'cls', 'cls_name', 'operation', 'spec', 'count', 'server_seconds',
+                 'start', 'outer', 'deferred')
+
+    def __init__(self, collector, slow_log, cls, operation, spec=None):
+        self.collector, self.slow_log = collector, slow_log
+        self.cls, self.cls_name, self.operation, self.spec = cls, cls.__name__, operation, spec
+        self.count = None  # documents returned or written, see result()
+        self.server_seconds = None  # from command monitoring, see slowlog.SlowLogListener
+        self.deferred = False  # recorded when a motor future is done, see defer()
+
+    def __enter__(self):
+        self.outer = getattr(context, 'current', None)
+        context.current = self
+        self.start = clock()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        context.current = self.outer
+        if not self.deferred:
+            self.record(clock() - self.start, failed=exc_type is not None)
+        return False
+
+    def record(self, seconds, failed=False):
+        if self.collector is not None:
+            self.collector.observe(self.cls_name, self.operation, seconds, failed=failed)
+        if self.slow_log is not None:
+            self.slow_log.observe(self, seconds, failed=failed)
+
+    def defer(self, result):
+        """Return the driver's ``result``; for motor results the operation is not recorded on
+        exit but once a future is done, never for lazy cursors
+        """
+        if hasattr(result, 'add_done_callback'):
+            self.deferred = True
+            result.add_done_callback(self.done)
+        elif hasattr(result, '__aiter__'):
+            self.deferred = True
+        return result
+
+    def done(self, future):
+        self.record(clock() - self.start, failed=future.cancelled() or future.exception() is not None)
+
+    def phase(self, name):
+        """Return a context manager timing phase ``name`` of this operation"""
+        if self.collector is None:
+            return NULL_OPERATION
+        return Phase(self, name)
+
+    def result(self, count):
+        """Record the number of documents returned or written by this operation"""
+        self.count = count
+
+
+def operation(cls, name, spec=None):
+    """Return a context manager timing operation ``name`` of document class ``cls``, the
+    shared no-op :class:`~NullOperation` when metrics and the slow log are disabled. ``spec``
+    is the query of the operation, recorded (redacted) by the slow log
+    """
+    if collector is None and slow_log is None:
+        return NULL_OPERATION
+    return Operation(collector, slow_log, cls, name, spec)
+
+
+def documents_decoded(cls, count=1):
+    """Record documents of ``cls`` decoded from the database"""
+    if collector is not None:
+        current = getattr(context, 'current', None)
+        collector.add_documents(cls.__name__, current.operation if current else 'find', count)
+
+
+def enable(buckets=DEFAULT_BUCKETS):
+    """Enable metrics collection with a new :class:`~MetricsCollector` and return it"""
+    global collector
+    collector = MetricsCollector(buckets=buckets)
+    return collector
+
+
+def disable():
+    """Disable metrics collection"""
+    global collector
+    collector = None
+
+
+class MetricsCollector(object):
+    """Holds recorded metrics, keyed by ``(class name, operation)``"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.latency = {}  # (cls, op): Histogram
+        self.failures = {}  # (cls, op): count
+        self.phases = {}  # (cls, op, phase): [seconds, count]
+        self.documents = {}  # (cls, op): count
+        self.bson_bytes = {}  # (cls, op, direction): bytes
+        self.commands = {}  # (cls, op, command): Histogram of server durations
+
+    def observe(self, cls_name, operation, seconds, failed=False):
+        key = (cls_name, operation)
+        with self.lock:
+            if key not in self.latency:
+                self.latency[key] = Histogram(self.buckets)
+            self.latency[key].observe(seconds)
+            if failed:
+                self.failures[key] = self.failures.get(key, 0) + 1
+
+    def add_phase(self, cls_name, operation, phase, seconds):
+        key = (cls_name, operation, phase)
+        with self.lock:
+            total = self.phases.setdefault(key, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+
+    def add_documents(self, cls_name, operation, count):
+        key = (cls_name, operation)
+        with self.lock:
+            self.documents[key] = self.documents.get(key, 0) + count
+
+    def add_command(self, cls_name, operation, command, seconds, sent, received):
+        key = (cls_name, operation, command)
+        with self.lock:
+            if key not in self.commands:
+                self.commands[key] = Histogram(self.buckets)
+            self.commands[key].observe(seconds)
+            for direction, size in (('sent', sent), ('received', received)):
+                if size:
+                    bytes_key = (cls_name, operation, direction)
+                    self.bson_bytes[bytes_key] = self.bson_bytes.get(bytes_key, 0) + size
+
+    def command_listener(self):
+        """Return a ``pymongo.monitoring.CommandListener`` feeding this collector. Pass it to
+        ``MongoClient(event_listeners=[...])`` or ``pymongo.monitoring.register()``
+        """
+        return CommandMetricsListener(self)
+
+    def prometheus(self):
+        """Return metrics in Prometheus text exposition format"""
+        lines = []
+
+        def labels(**kwargs):
+            return ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                            for k, v in sorted(kwargs.items()))
+
+        def histogram(name, help_text, histograms, label_names):
+            lines.extend(['# HELP %s %s' % (name, help_text), '# TYPE %s histogram' % name])
+            for key, hist in sorted(histograms.items()):
+                label_dict = dict(zip(label_names, key))
+                for bound, count in hist.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('%s_bucket{%s} %d' % (name, labels(le=le, **label_dict), count))
+                lines.append('%s_sum{%s} %r' % (name, labels(**label_dict), hist.sum))
+                lines.append('%s_count{%s} %d' % (name, labels(**label_dict), hist.count))
+
+        def counter(name, help_text, values, label_names):
+            lines.extend(['# HELP %s %s' % (name, help_text), '# TYPE %s counter' % name])
+            for key, value in sorted(values.items()):
+                lines.append('%s{%s} %r' % (name, labels(**dict(zip(label_names, key))), value))
+
+        with self.lock:
+            histogram('nanomongo_operation_duration_seconds', 'nanomongo operation latency',
+                      self.latency, ('cls', 'operation'))
+            counter('nanomongo_operation_failures_total', 'nanomongo operations that raised',
+                    self.failures, ('cls', 'operation'))
+            counter('nanomongo_phase_seconds_total', 'time spent in operation phases',
+                    dict((k, v[0]) for k, v in self.phases.items()), ('cls', 'operation', 'phase'))
+            counter('nanomongo_phase_calls_total', 'operation phase calls',
+                    dict((k, v[1]) for k, v in self.phases.items()), ('cls', 'operation', 'phase'))
+            counter('nanomongo_documents_decoded_total', 'documents decoded into document classes',
+                    self.documents, ('cls', 'operation'))
+            counter('nanomongo_bson_bytes_total', 'BSON bytes of commands and replies',
+                    self.bson_bytes, ('cls', 'operation', 'direction'))
+            histogram('nanomongo_command_duration_seconds', 'server command duration from command monitoring',
+                      self.commands, ('cls', 'operation', 'command'))
+        return '\n'.join(lines) + '\n'
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """pymongo command listener attributing server durations and BSON sizes to the
+    running nanomongo operation. Commands outside of one (eg. ``getMore`` while
+    iterating a cursor) are attributed to ``<database>.<collection>`` and the command name.
+    """
+    def __init__(self, collector):
+        self.collector = collector
+        self.pending = {}  # request_id: (cls, op, sent bytes)
+
+    def started(self, event):
+        current = getattr(context, 'current', None)
+        if current is None:
+            collection = event.command.get('collection', event.command.get(event.command_name))
+            labels = ('%s.%s' % (event.database_name, collection), event.command_name)
+        else:
+            labels = (current.cls_name, current.operation)
+        self.pending[event.request_id] = labels + (len(bson.BSON.encode(event.command)),)
+
+    def succeeded(self, event):
+        self.finish(event, len(bson.BSON.encode(event.reply)))
+
+    def failed(self, event):
+        self.finish(event, 0)
+
+    def finish(self, event, received):
+        pending = self.pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        cls_name, operation, sent = pending
+        self.collector.add_command(cls_name, operation, event.command_name,
+                                   event.duration_micros / 1e6, sent, received)
@@ -0,0 +1,80 @@
+"""
+Keyset (seek) pagination helpers used by :meth:`~nanomongo.document.BaseDocument.paginate`.
+Instead of ``skip``, each page continues after the sort key values of the previous page's
+last document, so deep pages cost the same as the first one given an index supporting
+the sort. ``_id`` is appended to the sort as a tie-breaker.
+::
+
+    page, token = Article.paginate({'author': author}, sort=[('published', -1)], page_size=50)
+    while token:
+        page, token = Article.paginate({'author': author}, sort=[('published', -1)], page_size=50, after=token)
+
+Sort keys should be present and single valued (not arrays) in all documents, the
+``$gt``/``$lt`` predicates on them do not match missing values.
+"""
+import base64
+import binascii
+import logging
+
+import bson
+import pymongo
+
+from .advisor import class_indexes, sort_supported
+from .materialized import resolve
+from .util import spec_shape
+
+
+def full_sort(sort):
+    """Return ``sort`` as a list of ``(field, direction)`` with ``_id`` appended as tie-breaker"""
+    sort = [tuple(item) for item in sort or []]
+    for item in sort:
+        if 2 != len(item) or item[1] not in (pymongo.ASCENDING, pymongo.DESCENDING):
+            raise TypeError('sort expected to be a list of (field, 1 or -1) pairs, got %s' % (sort,))
+    if '_id' not in [field for field, _ in sort]:
+        sort.append(('_id', sort[-1][1] if sort else pymongo.ASCENDING))
+    return sort
+
+
+def after_spec(spec, sort, values):
+    """Return ``spec`` restricted to documents after the sort key ``values`` in ``sort`` order"""
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        branch = dict((f, v) for (f, _), v in zip(sort[:i], values[:i]))
+        branch[field] = {('$gt' if pymongo.ASCENDING == direction else '$lt'): values[i]}
+        branches.append(branch)
+    if '$or' in spec:
+        return {'$and': [spec, {'$or': branches}]}
+    return dict(spec, **{'$or': branches})
+
+
+def encode_token(sort, doc):
+    """Return an opaque continuation token with the sort key values of ``doc``"""
+    values = []
+    for field, _ in sort:
+        found = resolve(doc, field)
+        values.append(found[0] if found else None)
+    raw = bson.BSON.encode({'s': [list(item) for item in sort], 'v': values})
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_token(token, sort):
+    """Return sort key values from a token of :func:`~encode_token` issued for ``sort``"""
+    try:
+        decoded = bson.BSON(base64.urlsafe_b64decode(str(token))).decode()
+    except (TypeError, ValueError, binascii.Error, bson.errors.InvalidBSON):
+        raise TypeError('invalid pagination token %r' % (token,))
+    if [tuple(item) for item in decoded.get('s', [])] != sort:
+        raise TypeError('pagination token was issued for a different sort')
+    return decoded['v']
+
+
+def check_sort(doc_class, spec, sort):
+    """Log a warning, once per query shape and sort, if no declared index supports ``sort``"""
+    checked = doc_class.nanomongo.checked_sorts
+    key = (spec_shape(spec), tuple(sort))
+    if key in checked:
+        return
+    checked.add(key)
+    if not sort_supported(class_indexes(doc_class), spec, sort):
+        logging.warning('%s has no index supporting sort %s for spec %s, pages are sorted in memory',
+                        doc_class, sort, spec)
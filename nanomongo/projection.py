@@ -0,0 +1,128 @@
+"""
+Projection record classes for narrow reads. A projection class holds a few fields of a
+document class in ``__slots__``; given as ``projection`` to ``find()``/``find_one()`` the
+matching projection is sent to the server and results are decoded straight into records,
+without ``BaseDocument.__init__``, validation or change tracking::
+
+    UserSummary = User.projection('name', 'following')
+    for summary in User.find({'active': True}, projection=UserSummary):  # or UserSummary.find(...)
+        print(summary._id, summary.name, summary['following'])
+
+``_id`` is included unless ``with_id=False``. Fields missing in a document are ``None``.
+Records are read-only; use the document class for anything to be saved. Records can be
+pickled when their class is a module level attribute under its name (see ``name`` of
+:meth:`~nanomongo.document.BaseDocument.projection`).
+"""
+from . import metrics
+from .errors import UnsupportedOperation
+
+
+class Projection(object):
+    """
+    Base class of projection records created with :meth:`~nanomongo.document.BaseDocument.projection`.
+    Fields are available as attributes and, read-only, by key
+    """
+    __slots__ = ()
+    document_class = None
+    fields = ()  # field names, in slot order
+    spec = {}  # projection sent to the server
+
+    def __init__(self, *args, **kwargs):
+        if len(args) > len(self.fields):
+            raise TypeError('%s takes at most %d positional arguments' % (self.__class__.__name__, len(self.fields)))
+        values = dict(zip(self.fields, args))
+        for name, value in kwargs.items():
+            if name not in self.fields or name in values:
+                raise TypeError('%s: unexpected or repeated field %s' % (self.__class__.__name__, name))
+            values[name] = value
+        for name in self.fields:
+            object.__setattr__(self, name, values.get(name))
+
+    @classmethod
+    def from_son(cls, son):
+        """Return a record of a raw document from the database"""
+        son = cls.document_class.nanomongo.from_db(son)
+        record = object.__new__(cls)
+        for name in cls.fields:
+            object.__setattr__(record, name, son.get(name))
+        metrics.documents_decoded(cls.document_class)
+        return record
+
+    @classmethod
+    def find(cls, *args, **kwargs):
+        """``find()`` of the document class returning records of this class"""
+        return cls.document_class.find(*args, projection=cls, **kwargs)
+
+    @classmethod
+    def find_one(cls, *args, **kwargs):
+        """``find_one()`` of the document class returning a record of this class"""
+        return cls.document_class.find_one(*args, projection=cls, **kwargs)
+
+    def __setattr__(self, name, value):
+        raise UnsupportedOperation('%s is read-only' % self.__class__.__name__)
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.fields else default
+
+    def as_dict(self):
+        """Return the fields as a ``dict``"""
+        return dict((name, getattr(self, name)) for name in self.fields)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.fields))
+
+    def __reduce__(self):
+        return self.__class__, tuple(getattr(self, name) for name in self.fields)
+
+
+def make_projection(doc_class, fields, with_id=True, name=None):
+    """Create a :class:`~Projection` subclass of top-level ``fields`` of ``doc_class``"""
+    fields = [field for field in fields if field != '_id']
+    if with_id:
+        fields.insert(0, '_id')
+    if not fields or len(set(fields)) != len(fields):
+        raise TypeError('projection fields expected to be unique and not empty, got %s' % fields)
+    for field in fields:
+        if not doc_class.nanomongo.has_field(field):
+            raise TypeError('%s has no field %s' % (doc_class.__name__, field))
+        if hasattr(Projection, field):
+            raise TypeError('field name %s clashes with a Projection attribute' % field)
+        if field in doc_class.nanomongo.cold_fields:
+            raise TypeError('%s is a cold field, records hold hot fields only' % field)
+    spec = dict((field, 1) for field in fields)
+    if not with_id:
+        spec['_id'] = 0
+    # defined in the document class' module, records pickle when the class is a module
+    # attribute under its name
+    attrs = {'__slots__': tuple(fields), '__module__': doc_class.__module__, 'document_class': doc_class,
+             'fields': tuple(fields), 'spec': spec}
+    return type(name or '%sProjection' % doc_class.__name__, (Projection,), attrs)
+
+
+def split_projection(args, kwargs):
+    """Return ``(args, kwargs, record_class)`` of a ``find`` call with a :class:`~Projection`
+    subclass given as projection replaced by its projection spec; ``record_class`` is
+    ``None`` when no projection class is given
+    """
+    if len(args) > 1 and isinstance(args[1], type) and issubclass(args[1], Projection):
+        return (args[0], args[1].spec) + tuple(args[2:]), kwargs, args[1]
+    projection = kwargs.get('projection')
+    if isinstance(projection, type) and issubclass(projection, Projection):
+        return args, dict(kwargs, projection=projection.spec), projection
+    return args, kwargs, None
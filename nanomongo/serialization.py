@@ -0,0 +1,269 @@
+"""
+JSON serialization of documents as MongoDB Extended JSON, relaxed (default) or canonical::
+
+    text = user.to_json()                   # '{"_id":{"$oid":"..."},"name":"...",...}'
+    text = user.to_json(mode='canonical')   # type preserving, eg. {"$numberInt":"42"}
+    user = User.from_json(text)             # either mode, validated like User(...)
+
+    with open('users.jsonl', 'w') as fp:    # one document per line, any find() or aggregate()
+        User.find({'active': True}, read_only=True).to_jsonl(fp)
+
+Each document class gets a :class:`~JSONCodec` per mode on first use, with a converter per
+field picked from its data type ahead of time: values of ``str`` and ``bool`` fields (and ``int``
+fields in relaxed mode) are passed to the JSON encoder untouched,
+``ObjectId`` and ``datetime`` fields have their own converters and embedded documents use
+the codec of their class. Values of ``list`` and ``dict`` fields, undefined fields and
+values not of their field's type are walked with a per type dispatch, falling back to
+``bson.json_util``. JSON keys are field names, not ``db_field`` names.
+
+``orjson`` is used for encoding and parsing when it is installed, the ``json`` module
+otherwise.
+"""
+import calendar
+import datetime
+import json
+import math
+
+import six
+
+from bson import json_util, ObjectId
+from bson.binary import STANDARD
+from bson.json_util import JSONMode, JSONOptions
+
+from .projection import Projection
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(default):
+    """Return a function dumping objects as compact JSON strings, ``default`` converting
+    values the encoder does not support
+    """
+    if orjson is not None:
+        return lambda obj: orjson.dumps(obj, default=default).decode('utf-8')
+    return json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=default).encode
+
+
+loads = orjson.loads if orjson is not None else json.loads
+
+MODES = ('relaxed', 'canonical')
+INT32_RANGE = (-2 ** 31, 2 ** 31)
+
+
+def encode_object_id(value):
+    return {'$oid': str(value)}
+
+
+def encode_datetime_canonical(value):
+    millis = calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+    return {'$date': {'$numberLong': str(millis)}}
+
+
+def encode_datetime_relaxed(value):
+    """ISO-8601 with millisecond precision like ``bson.json_util``, in UTC; canonical before 1970"""
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    if value.year < 1970:
+        return encode_datetime_canonical(value)
+    if value.microsecond >= 1000:
+        return {'$date': value.isoformat()[:23] + 'Z'}
+    return {'$date': value.replace(microsecond=0).isoformat() + 'Z'}
+
+
+def encode_int_canonical(value):
+    if value is True or value is False:
+        return value
+    if INT32_RANGE[0] <= value < INT32_RANGE[1]:
+        return {'$numberInt': str(value)}
+    return {'$numberLong': str(value)}
+
+
+def encode_float_relaxed(value):
+    if math.isnan(value) or math.isinf(value):
+        return {'$numberDouble': str(value).replace('inf', 'Infinity').replace('nan', 'NaN')}
+    return value
+
+
+def encode_float_canonical(value):
+    if math.isnan(value) or math.isinf(value):
+        return encode_float_relaxed(value)
+    return {'$numberDouble': repr(value)}
+
+
+class ExtendedJSON(object):
+    """Value converters of one Extended JSON mode, used for values without a field converter"""
+    def __init__(self, mode):
+        self.mode = mode
+        json_mode = JSONMode.CANONICAL if mode == 'canonical' else JSONMode.RELAXED
+        self.options = JSONOptions(json_mode=json_mode, tz_aware=False, uuid_representation=STANDARD)
+        # types passed to the JSON encoder as they are
+        self.native = set([six.text_type, bool, type(None)])
+        self.type_encoders = {ObjectId: encode_object_id}
+        if mode == 'canonical':
+            self.type_encoders.update({datetime.datetime: encode_datetime_canonical, float: encode_float_canonical})
+            self.type_encoders.update(dict((int_type, encode_int_canonical) for int_type in six.integer_types))
+        else:
+            self.type_encoders.update({datetime.datetime: encode_datetime_relaxed, float: encode_float_relaxed})
+            self.native.update(six.integer_types)
+        self.dumps = json_dumps(self.encode)
+
+    def encode(self, value):
+        """Return ``value`` with BSON types replaced by their Extended JSON form"""
+        value_type = value.__class__
+        if value_type in self.native:
+            return value
+        encoder = self.type_encoders.get(value_type)
+        if encoder is not None:
+            return encoder(value)
+        if isinstance(value, dict):
+            return dict((key, self.encode(item)) for key, item in value.items())
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        return json_util.default(value, json_options=self.options)
+
+    def decode(self, value):
+        """Return parsed JSON ``value`` with Extended JSON objects (either mode) decoded"""
+        if isinstance(value, dict):
+            decoded = dict((key, self.decode(item)) for key, item in value.items())
+            # Extended JSON objects only have $ keys
+            if decoded and next(iter(decoded))[:1] == '$':
+                return json_util.object_hook(decoded, json_options=self.options)
+            return decoded
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        return value
+
+
+EXTENDED_JSON = dict((mode, ExtendedJSON(mode)) for mode in MODES)
+
+
+def typed(python_type, encoder, fallback):
+    """Return a converter applying ``encoder`` to ``python_type`` values, ``fallback`` to others"""
+    def convert(value):
+        if isinstance(value, python_type):
+            return encoder(value)
+        return fallback(value)
+    return convert
+
+
+class JSONCodec(object):
+    """
+    Converters between documents of a document class and JSON for one Extended JSON mode,
+    see :mod:`~nanomongo.serialization`. Created on first use, see
+    :meth:`~nanomongo.document.Nanomongo.json_codec()`
+    """
+    def __init__(self, nanomongo, mode='relaxed'):
+        if mode not in MODES:
+            raise TypeError('mode expected one of %s' % (MODES,))
+        self.mode = mode
+        self.extended = EXTENDED_JSON[mode]
+        self.encoders = {}  # field name: converter, None for values passed as they are
+        self.decoders = {}  # field name: converter
+        for field_name, field in nanomongo.fields.items():
+            self.encoders[field_name], self.decoders[field_name] = self.field_converters(field)
+
+    def field_converters(self, field):
+        """Return ``(encoder, decoder)`` of values of ``field``"""
+        data_type, extended = field.data_type, self.extended
+        if getattr(data_type, '__nanoembedded__', False):
+            codec = data_type.nanomongo.json_codec(self.mode)
+            return typed(dict, codec.encode, extended.encode), typed(dict, codec.decode, extended.decode)
+        if hasattr(field, 'field_type'):
+            field_type = field.field_type
+
+            def encode_field_type(value):
+                return extended.encode(field_type.transform_python(value))
+
+            def decode_field_type(value):
+                value = extended.decode(value)
+                if value is None or isinstance(value, field_type.python_type):
+                    return value
+                return field_type.transform_bson(value)
+            return typed(field_type.python_type, encode_field_type, extended.encode), decode_field_type
+        if data_type in extended.native:  # values of other types are converted by the JSON encoder's default
+            return None, typed(dict, extended.decode, lambda value: value)
+        if data_type in extended.type_encoders:
+            encoder = extended.type_encoders[data_type]
+            decoder = {ObjectId: self.decode_object_id, datetime.datetime: self.decode_datetime}.get(data_type)
+            if decoder is not None:
+                return typed(data_type, encoder, extended.encode), typed(dict, decoder, extended.decode)
+            return typed(data_type, encoder, extended.encode), extended.decode
+        return extended.encode, extended.decode
+
+    def decode_object_id(self, value):
+        if len(value) == 1 and '$oid' in value:
+            return ObjectId(value['$oid'])
+        return self.extended.decode(value)
+
+    def decode_datetime(self, value):
+        """Parse ``YYYY-MM-DDTHH:MM:SS[.mmm]Z`` written in relaxed mode without ``strptime``,
+        other forms with ``bson.json_util``
+        """
+        date = value.get('$date') if len(value) == 1 else None
+        if isinstance(date, six.string_types) and len(date) in (20, 24) and date[10] == 'T' and date[-1] == 'Z':
+            try:
+                return datetime.datetime(int(date[:4]), int(date[5:7]), int(date[8:10]), int(date[11:13]),
+                                         int(date[14:16]), int(date[17:19]), int(date[20:23] or 0) * 1000)
+            except ValueError:
+                pass
+        return self.extended.decode(value)
+
+    def encode(self, doc):
+        """Return a ``dict`` of JSON-compatible values of document ``doc``"""
+        encoders, generic = self.encoders, self.extended.encode
+        data = {}
+        for key, value in doc.items():
+            encoder = encoders.get(key, generic)
+            data[key] = value if encoder is None or value is None else encoder(value)
+        return data
+
+    def decode(self, data):
+        """Return a ``dict`` of field values of parsed JSON ``data``"""
+        decoders, generic = self.decoders, self.extended.decode
+        return dict((key, decoders.get(key, generic)(value)) for key, value in data.items())
+
+    def dumps(self, doc):
+        """Return document ``doc`` as a JSON string"""
+        return self.extended.dumps(self.encode(doc))
+
+    def loads(self, text):
+        """Return a ``dict`` of field values of JSON string ``text``"""
+        data = loads(text)
+        if not isinstance(data, dict):
+            raise TypeError('JSON object expected, got %s' % type(data).__name__)
+        return self.decode(data)
+
+
+def write_jsonl(documents, fp, doc_class=None, mode='relaxed'):
+    """
+    Write ``documents`` (eg. a cursor) to the text file ``fp`` as JSON Lines, one Extended
+    JSON document per line, and return the number of documents written. Documents are
+    converted with the codec of their class; plain ``dict`` documents with the codec of
+    ``doc_class`` if given. Projection records are written as their fields
+    """
+    if mode not in MODES:
+        raise TypeError('mode expected one of %s' % (MODES,))
+    codecs = {}  # document type: dumps
+    count = 0
+    for doc in documents:
+        doc_type = doc.__class__
+        if doc_type not in codecs:
+            codecs[doc_type] = type_dumps(doc_type, doc_class, mode)
+        fp.write(codecs[doc_type](doc) + '\n')
+        count += 1
+    return count
+
+
+def type_dumps(doc_type, doc_class, mode):
+    """Return the function converting documents of ``doc_type`` to JSON for :func:`~write_jsonl`"""
+    if issubclass(doc_type, Projection):
+        codec = doc_type.document_class.nanomongo.json_codec(mode)
+        return lambda record: codec.dumps(record.as_dict())
+    nanomongo = getattr(doc_type, 'nanomongo', None) or getattr(doc_class, 'nanomongo', None)
+    if nanomongo is not None:
+        return nanomongo.json_codec(mode).dumps
+    extended = EXTENDED_JSON[mode]
+    return lambda doc: extended.dumps(extended.encode(doc))
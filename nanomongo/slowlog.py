@@ -0,0 +1,199 @@
+"""
+Slow operation log. Disabled by default; enable with :func:`~enable`::
+
+    from nanomongo import slowlog
+
+    log = slowlog.enable(threshold_ms=100, size=1000)
+    User.nanomongo.set_slow_threshold(20)  # per class, overrides the log's threshold
+    # optional, server durations and cursor commands through pymongo command monitoring
+    client = pymongo.MongoClient(event_listeners=[log.command_listener()])
+    ...
+    for entry in log.entries():
+        print(entry.cls, entry.operation, entry.duration_ms, entry.shape, entry.call_site)
+
+nanomongo operations (``find``, ``find_one``, ``insert``, ``save``, ``dereference`` and the
+other operations timed by :func:`~nanomongo.metrics.operation`) taking at least the
+threshold are recorded as :class:`~SlowOperation` entries in a bounded ring buffer, the
+oldest dropped first. Entries hold the query shape with values redacted (see
+:func:`~redact`), the number of documents returned or written where known and the first
+stack frame outside of nanomongo, pymongo and bson as call site.
+
+``find()`` returns a cursor, the query runs while it is iterated; the ``find`` operation is
+timed up to its first document. With the command listener registered, ``getMore`` commands
+run while iterating further are checked against the threshold by their server duration and
+attributed to the document class last seen doing ``find()`` on their namespace (or to
+``<database>.<collection>``); the call site is where the cursor is iterated.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+import bson
+import pymongo
+
+from pymongo import monitoring
+
+from . import metrics
+
+SlowOperation = collections.namedtuple('SlowOperation', [
+    'timestamp',  # time.time() of the end of the operation
+    'cls',  # document class name, or <database>.<collection> for commands of unknown classes
+    'operation',  # find, find_one, insert, save, dereference ... or the command name
+    'shape',  # query spec with values redacted, None if the operation has none
+    'count',  # documents returned or written, None if not known
+    'duration_ms',  # operation duration, the server duration for commands run while iterating
+    'server_ms',  # server duration of the operation's commands, None without command monitoring
+    'call_site',  # 'path:line in function' of the first frame outside nanomongo, pymongo and bson
+    'failed',  # True if the operation raised or the command failed
+])
+SlowOperation.__doc__ = 'An entry of the slow operation log, see :mod:`~nanomongo.slowlog`'
+
+# frames in these directories are skipped looking for the call site
+LIBRARY_DIRS = tuple(os.path.dirname(os.path.abspath(module.__file__)) + os.sep for module in (bson, pymongo, metrics))
+CURSOR_COMMANDS = ('find', 'getMore')
+
+
+def enable(threshold_ms=100, size=1000):
+    """Enable the slow operation log with a new :class:`~SlowLog` and return it"""
+    metrics.slow_log = SlowLog(threshold_ms=threshold_ms, size=size)
+    return metrics.slow_log
+
+
+def disable():
+    """Disable the slow operation log"""
+    metrics.slow_log = None
+
+
+def redact(spec):
+    """
+    Return a query spec with its keys and operators kept and values replaced by their type
+    names; ``{'age': {'$gt': 30}, 'tags': {'$in': ['a', 'b']}}`` gives ``{'age': {'$gt': '<int>'},
+    'tags': {'$in': ['<str>']}}``
+    """
+    if isinstance(spec, dict):
+        return dict((key, redact(value)) for key, value in spec.items())
+    if isinstance(spec, (list, tuple)):
+        redacted = []
+        for value in spec:
+            value = redact(value)
+            if value not in redacted:
+                redacted.append(value)
+        return redacted
+    return '<%s>' % type(spec).__name__
+
+
+def call_site(frame):
+    """Return ``'path:line in function'`` of the first frame from ``frame`` outwards outside
+    nanomongo, pymongo and bson, ``None`` if there is none
+    """
+    while frame is not None and frame.f_code.co_filename.startswith(LIBRARY_DIRS):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return '%s:%d in %s' % (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+class SlowLog(object):
+    """Keeps the last ``size`` operations slower than their threshold, see :mod:`~nanomongo.slowlog`"""
+
+    def __init__(self, threshold_ms=100, size=1000):
+        if threshold_ms is None or threshold_ms < 0 or size < 1:
+            raise TypeError('threshold_ms expected to be non-negative and size positive')
+        self.threshold_ms = threshold_ms
+        self.lock = threading.Lock()
+        self.buffer = collections.deque(maxlen=size)
+        self.namespaces = {}  # '<database>.<collection>': document class last seen doing find()
+
+    def threshold(self, cls):
+        """Return the threshold in milliseconds of document class ``cls``"""
+        threshold_ms = cls.nanomongo.slow_threshold_ms if cls is not None else None
+        return self.threshold_ms if threshold_ms is None else threshold_ms
+
+    def observe(self, op, seconds, failed=False):
+        """Record :class:`~nanomongo.metrics.Operation` ``op`` if slower than its threshold"""
+        cls = op.cls
+        if op.operation == 'find' and cls.nanomongo.database is not None:
+            namespace = '%s.%s' % (cls.nanomongo.database.name, cls.nanomongo.collection)
+            with self.lock:
+                self.namespaces[namespace] = cls
+        if seconds * 1000 < self.threshold(cls):
+            return
+        server_ms = op.server_seconds * 1000 if op.server_seconds is not None else None
+        spec = op.spec
+        if spec is not None and not isinstance(spec, dict):  # find_one(_id)
+            spec = {'_id': spec}
+        shape = redact(spec) if spec is not None else None
+        self.add(SlowOperation(time.time(), op.cls_name, op.operation, shape, op.count, seconds * 1000, server_ms,
+                               call_site(sys._getframe(1)), failed))
+
+    def observe_command(self, namespace, command_name, spec, count, seconds, failed=False):
+        """Record a cursor command run outside of a nanomongo operation if slower than the
+        threshold of its namespace's document class
+        """
+        with self.lock:
+            cls = self.namespaces.get(namespace)
+        if seconds * 1000 < self.threshold(cls):
+            return
+        shape = redact(spec) if spec is not None else None
+        self.add(SlowOperation(time.time(), cls.__name__ if cls is not None else namespace, command_name, shape,
+                               count, seconds * 1000, seconds * 1000, call_site(sys._getframe(1)), failed))
+
+    def add(self, entry):
+        with self.lock:
+            self.buffer.append(entry)
+
+    def entries(self):
+        """Return the recorded :class:`~SlowOperation` entries, oldest first"""
+        with self.lock:
+            return list(self.buffer)
+
+    def clear(self):
+        with self.lock:
+            self.buffer.clear()
+
+    def command_listener(self):
+        """Return a ``pymongo.monitoring.CommandListener`` adding server durations to operations
+        and recording slow cursor commands. Pass it to ``MongoClient(event_listeners=[...])`` or
+        ``pymongo.monitoring.register()``
+        """
+        return SlowLogListener(self)
+
+
+class SlowLogListener(monitoring.CommandListener):
+    """pymongo command listener of a :class:`~SlowLog`. Server durations of commands run in a
+    nanomongo operation are added to the operation; ``find`` and ``getMore`` commands run outside
+    of one (while iterating a cursor) are checked against the threshold on their own
+    """
+    def __init__(self, slow_log):
+        self.slow_log = slow_log
+        self.pending = {}  # request_id: Operation, or (namespace, filter) of a cursor command
+
+    def started(self, event):
+        current = getattr(metrics.context, 'current', None)
+        if current is not None:
+            self.pending[event.request_id] = current
+        elif event.command_name in CURSOR_COMMANDS:
+            collection = event.command.get('collection', event.command.get(event.command_name))
+            self.pending[event.request_id] = ('%s.%s' % (event.database_name, collection), event.command.get('filter'))
+
+    def succeeded(self, event):
+        self.finish(event, event.reply)
+
+    def failed(self, event):
+        self.finish(event, None)
+
+    def finish(self, event, reply):
+        pending = self.pending.pop(event.request_id, None)
+        if pending is None:
+            return
+        seconds = event.duration_micros / 1e6
+        if isinstance(pending, metrics.Operation):
+            pending.server_seconds = (pending.server_seconds or 0) + seconds
+            return
+        cursor = reply.get('cursor', {}) if reply else {}
+        batch = cursor.get('firstBatch', cursor.get('nextBatch'))
+        namespace, spec = pending
+        self.slow_log.observe_command(namespace, event.command_name, spec, len(batch) if batch is not None else None,
+                                      seconds, failed=reply is None)
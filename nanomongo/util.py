@@ -1,24 +1,43 @@
 import __main__
+import datetime
+import inspect
 import logging
+import random
 
 import pymongo
+import six
 
-from .errors import ExtraFieldError, ValidationError
+from pymongo import read_preferences
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
 
-ok_types = (pymongo.MongoClient, pymongo.MongoReplicaSetClient)
+from . import metrics
+from .errors import ExtraFieldError, UnsupportedOperation, ValidationError
+from .serialization import write_jsonl
 
-try:
-    import motor
-    ok_types += (motor.MotorClient,)
-except ImportError as e:
-    pass
+ok_types = (pymongo.MongoClient, pymongo.MongoReplicaSetClient)
+motor_checked = False  # motor is imported on first sight of a motor client, see valid_client()
 
-logging.basicConfig(format='[%(asctime)s] %(levelname)s [%(module)s.%(funcName)s():%(lineno)d] %(message)s')
 logger = logging.getLogger(__file__)
 
 
 def valid_client(client):
-    """Returns ``True`` if input is a pymongo or motor client or any client added with allow_client()."""
+    """Returns ``True`` if input is a pymongo or motor client or any client added with allow_client().
+
+    ``motor`` (and with it ``tornado``) is not imported along with nanomongo; it is imported
+    the first time an object from a ``motor`` module is checked.
+    """
+    global ok_types, motor_checked
+    if isinstance(client, ok_types):
+        return True
+    if motor_checked or not type(client).__module__.startswith('motor'):
+        return False
+    motor_checked = True
+    try:
+        import motor
+    except ImportError:
+        return False
+    ok_types += (motor.MotorClient,)
     return isinstance(client, ok_types)
 
 
@@ -28,6 +47,69 @@ def allow_client(client_type):
     ok_types += (client_type,)
 
 
+COLLECTION_OPTIONS = ('read_preference', 'max_staleness', 'read_concern', 'write_concern')
+READ_PREFERENCES = {
+    'primary': read_preferences.Primary,
+    'primarypreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondarypreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+
+def make_read_preference(read_preference, max_staleness=None):
+    """
+    Return a ``pymongo`` read preference from a mode name (eg. ``'secondaryPreferred'`` or
+    ``'secondary_preferred'``) or read preference instance, with ``max_staleness`` seconds applied.
+    """
+    if isinstance(read_preference, six.string_types):
+        mode = read_preference.replace('_', '').lower()
+        if mode not in READ_PREFERENCES:
+            raise TypeError('read_preference expected one of %s' % sorted(READ_PREFERENCES))
+        mode_class, tag_sets = READ_PREFERENCES[mode], None
+    elif hasattr(read_preference, 'mongos_mode'):  # pymongo read preference
+        if max_staleness is None:
+            return read_preference
+        mode_class, tag_sets = type(read_preference), read_preference.tag_sets
+    elif read_preference is None:
+        mode_class, tag_sets = read_preferences.Primary, None
+    else:
+        raise TypeError('read_preference expected mode string or pymongo read preference')
+    if mode_class is read_preferences.Primary:
+        if max_staleness not in (None, -1):
+            raise TypeError('max_staleness can not be used with primary read preference')
+        return read_preferences.Primary()
+    return mode_class(tag_sets=tag_sets, max_staleness=-1 if max_staleness is None else max_staleness)
+
+
+def make_collection_options(read_preference=None, max_staleness=None, read_concern=None, write_concern=None):
+    """
+    Return keyword arguments for ``pymongo.Collection.with_options()``.
+
+    :Keyword Arguments:
+      - `read_preference`: mode name or ``pymongo`` read preference, see :func:`~make_read_preference`
+      - `max_staleness`: seconds, for non-primary read preferences
+      - `read_concern`: level string (eg. ``'majority'``) or ``pymongo.read_concern.ReadConcern``
+      - `write_concern`: dict (eg. ``{'w': 'majority', 'j': True}``) or ``pymongo.write_concern.WriteConcern``
+    """
+    options = {}
+    if read_preference is not None or max_staleness is not None:
+        options['read_preference'] = make_read_preference(read_preference, max_staleness)
+    if isinstance(read_concern, six.string_types):
+        options['read_concern'] = ReadConcern(read_concern)
+    elif isinstance(read_concern, ReadConcern):
+        options['read_concern'] = read_concern
+    elif read_concern is not None:
+        raise TypeError('read_concern expected level string or ReadConcern')
+    if isinstance(write_concern, dict):
+        options['write_concern'] = WriteConcern(**write_concern)
+    elif isinstance(write_concern, WriteConcern):
+        options['write_concern'] = write_concern
+    elif write_concern is not None:
+        raise TypeError('write_concern expected dict or WriteConcern')
+    return options
+
+
 def valid_field(obj, field):
     """Returns ``True`` if given object (BaseDocument subclass or an instance thereof) has given field defined."""
     return object.__getattribute__(obj, 'nanomongo').has_field(field)
@@ -48,52 +130,235 @@ def check_keys(dct):
             check_keys(v)
 
 
-def check_spec(cls, spec):
+CHECK_SPEC_LEVELS = ('off', 'sampled', 'warn_once', 'warn', 'strict')
+SPEC_CACHE_SIZE = 1024  # per class, cleared when exceeded
+check_spec_config = {'level': 'warn', 'sample_rate': 0.01}
+
+
+def set_check_spec_level(level, sample_rate=None):
     """
-    Check the query spec for given class and log warnings. Not extensive, helpful to catch mistyped queries.
+    Set the global :func:`~check_spec` level, overridden by a document class' own level
+    (see :meth:`~.document.Nanomongo.set_check_spec_level`).
+
+    * ``off``: no checks
+    * ``sampled``: check and warn for a random ``sample_rate`` fraction of queries
+    * ``warn_once``: warn only the first time a query shape is seen
+    * ``warn``: warn on every query that can not match (default)
+    * ``strict``: raise :class:`~.errors.ValidationError` for queries that can not match
+    """
+    if level not in CHECK_SPEC_LEVELS:
+        raise TypeError('check_spec level expected one of %s' % (CHECK_SPEC_LEVELS,))
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise TypeError('sample_rate expected between 0 and 1')
+    check_spec_config['level'] = level
+    if sample_rate is not None:
+        check_spec_config['sample_rate'] = sample_rate
 
-    * Dotted keys (eg. ``{'foo.bar': 1}``) in spec are checked for top-level (ie. ``foo``) field existence
-    * Dotted keys are also checked for their top-level field type (must be ``dict`` or ``list``)
-    * Normal keys (eg. ``{'foo': 1}``) in spec are checked for top-level (ie. ``foo``) field existence
-    * Normal keys with non-dict queries (ie. not something like ``{'foo': {'$gte': 0, '$lte': 1}}``) are also
-      checked for their data type
+
+def spec_shape(spec):
     """
+    Return a hashable shape of a query spec; its keys, operator structure and value types
+    with the values themselves dropped. ``{'foo': 42, 'bar': {'$in': [1, 2]}}`` and
+    ``{'foo': 1337, 'bar': {'$in': [3]}}`` have the same shape.
+    """
+    if isinstance(spec, dict):
+        return tuple(sorted(((k, spec_shape(v)) for k, v in spec.items()), key=lambda item: item[0]))
+    elif isinstance(spec, (list, tuple)):
+        return (list, frozenset(spec_shape(v) for v in spec))
+    return type(spec)
+
+
+def spec_problems(cls, spec):
+    """
+    Return a tuple of ``(message_format, args)`` problems found in the query spec for given class.
+    Messages are formatted with ``(cls,) + args + (spec,)``. See :func:`~check_spec`.
+    """
+    problems = []
     for field, query in spec.items():
+        if field in ('$and', '$or', '$nor') and isinstance(query, list):
+            for sub_spec in query:
+                if isinstance(sub_spec, dict):
+                    problems.extend(spec_problems(cls, sub_spec))
+            continue
+        elif field.startswith('$'):  # $expr, $text, $where ... not checked
+            continue
         f = field.split('.')[0]
         if not cls.nanomongo.has_field(f):  # field existence
-            logging.warning('%s has no field "%s" defined, spec %s can not match', cls, f, spec)
+            problems.append(('%s has no field "%s" defined, spec %s can not match', (f,)))
             continue
 
         dtype = cls.nanomongo.fields[f].data_type
         query_type = type(query)
         if '.' not in field and query_type != dict and query_type != dtype:
             # simple query type mismatch
-            logging.warning('%s field "%s" has type %s, spec %s can not match', cls, f, dtype, spec)
-        elif '.' in field and dtype not in (dict, list):
+            problems.append(('%s field "%s" has type %s, spec %s can not match', (f, dtype)))
+        elif '.' in field and not issubclass(dtype, (dict, list)):
             # top-level field not a dict or list
-            logging.warning('%s field "%s" is not of type %s, spec %s can not match', cls, f, (dict, list), spec)
+            problems.append(('%s field "%s" is not of type %s, spec %s can not match', (f, (dict, list))))
+        elif '.' in field and getattr(dtype, '__nanoembedded__', False):
+            # embedded document, check the rest against its fields
+            problems.extend(spec_problems(dtype, {field.split('.', 1)[1]: query}))
+    return tuple(problems)
+
+
+def check_spec(cls, spec):
+    """
+    Check the query spec for given class and log warnings. Not extensive, helpful to catch mistyped queries.
+
+    * Dotted keys (eg. ``{'foo.bar': 1}``) in spec are checked for top-level (ie. ``foo``) field existence
+    * Dotted keys are also checked for their top-level field type (must be ``dict`` or ``list``)
+    * Normal keys (eg. ``{'foo': 1}``) in spec are checked for top-level (ie. ``foo``) field existence
+    * Normal keys with non-dict queries (ie. not something like ``{'foo': {'$gte': 0, '$lte': 1}}``) are also
+      checked for their data type
+    * Specs under ``$and``, ``$or`` and ``$nor`` are checked the same way, other top-level operators are not
+
+    Results are cached per class by :func:`~spec_shape` so each query shape is checked once.
+    What happens with problems found depends on the check level, see :func:`~set_check_spec_level`.
+    """
+    nanomongo = cls.nanomongo
+    level = nanomongo.check_spec_level or check_spec_config['level']
+    if 'off' == level or ('sampled' == level and random.random() >= check_spec_config['sample_rate']):
+        return
+    shape = spec_shape(spec)
+    cache = nanomongo.spec_cache
+    if shape in cache:
+        problems, seen = cache[shape], True
+    else:
+        if len(cache) >= SPEC_CACHE_SIZE:
+            cache.clear()
+        problems, seen = spec_problems(cls, spec), False
+        cache[shape] = problems
+    if not problems or ('warn_once' == level and seen):
+        return
+    if 'strict' == level:
+        fmt, args = problems[0]
+        raise ValidationError(fmt % ((cls,) + args + (spec,)))
+    for fmt, args in problems:
+        logging.warning(fmt, *((cls,) + args + (spec,)))
+
+
+NUMERIC_UPDATE_OPERATORS = ('$inc', '$mul')
+ARRAY_UPDATE_OPERATORS = ('$push', '$addToSet', '$pull', '$pullAll', '$pop')
+
+
+def check_update(cls, update):
+    """
+    Check update operators against fields of given class, raise :class:`~.errors.ValidationError`
+    for updates that would leave the document invalid.
+
+    * Only update operators (eg. ``$set``) are allowed at the top level
+    * Fields must be defined, dotted keys need a ``dict`` or ``list`` top-level field
+    * ``$set`` and ``$setOnInsert`` values of top-level fields are validated, required fields can not be ``$unset``
+    * ``$inc`` and ``$mul`` need numeric fields, array operators ``list`` fields
+      and ``$currentDate`` a datetime field
+    """
+    if not isinstance(update, dict) or not update:
+        raise ValidationError('update operators expected, got %s' % (update,))
+    for operator, fields in update.items():
+        if not operator.startswith('$'):
+            raise ValidationError('update operators expected, got "%s"' % operator)
+        if not isinstance(fields, dict):
+            raise ValidationError('%s expects a document, got %s' % (operator, fields))
+        for field, value in fields.items():
+            top_level = field.split('.')[0]
+            if not cls.nanomongo.has_field(top_level):
+                raise ValidationError('%s has no field "%s" defined: %s' % (cls, top_level, {operator: fields}))
+            field_def = cls.nanomongo.fields[top_level]
+            dtype = field_def.data_type
+            if '.' in field:
+                if not issubclass(dtype, (dict, list)):
+                    raise ValidationError('"%s" is not of type %s: %s' % (top_level, (dict, list), {operator: fields}))
+            elif operator in ('$set', '$setOnInsert'):
+                field_def.validator(value, field_name=field)
+            elif '$unset' == operator and field_def.required:
+                raise ValidationError('Can not unset required field "%s"' % field)
+            elif operator in NUMERIC_UPDATE_OPERATORS and dtype not in (int, float):
+                raise ValidationError('Cannot apply %s to non-numeric field: %s=%s' % (operator, field, dtype))
+            elif operator in ARRAY_UPDATE_OPERATORS and list != dtype:
+                raise ValidationError('Cannot apply %s modifier to non-array: %s=%s' % (operator, field, dtype))
+            elif '$currentDate' == operator and datetime.datetime != dtype:
+                raise ValidationError('Cannot apply $currentDate to non-datetime field: %s=%s' % (field, dtype))
+
+
+SHAPE_PRESERVING_STAGES = ('$match', '$sort', '$limit', '$skip', '$sample')
+
+
+def check_pipeline(cls, pipeline):
+    """
+    Run :func:`~check_spec` on ``$match`` stages of an aggregation pipeline for given class.
+    Stops at the first stage that may reshape documents (eg. ``$project``, ``$group``) since
+    later stages no longer see documents of the class
+    """
+    if not isinstance(pipeline, (list, tuple)):
+        raise TypeError('pipeline expected to be a list of stages, got %s' % (pipeline,))
+    for stage in pipeline:
+        if not isinstance(stage, dict) or 1 != len(stage):
+            raise TypeError('pipeline stage expected to be a single key dict, got %s' % (stage,))
+        operator, value = next(iter(stage.items()))
+        if operator not in SHAPE_PRESERVING_STAGES:
+            return
+        if '$match' == operator and isinstance(value, dict):
+            check_spec(cls, value)
+
+
+def recording(value):
+    """Return a ``dict`` value as a :class:`~RecordingDict` so its changes are tracked. Instances
+    of :class:`~RecordingDict` subclasses (eg. embedded documents) are returned as they are
+    """
+    if isinstance(value, dict) and (RecordingDict is type(value) or not isinstance(value, RecordingDict)):
+        return RecordingDict(value)
+    return value
+
+
+def restore(cls, data, diff=None):
+    """Unpickle :class:`~RecordingDict` (subclass) instances, see :meth:`~RecordingDict.__reduce__()`"""
+    obj = cls.__new__(cls)
+    dict.update(obj, data)
+    obj._nanodiff = diff
+    return obj
+
+
+MISSING = object()  # dict.get() default telling missing keys apart from None values
 
 
 class RecordingDict(dict):
     """
     A dict subclass modifying ``dict.__setitem__()`` and ``dict.__delitem__()`` methods to record changes
     internally in its ``__nanodiff__`` attribute.
+
+    The diff is kept in a slot and only allocated when the first change is recorded; it is
+    freed by :meth:`~reset_diff()`, so unchanged (eg. loaded) documents and their nested dicts
+    carry no tracking state.
     """
+    __slots__ = ('_nanodiff',)  # None while there are no recorded changes
+
     def __init__(self, *args, **kwargs):
         super(RecordingDict, self).__init__(*args, **kwargs)
-        self.__nanodiff__ = {
-            '$set': {}, '$unset': {}, '$addToSet': {},
-        }
+        self._nanodiff = None
+
+    @property
+    def __nanodiff__(self):
+        """Recorded changes as ``{'$set': {...}, '$unset': {...}, '$addToSet': {...}}``,
+        allocated on first access
+        """
+        if self._nanodiff is None:
+            self._nanodiff = {'$set': {}, '$unset': {}, '$addToSet': {}}
+        return self._nanodiff
+
+    def __reduce__(self):
+        """Pickle as ``(class, data, pending diff)``; unpickling restores both without calling
+        ``__init__`` (no validation) and without recording the restored items as changes.
+        Nested :class:`~RecordingDict` values keep their own diffs the same way
+        """
+        return restore, (self.__class__, dict(self), self._nanodiff)
 
     def __setitem__(self, key, value):
         """Override the dict method so we can track changes."""
-        try:
-            no_change = self[key] == value  # same value
-        except KeyError:
-            no_change = False  # never set
-        if no_change:
+        # dict.get() does not call __missing__, unloaded cold fields are not fetched to be replaced
+        current = dict.get(self, key, MISSING)
+        if current is not MISSING and current == value:  # same value
             return
-        value = RecordingDict(value) if isinstance(value, dict) else value
+        value = recording(value)
         super(RecordingDict, self).__setitem__(key, value)
         self.__nanodiff__['$set'][key] = value
         self.clear_other_modifiers('$set', key)
@@ -109,43 +374,40 @@ class RecordingDict(dict):
         Given ``current_mod``, removes other ``field_name`` modifiers, eg. when called with ``$set``,
         removes ``$unset`` and ``$addToSet`` etc. on ``field_name``.
         """
-        for mod, updates in self.__nanodiff__.items():
-            if mod == current_mod:
-                continue
-            if field_name in updates:
-                del self.__nanodiff__[mod][field_name]
+        for mod, updates in (self._nanodiff or {}).items():
+            if mod != current_mod and field_name in updates:
+                del updates[field_name]
 
     def reset_diff(self):
         """
         Reset ``__nanodiff__`` recursively. To be used after saving diffs.
         This does NOT do a rollback. Reload from db for that.
         """
-        nanodiff_base = {'$set': {}, '$unset': {}, '$addToSet': {}}
-        self.__nanodiff__ = nanodiff_base
-        for field_name, field_value in self.items():
+        self._nanodiff = None
+        for field_value in dict.values(self):
             if isinstance(field_value, RecordingDict):
                 field_value.reset_diff()
 
     def get_sub_diff(self):
         """
         Find fields of :class:`~RecordingDict` type, iterate over their diff and build dotted
-        keys to be merged into top level diff.
+        keys to be merged into top level diff. Nested :class:`~RecordingDict` values (eg.
+        embedded documents in embedded documents) are followed unless they are ``$set`` as a whole.
         """
         diff = {'$set': {}, '$unset': {}, '$addToSet': {}}
-        for field_name, field_value in self.items():
-            if isinstance(field_value, RecordingDict):
-                sets = field_value.__nanodiff__['$set']
-                unsets = field_value.__nanodiff__['$unset']
-                addtosets = field_value.__nanodiff__['$addToSet']
-                for k, v in sets.items():
-                    dotkey = '%s.%s' % (field_name, k)
-                    diff['$set'][dotkey] = v
-                for k, v in unsets.items():
-                    dotkey = '%s.%s' % (field_name, k)
-                    diff['$unset'][dotkey] = v
-                for k, v in addtosets.items():
-                    dotkey = '%s.%s' % (field_name, k)
-                    diff['$addToSet'][dotkey] = v
+        stack = [(self, '')]  # (RecordingDict, dotted key prefix)
+        while stack:
+            node, prefix = stack.pop()
+            is_set = node._nanodiff['$set'] if node._nanodiff else ()
+            for field_name, field_value in dict.items(node):
+                if isinstance(field_value, RecordingDict) and field_name not in is_set:
+                    dotted = prefix + field_name + '.'
+                    for operator, updates in (field_value._nanodiff or {}).items():
+                        if updates:
+                            target = diff[operator]
+                            for k, v in updates.items():
+                                target[dotted + k] = v
+                    stack.append((field_value, dotted))
         return diff
 
     def check_can_update(self, modifier, field_name):
@@ -153,7 +415,7 @@ class RecordingDict(dict):
         added. MongoDB does not allow field duplication with update
         modifiers. This is to be used with methods :meth:`~.document.BaseDocument.add_to_set()` ...
         """
-        for mod, updates in self.__nanodiff__.items():
+        for mod, updates in (self._nanodiff or {}).items():
             if mod == modifier:
                 continue
             if field_name in updates:
@@ -163,6 +425,37 @@ class RecordingDict(dict):
                 raise ValidationError(err_str)
 
 
+class FrozenDict(dict):
+    """A dict rejecting changes with :class:`~nanomongo.errors.UnsupportedOperation`, used for
+    read-only documents. Holds no tracking state
+    """
+    __slots__ = ()
+
+    def read_only(self, *args, **kwargs):
+        raise UnsupportedOperation('%s is read-only' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = read_only
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+
+def freeze(value):
+    """Replace ``dict`` values of ``value`` (a dict) with :class:`~FrozenDict` copies, recursively,
+    in place; the replaced dicts are left unchanged. Lists are left as they are
+    """
+    for key, sub_value in value.items():
+        if isinstance(sub_value, dict) and not isinstance(sub_value, FrozenDict):
+            dict.__setitem__(value, key, freeze(FrozenDict(sub_value)))
+    return value
+
+
+def thaw(value):
+    """Return a copy of a :class:`~FrozenDict` with nested frozen dicts as plain dicts"""
+    return dict((key, thaw(sub_value) if isinstance(sub_value, FrozenDict) else sub_value)
+                for key, sub_value in value.items())
+
+
 class DotNotationMixin(object):
     """Mixin to make dot notation available on dictionaries"""
 
@@ -208,6 +501,110 @@ class DotNotationMixin(object):
                                  (self.__class__.__name__, key))
 
 
+class TypedCursor(object):
+    """Wraps a pymongo cursor (eg. the ``CommandCursor`` of an aggregation) and casts each
+    document with ``cast``, ``None`` for documents as they are. Batches are still fetched
+    from the server as iterated. Indexing, slicing, ``clone()``, ``rewind()`` and chained
+    calls (eg. ``sort()``) keep the wrapping
+    """
+    def __init__(self, cursor, cast=None):
+        self.cursor = cursor
+        self.cast = cast
+
+    def __getattr__(self, name):
+        """Delegate to the wrapped cursor, chained calls (eg. ``sort()``) keep the cast"""
+        attr = getattr(self.cursor, name)
+        if not inspect.isroutine(attr):  # eg. the collection, callable but not a method
+            return attr
+
+        def chained(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            return self if result is self.cursor else result
+        return chained
+
+    def wrap(self, cursor):
+        """Return ``cursor`` (eg. a clone of the wrapped cursor) wrapped like this one"""
+        return self.__class__(cursor, self.cast)
+
+    def decode(self, doc):
+        return doc if self.cast is None else self.cast(doc)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.decode(next(self.cursor))
+
+    next = __next__
+
+    def __getitem__(self, index):
+        """``cursor[index]`` returns a document, ``cursor[start:stop]`` applies skip and limit"""
+        result = self.cursor[index]
+        return self if result is self.cursor else self.decode(result)
+
+    def clone(self):
+        return self.wrap(self.cursor.clone())
+
+    def rewind(self):
+        self.cursor.rewind()
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def alive(self):
+        return self.cursor.alive
+
+    def close(self):
+        self.cursor.close()
+
+    def to_jsonl(self, fp, mode='relaxed'):
+        """Write the remaining documents to the text file ``fp`` as Extended JSON lines,
+        return the number written. See :func:`~nanomongo.serialization.write_jsonl`
+        """
+        return write_jsonl(self, fp, mode=mode)
+
+
+class TimedCursor(TypedCursor):
+    """The cursor of :meth:`~nanomongo.document.BaseDocument.find()`, times a ``find`` operation
+    of ``doc_class`` (see :func:`~nanomongo.metrics.operation`) around fetching the first
+    document, when the query is sent to the server. Rewinding starts over, ``cursor[index]``
+    is timed as a query of its own
+    """
+    def __init__(self, cursor, cast, doc_class, spec=None):
+        super(TimedCursor, self).__init__(cursor, cast)
+        self.doc_class, self.spec = doc_class, spec
+        self.started = False
+
+    def wrap(self, cursor):
+        return self.__class__(cursor, self.cast, self.doc_class, self.spec)
+
+    def __next__(self):
+        if self.started:
+            return self.decode(next(self.cursor))
+        self.started = True
+        with metrics.operation(self.doc_class, 'find', self.spec):
+            for doc in self.cursor:
+                return self.decode(doc)
+        raise StopIteration
+
+    next = __next__
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return super(TimedCursor, self).__getitem__(index)
+        with metrics.operation(self.doc_class, 'find', self.spec):
+            return super(TimedCursor, self).__getitem__(index)
+
+    def rewind(self):
+        self.started = False
+        return super(TimedCursor, self).rewind()
+
+
 class NanomongoSONManipulator(pymongo.son_manipulator.SONManipulator):
     """A pymongo SON Manipulator used on data that comes from the database
     to transform data to the document class we want because `as_class`
@@ -228,10 +625,14 @@ class NanomongoSONManipulator(pymongo.son_manipulator.SONManipulator):
         return True
 
     def transform_outgoing(self, son, collection):
+        son = self.as_class.nanomongo.from_db(son)
         if hasattr(self, 'transforms'):
             for field, transformer in self.transforms.items():
                 son[field] = transformer(son[field])
         try:
-            return self.as_class(son)
+            doc = self.as_class(son)
         except ExtraFieldError:
             return son
+        if metrics.collector is not None:
+            metrics.documents_decoded(self.as_class)
+        return doc
@@ -0,0 +1,160 @@
+"""
+Write-behind queue for high-volume inserts, for documents (events, audit logs ...) that
+do not need to wait for their insert round trip. Documents are validated synchronously,
+queued and inserted by a background thread with ``insert_many`` once ``batch_size``
+documents are queued or ``flush_interval`` seconds passed since the first queued one.
+::
+
+    event.insert(deferred=True)  # uses Event.writer()
+    writer = Event.writer(batch_size=1000, flush_interval=0.5, on_error=report)
+    writer.put(event)
+    writer.flush()  # blocks until everything queued so far is written
+
+The queue is bounded by ``max_queue``; :meth:`~DeferredWriter.put` blocks while it is full.
+Writers are flushed and closed on interpreter exit. Queued documents should not be modified
+until they are written.
+"""
+import atexit
+import logging
+import threading
+import time
+import weakref
+
+from six.moves import queue
+
+from . import metrics
+from .errors import UnsupportedOperation
+
+FLUSH, CLOSE = object(), object()  # queue sentinels
+open_writers = weakref.WeakSet()  # closed on interpreter exit, closed writers are dropped
+
+
+@atexit.register
+def close_all():
+    """Flush and close the open writers, run on interpreter exit"""
+    for writer in list(open_writers):
+        writer.close()
+
+
+def log_error(exception, documents):
+    """Default ``on_error`` callback, logs the failure"""
+    logging.error('deferred insert of %d documents failed: %r', len(documents), exception)
+
+
+class DeferredWriter(object):
+    """
+    Queues validated documents of a document class and inserts them in batches from a
+    background thread.
+
+    :Keyword Arguments:
+      - `batch_size`: maximum documents per ``insert_many`` (default: 500)
+      - `flush_interval`: maximum seconds a document waits in the queue (default: 1.0)
+      - `max_queue`: queue bound, :meth:`~put` blocks when full (default: 10000)
+      - `on_error`: ``callable(exception, documents)`` called when a batch fails,
+        logs the error by default
+      - `ordered`: passed to ``insert_many`` (default: ``True``, ``False`` for time-series
+        collections). Batches of time-series collections are grouped by ``metaField`` and
+        sorted by ``timeField``, see :meth:`~nanomongo.document.Nanomongo.order_batch()`
+    """
+    def __init__(self, doc_class, batch_size=500, flush_interval=1.0, max_queue=10000, on_error=None,
+                 ordered=None):
+        if batch_size < 1 or max_queue < 1:
+            raise TypeError('batch_size and max_queue expected to be positive')
+        self.doc_class = doc_class
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.on_error = on_error or log_error
+        self.ordered = ordered
+        self.closed = False
+        self.thread = None
+        self.lock = threading.Lock()
+        open_writers.add(self)
+
+    def start(self):
+        with self.lock:
+            self.start_locked()
+
+    def start_locked(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='nanomongo-writer-%s' % self.doc_class.__name__)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def put(self, doc, block=True, timeout=None):
+        """Run auto updates, validate and queue ``doc``. Blocks while the queue is full
+        unless ``block=False``; raises ``queue.Full`` if it is still full after ``timeout``.
+        Raises :class:`~nanomongo.errors.UnsupportedOperation` once the writer is closed
+        """
+        if self.closed:
+            raise UnsupportedOperation('writer is closed')
+        if not isinstance(doc, self.doc_class):
+            raise TypeError('%s instance expected' % self.doc_class)
+        with metrics.operation(self.doc_class, 'insert_deferred') as op:
+            with op.phase('run_auto_updates'):
+                doc.run_auto_updates()
+            with op.phase('validate_all'):
+                doc.validate_all()
+            doc.validate()
+        with self.lock:  # close() queues its marker under the lock, nothing is queued after it
+            if self.closed:
+                raise UnsupportedOperation('writer is closed')
+            self.start_locked()
+            self.queue.put(doc, block=block, timeout=timeout)
+
+    def flush(self):
+        """Write all queued documents now, block until they are written. Closed writers have
+        nothing left to write, flushing them returns right away
+        """
+        with self.lock:
+            if self.closed or self.thread is None or not self.thread.is_alive():
+                return
+            self.queue.put(FLUSH)
+        self.queue.join()
+
+    def close(self):
+        """Flush and stop the background thread. Called on interpreter exit"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self.thread is not None:
+                self.queue.put(CLOSE)
+        open_writers.discard(self)
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        batch, deadline = [], None
+        while True:
+            timeout = max(0, deadline - time.time()) if batch else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # flush_interval passed
+            if item is not None and item is not FLUSH and item is not CLOSE:
+                batch.append(item)
+                if 1 == len(batch):
+                    deadline = time.time() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self.write(batch)
+                for _ in batch:
+                    self.queue.task_done()
+                batch = []
+            if item is FLUSH or item is CLOSE:
+                self.queue.task_done()
+            if item is CLOSE:
+                return
+
+    def write(self, batch):
+        """Insert a batch, report failures to ``on_error``"""
+        try:
+            with metrics.operation(self.doc_class, 'insert_many') as op:
+                self.doc_class.nanomongo.insert_batch(batch, op, ordered=self.ordered)
+        except Exception as e:  # keep the thread alive
+            try:
+                self.on_error(e, batch)
+            except Exception:
+                logging.exception('deferred writer on_error callback failed')
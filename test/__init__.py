@@ -1,5 +1,7 @@
 import pymongo
 
+from nanomongo.util import allow_client
+
 PYMONGO_CLIENT = pymongo.MongoClient(serverSelectionTimeoutMS=500)
 
 try:
@@ -8,3 +10,110 @@ except pymongo.errors.ServerSelectionTimeoutError:
     PYMONGO_CLIENT = None
 
 TEST_DBNAME = 'nanotestdb'
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+else:
+    allow_client(mongomock.MongoClient)
+
+
+def use_mongomock(*doc_classes, **kwargs):
+    """Set a new mongomock client, shared by ``doc_classes``, and the test database; returns
+    the client. mongomock does not support SON manipulators, so classes are not registered
+    unless ``register=True``, which registers them with a stubbed manipulator, see
+    :class:`~ManipulatedDatabase`
+    """
+    register = kwargs.pop('register', False)
+    client = kwargs.pop('client', None) or mongomock.MongoClient()
+    for doc_class in doc_classes:
+        doc_class.nanomongo.set_client(client)
+        doc_class.nanomongo.set_db(TEST_DBNAME)
+        if register:
+            doc_class.nanomongo.database = ManipulatedDatabase(doc_class.nanomongo.database)
+            doc_class.register(**kwargs)
+    return client
+
+
+class ManipulatedDatabase(object):
+    """mongomock database stub applying added SON manipulators to the documents its
+    collections return, like pymongo 3 does unless ``manipulate=False``
+    """
+    def __init__(self, database):
+        self.database = database
+        self.manipulators = []
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def add_son_manipulator(self, manipulator):
+        self.manipulators.append(manipulator)
+
+    def get_collection(self, name, **kwargs):
+        return ManipulatedCollection(self, self.database.get_collection(name, **kwargs))
+
+    def transform_outgoing(self, son, collection):
+        if isinstance(son, dict):
+            for manipulator in self.manipulators:
+                son = manipulator.transform_outgoing(son, collection)
+        return son
+
+
+class ManipulatedCollection(object):
+    """Collection of :class:`~ManipulatedDatabase`, ``find()`` and ``find_one()`` results are
+    manipulated; results of ``find_one_and_*`` commands are not, as in pymongo
+    """
+    def __init__(self, database, collection):
+        self.database = database
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def __eq__(self, other):
+        return isinstance(other, ManipulatedCollection) and self.collection == other.collection
+
+    def __ne__(self, other):
+        return not self == other
+
+    def with_options(self, **kwargs):
+        return ManipulatedCollection(self.database, self.collection.with_options(**kwargs))
+
+    def transform(self, son, manipulate):
+        return self.database.transform_outgoing(son, self) if manipulate else son
+
+    def find(self, *args, **kwargs):
+        manipulate = kwargs.pop('manipulate', True)
+        return ManipulatedCursor(self.collection.find(*args, **kwargs), lambda son: self.transform(son, manipulate))
+
+    def find_one(self, *args, **kwargs):
+        manipulate = kwargs.pop('manipulate', True)
+        return self.transform(self.collection.find_one(*args, **kwargs), manipulate)
+
+
+class ManipulatedCursor(object):
+    def __init__(self, cursor, transform):
+        self.cursor = cursor
+        self.transform = transform
+
+    def __getattr__(self, name):
+        attr = getattr(self.cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args, **kwargs):  # sort(), limit() ... return the cursor
+            result = attr(*args, **kwargs)
+            return self if result is self.cursor else result
+        return chained
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.transform(next(self.cursor))
+
+    next = __next__
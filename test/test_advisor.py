@@ -0,0 +1,103 @@
+import threading
+import unittest
+
+import pymongo
+import six
+
+from nanomongo.advisor import IndexAdvisor, classify_spec, explain_summary, match_index
+from nanomongo.field import Field
+from nanomongo.document import BaseDocument
+
+from . import PYMONGO_CLIENT, TEST_DBNAME
+
+
+class Doc(BaseDocument):
+    foo = Field(six.text_type)
+    bar = Field(int)
+    moo = Field(int, required=False)
+
+    __indexes__ = [
+        pymongo.IndexModel([('foo', pymongo.ASCENDING), ('bar', pymongo.DESCENDING), ('moo', pymongo.ASCENDING)]),
+    ]
+
+
+class AdvisorTestCase(unittest.TestCase):
+    def test_classify_spec(self):
+        spec = {'foo': 'a', 'bar': {'$in': [1, 2]}, 'moo': {'$gte': 1}, 'sub': {'x': 1}, '$or': []}
+        self.assertEqual(({'foo', 'bar', 'sub'}, {'moo'}, {'$or'}), classify_spec(spec))
+
+    def test_match_index(self):
+        key = [('foo', 1), ('bar', -1), ('moo', 1)]
+        # equality, sort, range
+        self.assertEqual(('optimal', []), match_index(key, {'foo'}, [('bar', -1)], {'moo'}))
+        self.assertEqual(('optimal', []), match_index(key, {'foo'}, [('bar', 1)], set()))  # reversed
+        self.assertEqual(('optimal', []), match_index(key, set(), [('foo', 1)], set()))
+        status, reasons = match_index(key, {'foo'}, [('moo', 1)], set())
+        self.assertEqual(('partial', ['in-memory sort']), (status, reasons))
+        status, reasons = match_index(key, {'foo', 'other'}, None, set())
+        self.assertEqual('partial', status)
+        self.assertEqual(["equality fields not in index prefix: ['other']"], reasons)
+        self.assertEqual('collscan', match_index(key, {'bar'}, None, {'moo'})[0])
+
+    def test_report(self):
+        advisor = IndexAdvisor(Doc.nanomongo)
+        advisor.observe({'foo': 'a', 'bar': 1})
+        advisor.observe({'foo': 'b', 'bar': 2})
+        advisor.observe({'bar': 1})
+        advisor.observe({'foo': 'a'}, sort=[('moo', 1)])
+        advisor.observe(None)
+        advisor.observe('some _id value')
+        report = advisor.report()
+        self.assertEqual(['collscan', 'partial', 'unfiltered', 'optimal', 'optimal'],
+                         [entry['status'] for entry in report])
+        self.assertEqual({'bar': 'equality'}, report[0]['filter'])
+        self.assertEqual(None, report[0]['index'])
+        self.assertEqual([('moo', 1)], report[1]['sort'])
+        self.assertEqual([2, 1], [entry['count'] for entry in report[3:]])
+        self.assertEqual([('_id', 1)], report[4]['index'])
+        advisor.reset()
+        self.assertEqual([], advisor.report())
+
+    def test_concurrent_observe(self):
+        advisor = IndexAdvisor(Doc.nanomongo)
+
+        def observe():
+            for n in range(1000):
+                advisor.observe({'foo': 'a', 'bar': n})
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([4000], [entry['count'] for entry in advisor.report()])
+
+    def test_explain_summary(self):
+        explain = {
+            'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}},
+            'executionStats': {'nReturned': 2, 'totalDocsExamined': 100},
+        }
+        summary = explain_summary(explain)
+        self.assertEqual(['SORT', 'COLLSCAN'], summary['stages'])
+        self.assertTrue(summary['collscan'])
+        self.assertEqual(50.0, summary['examined_ratio'])
+
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_advisor_explain(self):
+        """Pymongo: Test advisor with explain on find/find_one"""
+
+        class AdvisedDoc(Doc):
+            pass
+        PYMONGO_CLIENT.drop_database(TEST_DBNAME)
+        AdvisedDoc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+        AdvisedDoc.nanomongo.set_index_advisor(explain=True)
+        for i in range(10):
+            AdvisedDoc(foo=six.u('foo'), bar=i).insert()
+        list(AdvisedDoc.find({'bar': 1}))
+        AdvisedDoc.find_one({'foo': 'foo', 'bar': 1})
+        collscan, optimal = AdvisedDoc.nanomongo.advisor.report()
+        self.assertTrue(collscan['explain']['collscan'])
+        self.assertEqual(10, collscan['explain']['docs_examined'])
+        self.assertFalse(optimal['explain']['collscan'])
+        AdvisedDoc.nanomongo.set_index_advisor(enabled=False)
+        self.assertEqual(None, AdvisedDoc.nanomongo.advisor)
@@ -0,0 +1,80 @@
+import unittest
+
+import six
+
+from mock import patch
+
+from nanomongo.bucket import Buckets, BucketList
+from nanomongo.document import BaseDocument
+from nanomongo.errors import UnsupportedOperation
+from nanomongo.field import Field
+from nanomongo.util import NanomongoSONManipulator
+
+from . import mongomock, use_mongomock
+
+
+class Entry(BaseDocument):
+    title = Field(six.text_type)
+    comment_count = Field(int, default=0, db_field='cc')
+    comments = Buckets(size=2, count_field='comment_count')
+    views = Buckets(size=3, collection='entry_views')
+
+
+class BucketTestCase(unittest.TestCase):
+    def test_definition(self):
+        self.assertTrue(isinstance(Entry.comments, Buckets))
+        self.assertEqual(['comments', 'views'], sorted(Entry.nanomongo.buckets))
+        self.assertEqual(('comments', Entry), (Entry.comments.name, Entry.comments.doc_class))
+        self.assertTrue(isinstance(Entry(title=six.u('t')).comments, BucketList))
+        for kwargs in ({'size': 0}, {'collection': ''}):
+            self.assertRaises(TypeError, Buckets, **kwargs)
+        fields = {'title': Field(six.text_type), 'count': Field(int)}
+        for attrs in ({'b': Buckets(count_field='title')}, {'b': Buckets(count_field='undefined')}):
+            self.assertRaises(TypeError, type, *('Bad', (BaseDocument,), dict(fields, **attrs)))
+        self.assertRaises(TypeError, type, *('Bad', (Entry,), {'title': Buckets()}))  # inherited field
+
+        class Child(Entry):
+            extra = Field(int, required=False)
+
+        self.assertEqual(Entry.nanomongo.buckets, Child.nanomongo.buckets)
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_buckets(self):
+        use_mongomock(Entry)
+        entry = Entry(title=six.u('t'))
+        self.assertRaises(UnsupportedOperation, entry.comments.push, *({'text': 'x'},))
+        entry.insert()
+        self.assertRaises(UnsupportedOperation, setattr, *(entry, 'comments', []))
+        entry.comments.extend({'n': n} for n in range(5))
+        entry.views.push(1)
+        self.assertEqual(5, entry.comments.count())
+        self.assertEqual({'_id': entry['_id'], 'title': 't', 'cc': 5}, Entry.get_collection().find_one())
+        self.assertEqual(None, entry._nanodiff)
+        buckets = Entry.get_collection().database['entry_comments']
+        self.assertEqual([2, 2, 1], [bucket['count'] for bucket in buckets.find(sort=[('_id', 1)])])
+        self.assertEqual(list(range(5)), [comment['n'] for comment in entry.comments])
+        self.assertEqual(list(range(4, -1, -1)), [comment['n'] for comment in entry.comments.items(reverse=True)])
+        self.assertEqual(([1], 1), (list(entry.views), len(entry.views)))  # counted from buckets
+        other = Entry(title=six.u('o'))
+        other.insert()
+        self.assertEqual((0, []), (len(other.views), list(other.comments)))
+        entry.comments.clear()
+        self.assertEqual((0, 0, 0), (len(entry.comments), buckets.count_documents({}),
+                                     Entry.get_collection().find_one({'_id': entry['_id']})['cc']))
+        Entry.comments.create_indexes()
+        self.assertTrue('parent_1__id_1' in buckets.index_information())
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_registered(self):
+        use_mongomock(Entry, register=True)  # creates the bucket indexes
+        self.assertTrue('parent_1__id_1' in Entry.comments.get_collection().index_information())
+        entry = Entry(title=six.u('t'))
+        entry.insert()
+        entry.comments.extend([{'n': 1}, {'n': 2}, {'n': 3}])
+        self.assertTrue(isinstance(Entry.find_one(entry['_id']), Entry))
+        with patch.object(NanomongoSONManipulator, 'transform_outgoing', autospec=True,
+                          side_effect=lambda manipulator, son, collection: son) as transform_outgoing:
+            self.assertEqual([1, 2, 3], [comment['n'] for comment in entry.comments])
+            self.assertEqual(3, len(entry.comments))
+            self.assertEqual(0, transform_outgoing.call_count)  # bucket documents are not manipulated
+        self.assertEqual([2, 1], [bucket['count'] for bucket in Entry.comments.get_collection().find(sort=[('_id', 1)])])
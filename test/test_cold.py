@@ -0,0 +1,156 @@
+import unittest
+
+import six
+
+from bson import ObjectId
+from mock import patch
+from pymongo.errors import BulkWriteError, OperationFailure
+from pymongo.results import InsertOneResult
+
+from nanomongo.cold import ColdCursor, split, split_update
+from nanomongo.document import BaseDocument, EmbeddedDocument
+from nanomongo.errors import UnsupportedOperation
+from nanomongo.field import Field
+
+from . import mongomock, use_mongomock
+
+
+class Page(BaseDocument):
+    url = Field(six.text_type)
+    title = Field(six.text_type)
+    html = Field(six.text_type, cold=True, db_field='h')
+    raw = Field(dict, required=False, cold=True)
+
+
+class ColdTestCase(unittest.TestCase):
+    def test_definition(self):
+        self.assertEqual((set(['html', 'raw']), set(['h', 'raw'])),
+                         (Page.nanomongo.cold_fields, Page.nanomongo.cold_db_keys))
+        self.assertEqual(['html', 'raw'], Page.nanomongo.cold_field_names(True))
+        self.assertEqual([], Page.nanomongo.cold_field_names(None))
+        self.assertRaises(TypeError, Page.nanomongo.cold_field_names, *(['title'],))
+        self.assertRaises(TypeError, Page.projection, *('html',))
+        self.assertRaises(TypeError, Field, *(six.text_type,), **{'cold': True, 'default': six.u('')})
+        self.assertRaises(TypeError, Field, *(six.text_type,), **{'cold': 1})
+        for base, attrs in ((BaseDocument, {'_id': Field(int, cold=True)}),
+                            (EmbeddedDocument, {'text': Field(six.text_type, cold=True)}),
+                            (BaseDocument, {'t': Field(six.text_type, cold=True), '__shard_key__': ['t']})):
+            self.assertRaises(TypeError, type(base), *('Bad', (base,), attrs))
+        self.assertEqual(({'_id': 1, 'url': 'u'}, {'h': 'x'}), split(Page.nanomongo.cold_db_keys,
+                                                                     {'_id': 1, 'url': 'u', 'h': 'x'}))
+        update = {'$set': {'url': 'u', 'raw.a': 1}, '$unset': {'h': 1}}
+        self.assertEqual(({'$set': {'url': 'u'}}, {'$set': {'raw.a': 1}, '$unset': {'h': 1}}),
+                         split_update(Page.nanomongo.cold_db_keys, update))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_cold_fields(self):
+        use_mongomock(Page)
+        hot, cold = Page.get_collection(), Page.nanomongo.cold_collection()
+        self.assertEqual('page_cold', cold.name)
+        page = Page(url=six.u('/'), title=six.u('t'), html=six.u('<html/>'))
+        page.insert()
+        self.assertEqual({'_id': page['_id'], 'url': '/', 'title': 't'}, hot.find_one())
+        self.assertEqual({'_id': page['_id'], 'h': '<html/>'}, cold.find_one())
+        with patch.object(Page, 'load_cold', wraps=Page.load_cold) as load_cold:
+            self.assertEqual('<html/>', page['html'])
+            self.assertRaises(KeyError, page.__getitem__, *('raw',))  # inserted, all known
+            self.assertEqual(0, load_cold.call_count)
+            loaded = Page(hot.find_one())
+            self.assertFalse('html' in loaded)
+            self.assertEqual('<html/>', loaded['html'])
+            self.assertEqual('<html/>', loaded['html'])
+            self.assertRaises(KeyError, loaded.__getitem__, *('raw',))
+            self.assertRaises(KeyError, loaded.__getitem__, *('raw',))
+            self.assertEqual(2, load_cold.call_count)  # once per field
+            # setting a cold field does not fetch it, changes go to the companion collection
+            loaded = Page(hot.find_one())
+            loaded['raw'] = {'headers': {}}
+            loaded['title'] = six.u('u')
+            self.assertEqual(2, load_cold.call_count)
+        self.assertEqual(1, loaded.save().matched_count)
+        self.assertEqual('u', hot.find_one()['title'])
+        loaded['raw']['status'] = 200
+        self.assertEqual(1, loaded.save().matched_count)  # cold only
+        self.assertEqual({'_id': page['_id'], 'h': '<html/>', 'raw': {'headers': {}, 'status': 200}},
+                         cold.find_one())
+        # batches
+        pages = [Page(url=six.u('/%d' % n), title=six.u('t'), html=six.u('%d' % n)) for n in range(4)]
+        Page.insert_many(pages[:3])
+        self.assertEqual(4, cold.count_documents({}))
+        loaded = [Page(son) for son in hot.find({'url': {'$ne': '/'}}, sort=[('url', 1)])]
+        self.assertEqual(3, Page.load_cold(loaded + [pages[3]], 'html'))
+        self.assertEqual(['0', '1', '2'], [dict.get(page, 'html') for page in loaded])
+        self.assertEqual(0, Page.load_cold([Page(url=six.u('/x'), title=six.u('t'))]))  # no _id
+        with patch.object(Page, 'load_cold', wraps=Page.load_cold) as load_cold:
+            loaded = [Page(son) for son in hot.find({'url': {'$ne': '/'}}, sort=[('url', 1)])]
+            cursor = ColdCursor(iter(loaded), Page, ['html'], batch_size=2)
+            self.assertEqual(['0', '1', '2'], [page['html'] for page in cursor])
+            self.assertEqual(2, load_cold.call_count)
+        self.assertTrue(isinstance(Page.find({}, cold=['html']), ColdCursor))
+        self.assertRaises(TypeError, Page.find, *({},), **{'cold': True, 'read_only': True})
+        self.assertRaises(TypeError, Page.find_one, *({},), **{'cold': ['title']})
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_find_one_and_modify(self):
+        use_mongomock(Page)
+        page = Page(url=six.u('/a'), title=six.u('t'), html=six.u('<html/>'))
+        page.insert()
+        for update in ({'$set': {'html': six.u('x')}}, {'$unset': {'raw': 1}}, {'$set': {'raw.a': 1}}):
+            self.assertRaises(UnsupportedOperation, Page.find_one_and_update, *({'url': '/a'}, update))
+        # hot fields only, the companion document is left as is
+        self.assertEqual('t', Page.find_one_and_update({'url': '/a'}, {'$set': {'title': six.u('u')}})['title'])
+        self.assertEqual('<html/>', Page.nanomongo.cold_collection().find_one()['h'])
+        replacement = {'url': six.u('/a'), 'title': six.u('r'), 'html': six.u('y')}
+        self.assertRaises(UnsupportedOperation, Page.find_one_and_replace, *({'url': '/a'}, replacement))
+        self.assertEqual('u', Page.get_collection().find_one()['title'])
+        Page.find_one_and_replace({'url': '/a'}, dict(replacement, _id=page['_id']))
+        loaded = Page(Page.get_collection().find_one())
+        self.assertEqual(('r', 'y'), (loaded['title'], loaded['html']))
+        self.assertEqual({'_id': page['_id'], 'url': '/a', 'title': 'r'}, Page.get_collection().find_one())
+        self.assertEqual(None, Page.find_one_and_replace({'url': '/b'}, dict(replacement, _id=ObjectId())))
+        self.assertEqual(1, Page.nanomongo.cold_collection().count_documents({}))  # nothing matched
+        deleted = Page.find_one_and_delete({'url': '/a'})
+        self.assertEqual((page['_id'], 0), (deleted['_id'], Page.nanomongo.cold_collection().count_documents({})))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_failed_writes(self):
+        use_mongomock(Page)
+        hot, cold = Page.get_collection(), Page.nanomongo.cold_collection()
+        ids = sorted(ObjectId() for n in range(3))
+        hot.insert_one({'_id': ids[1], 'url': '/1', 'title': 't'})
+        for ordered, inserted in ((True, [0]), (False, [0, 2])):
+            pages = [Page(_id=ids[n], url=six.u('/%d' % n), title=six.u('t'), html=six.u('%d' % n)) for n in range(3)]
+            hot.delete_many({'_id': {'$ne': ids[1]}})
+            cold.delete_many({})
+            self.assertRaises(BulkWriteError, Page.insert_many, *(pages,), **{'ordered': ordered})
+            self.assertEqual([ids[n] for n in inserted], [son['_id'] for son in cold.find(sort=[('_id', 1)])])
+            self.assertEqual([n in inserted for n in range(3)], ['_nanocold' in page.__dict__ for page in pages])
+        # a failed cold insert deletes the document again
+        page = Page(url=six.u('/x'), title=six.u('t'), html=six.u('x'))
+        with patch.object(mongomock.collection.Collection, 'insert_one', autospec=True,
+                          side_effect=[InsertOneResult(None, True), OperationFailure('cold')]):
+            self.assertRaises(OperationFailure, page.insert)
+        self.assertEqual(0, hot.count_documents({'url': '/x'}))
+        # no companion document for a document deleted meanwhile
+        page = Page(url=six.u('/y'), title=six.u('t'), html=six.u('y'))
+        page.insert()
+        hot.delete_one({'_id': page['_id']})
+        cold.delete_one({'_id': page['_id']})
+        page['html'] = six.u('z')
+        self.assertEqual(0, page.save().matched_count)
+        page['title'] = six.u('u')
+        page['raw'] = {}
+        self.assertEqual(0, page.save().matched_count)
+        self.assertEqual(0, cold.count_documents({'_id': page['_id']}))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_registered(self):
+        use_mongomock(Page, register=True)
+        page = Page(url=six.u('/r'), title=six.u('t'), html=six.u('<p/>'), raw={'a': 1})
+        page.insert()
+        self.assertEqual(dict, type(Page.nanomongo.cold_collection().find_one()))  # not cast to Page
+        loaded = Page.find_one({'url': '/r'})
+        self.assertTrue(isinstance(loaded, Page) and 'html' not in loaded)
+        self.assertEqual(('<p/>', {'a': 1}), (loaded['html'], loaded['raw']))
+        loaded = list(Page.find({}, cold=True))[0]
+        self.assertEqual({'_id': page['_id'], 'url': '/r', 'title': 't', 'html': '<p/>', 'raw': {'a': 1}}, loaded)
@@ -1,20 +1,49 @@
 import copy
 import datetime
+import decimal
+import pickle
 import types
 import unittest
 import sys
+import uuid
+
+from operator import itemgetter
 
 import bson
 import pymongo
 import six
 
+from mock import Mock, patch
+
 from nanomongo.field import Field
-from nanomongo.document import BaseDocument
+from nanomongo.document import BaseDocument, EmbeddedDocument, ReadOnlyDocument
 from nanomongo.errors import (
     ConfigurationError, DBRefNotSetError, ExtraFieldError, UnsupportedOperation, ValidationError,
 )
+from nanomongo.util import FrozenDict, RecordingDict, check_spec
+
+from . import PYMONGO_CLIENT, TEST_DBNAME, mongomock, use_mongomock
+
+
+class PickledAddress(EmbeddedDocument):  # module level to be picklable
+    street = Field(six.text_type)
 
-from . import PYMONGO_CLIENT, TEST_DBNAME
+
+class Pickled(BaseDocument, dot_notation=True):
+    name = Field(six.text_type)
+    address = Field(PickledAddress)
+    meta = Field(dict, default={})
+    ref = Field(bson.DBRef, required=False)
+
+
+class Sharded(BaseDocument):  # module level for DBRef getters
+    _id = Field(int)
+    tenant = Field(six.text_type, db_field='t')
+    name = Field(six.text_type)
+    meta = Field(dict, default={})
+    owner = Field(bson.DBRef, required=False, document_class='Sharded')
+
+    __shard_key__ = ['tenant', ('_id', 'hashed')]
 
 
 class DocumentTestCase(unittest.TestCase):
@@ -134,6 +163,408 @@ class DocumentTestCase(unittest.TestCase):
         self.assertEqual(sorted(base_doc_attr + ['foo']), doc_attr)
         self.assertEqual(sorted(doc_attr + ['bar']), doc2_attr)
 
+    def test_db_field(self):
+        """Test db_field alias translation"""
+        class Doc(BaseDocument):
+            notifications = Field(dict, db_field='n')
+            tags = Field(list, db_field='t', required=False)
+            foo = Field(six.text_type)
+
+            __indexes__ = [pymongo.IndexModel([('tags', 1), ('foo', -1)], unique=True)]
+
+        nm = Doc.nanomongo
+        self.assertEqual({'notifications': 'n', 'tags': 't'}, nm.aliases)
+        self.assertEqual('n.email', nm.db_key('notifications.email'))
+        self.assertEqual({'n': {}, 'foo': 'foo'}, nm.to_db(Doc(notifications={}, foo=six.u('foo'))))
+        self.assertEqual({'notifications': {'x': 1}, 'foo': 'foo'}, nm.from_db({'n': {'x': 1}, 'foo': 'foo'}))
+        self.assertEqual({'t': 'a', '$or': [{'n.email': True}, {'foo': 'foo'}]},
+                         nm.to_db_spec({'tags': 'a', '$or': [{'notifications.email': True}, {'foo': 'foo'}]}))
+        self.assertEqual([('t', 1), ('foo', -1)], nm.to_db_keys([('tags', 1), ('foo', -1)]))
+        self.assertEqual({'t': 0}, nm.to_db_keys({'tags': 0}))
+        self.assertEqual({'$set': {'n.email': True}, '$addToSet': {'t': {'$each': [1]}}},
+                         nm.to_db_update({'$set': {'notifications.email': True}, '$addToSet': {'tags': {'$each': [1]}}}))
+        self.assertEqual([{'$match': {'t': 'a'}}, {'$sort': {'n': 1}}, {'$project': {'tags': 1}}],
+                         nm.to_db_pipeline([{'$match': {'tags': 'a'}}, {'$sort': {'notifications': 1}},
+                                            {'$project': {'tags': 1}}]))
+        index = nm.to_db_indexes(Doc.__indexes__)[0].document
+        self.assertEqual([('t', 1), ('foo', -1)], list(index['key'].items()))
+        self.assertEqual((True, 'tags_1_foo_-1'), (index['unique'], index['name']))
+
+        class NoAlias(BaseDocument):
+            foo = Field(six.text_type)
+
+        spec = {'foo': 'foo'}
+        self.assertTrue(spec is NoAlias.nanomongo.to_db_spec(spec))
+
+        # _id is set before the db_field copy, motor inserts return a future and set it later
+        collection = Mock(spec=['insert_one', 'insert_many'])
+        collection.insert_one.return_value = collection.insert_many.return_value = Mock(spec=['add_done_callback'])
+        with patch.object(Doc.nanomongo, 'get_collection', return_value=collection):
+            doc = Doc(notifications={}, foo=six.u('a'))
+            doc.insert()
+            self.assertTrue(isinstance(doc['_id'], bson.ObjectId))
+            self.assertEqual({'_id': doc['_id'], 'n': {}, 'foo': 'a'}, collection.insert_one.call_args[0][0])
+            docs = [Doc(notifications={}, foo=six.u('b')), Doc(notifications={}, foo=six.u('c'))]
+            Doc.insert_many(docs)
+            self.assertEqual([doc['_id'] for doc in docs], [son['_id'] for son in collection.insert_many.call_args[0][0]])
+
+        def clash():
+            class Doc(BaseDocument):
+                foo = Field(int, db_field='bar')
+                bar = Field(int)
+
+        def twice():
+            class Doc(BaseDocument):
+                foo = Field(int, db_field='f')
+                bar = Field(int, db_field='f')
+
+        def _id():
+            class Doc(BaseDocument):
+                _id = Field(int, db_field='id')
+
+        for func in (clash, twice, _id):
+            self.assertRaises(TypeError, func)
+
+    def test_default_templates(self):
+        """Test per-class default templates used by document creation"""
+        class Doc(BaseDocument):
+            num = Field(int, default=42)
+            tags = Field(list, default=[six.u('a')])
+            meta = Field(dict, default={'a': {'b': 1}})
+            created = Field(datetime.datetime, default=datetime.datetime.utcnow)
+            extra = Field(dict, default=lambda: {'x': 1}, required=False)
+            ref = Field(bson.DBRef, required=False)
+
+        self.assertEqual({'num': 42}, Doc.nanomongo.defaults)
+        self.assertEqual(['created', 'extra', 'meta', 'tags'], sorted(name for name, _ in Doc.nanomongo.default_factories))
+        self.assertTrue(isinstance(Doc.__dict__['get_ref_field'], types.FunctionType))
+        d1, d2 = Doc(), Doc(tags=[six.u('b')])
+        self.assertEqual(([six.u('a')], [six.u('b')]), (d1['tags'], d2['tags']))
+        self.assertFalse(d1['meta'] is d2['meta'] or d1['meta']['a'] is d2['meta']['a'])
+        self.assertEqual((RecordingDict, RecordingDict), (type(d1['meta']), type(d1['extra'])))
+        self.assertTrue(isinstance(d1.get_ref_field, types.MethodType))
+        d1['meta']['a'] = 2
+        self.assertEqual({'$set': {'meta.a': 2}, '$unset': {}, '$addToSet': {}}, d1.get_sub_diff())
+        self.assertEqual({'a': {'b': 1}}, Doc()['meta'])
+
+        class Ordered(BaseDocument):
+            meta = Field(dict, default=bson.SON([('a', 1)]))
+
+        doc = Ordered()
+        doc['meta']['y'] = 2
+        self.assertEqual({'$set': {'meta.y': 2}, '$unset': {}, '$addToSet': {}}, doc.get_sub_diff())
+
+    def test_embedded_document(self):
+        """Test embedded document fields, validation and verified caching"""
+        class Geo(EmbeddedDocument):
+            lat = Field(float)
+            lng = Field(float)
+
+        class Address(EmbeddedDocument):
+            street = Field(six.text_type)
+            geo = Field(Geo, required=False)
+            tags = Field(list, required=False)
+
+        class Doc(BaseDocument):
+            address = Field(Address)
+            other = Field(dict, required=False)
+
+        def bad_embedded():
+            class Bad(EmbeddedDocument):
+                foo = Field(int, db_field='f')
+
+        self.assertRaises(TypeError, bad_embedded)
+        d = Doc({'address': {'street': six.u('Main St.'), 'geo': {'lat': 1.0, 'lng': 2.0}}, 'other': {'x': 1}})
+        address, geo = d['address'], d['address']['geo']
+        self.assertEqual((Address, Geo, RecordingDict), (type(address), type(geo), type(d['other'])))
+        self.assertTrue(geo.__nanoparent__ is address)
+        self.assertFalse(hasattr(geo, '__dict__'))  # slots only
+        d.validate_all()
+        self.assertTrue(address.__nanoverified__ and geo.__nanoverified__)
+        with patch.object(Geo, 'validate') as geo_validate:
+            d.validate_all()
+            address['street'] = six.u('Side St.')  # geo unchanged
+            d.validate_diff()
+            self.assertFalse(geo_validate.called)
+            geo['lat'] = 'wrong type'
+            self.assertFalse(address.__nanoverified__)
+            self.assertRaises(ValidationError, d.validate_all)
+        geo['lat'] = 1.5
+        self.assertEqual({'$set': {'address.street': 'Side St.', 'address.geo.lat': 1.5}, '$unset': {},
+                          '$addToSet': {}}, d.get_sub_diff())
+        d.validate_diff()
+        del address['street']  # required
+        self.assertRaises(ValidationError, d.validate_diff)
+        address['street'] = six.u('Main St.')
+        address['undefined'] = 42
+        self.assertRaises(ValidationError, d.validate_all)
+        # validated on creation like other fields
+        self.assertRaises(ValidationError, Doc, *({'address': {'street': 1}},))
+        self.assertRaises(ValidationError, Doc, *({'address': {'street': six.u('s'), 'geo': {'lat': 1.0}}},))
+
+        class Limits(EmbeddedDocument):
+            values = Field(dict)
+
+            def validate(self):
+                if any(v < 0 for v in self['values'].values()):
+                    raise ValidationError('negative limit')
+
+        class Plan(BaseDocument):
+            limits = Field(Limits)
+
+        plan = Plan(limits={'values': {'users': 1}})
+        plan.validate_all()
+        self.assertFalse(plan['limits'].__nanoverified__)  # holds a dict, changed in place below
+        plan['limits']['values']['users'] = -1
+        self.assertRaises(ValidationError, plan.validate_all)
+        del address['undefined']
+        d.add_to_set('address.tags', 'a')
+        self.assertEqual(['a'], address['tags'])
+        self.assertRaises(ValidationError, d.add_to_set, *('address.street', 'a'))
+        d['address'] = {'street': six.u('New St.')}  # plain dict not an Address
+        self.assertRaises(ValidationError, d.validate_diff)
+        d['address'] = Address(street=six.u('New St.'), geo=Geo(lat=1.0, lng=2.0))
+        d.validate_diff()
+        self.assertEqual({'$set': {}, '$unset': {}, '$addToSet': {}}, d.get_sub_diff())  # $set as a whole
+
+        Doc.nanomongo.set_check_spec_level('strict')
+        check_spec(Doc, {'address.geo.lat': 1.0})
+        for spec in ({'address.geo.altitude': 1.0}, {'address.street.x': 1}, {'address.geo.lat': 'north'}):
+            self.assertRaises(ValidationError, check_spec, *(Doc, spec))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_read_only(self):
+        """Test read-only views and find(read_only=True)"""
+        class Doc(BaseDocument, dot_notation=True):
+            _id = Field(int)
+            name = Field(six.text_type)
+            sub = Field(dict, required=False)
+            short = Field(int, db_field='s', required=False)
+            ref = Field(bson.DBRef, required=False)
+
+        use_mongomock(Doc)
+        Doc.get_collection().insert_one({'_id': 1, 'name': 'a', 'sub': {'x': {'y': 1}}, 's': 5, 'extra': True})
+        Doc.get_collection().insert_one({'_id': 2, 'name': 'b', 'sub': {'x': {'y': 2}}})
+        self.assertTrue(Doc.read_only is Doc.read_only and issubclass(Doc.read_only, ReadOnlyDocument))
+        doc = Doc.find_one(1, read_only=True)
+        self.assertEqual(Doc.read_only, type(doc))
+        self.assertEqual({'_id': 1, 'name': 'a', 'sub': {'x': {'y': 1}}, 'short': 5, 'extra': True}, doc)
+        self.assertEqual(('a', 5), (doc.name, doc.short))
+        self.assertTrue(isinstance(doc['sub']['x'], FrozenDict))
+        for mutate in (lambda: doc.__setitem__('name', 'b'), lambda: setattr(doc, 'name', 'b'),
+                       lambda: doc['sub'].update(x=1), lambda: doc.pop('name'), lambda: doc['sub']['x'].clear()):
+            self.assertRaises(UnsupportedOperation, mutate)
+        self.assertFalse(hasattr(doc, 'reset_diff') or hasattr(doc, '__nanodiff__'))
+        self.assertRaises(DBRefNotSetError, doc.get_ref_field)
+        self.assertEqual(doc, copy.copy(doc))
+        self.assertEqual(None, Doc.find_one(3, read_only=True))
+        cursor = Doc.find({}, read_only=True).sort('_id', pymongo.DESCENDING).limit(1)
+        self.assertEqual([(Doc.read_only, 2)], [(type(d), d['_id']) for d in cursor])
+        mutable = Doc.find_one(2, read_only=True).mutable()
+        self.assertEqual((Doc, RecordingDict), (type(mutable), type(mutable['sub'])))
+        mutable['sub']['x'] = 3
+        self.assertEqual({'sub.x': 3}, mutable.get_sub_diff()['$set'])
+        # the constructor freezes too, without changing the given dicts
+        raw = {'_id': 3, 'name': 'c', 'sub': {'a': 1, 'x': {'y': 1}}}
+        doc = Doc.read_only(raw)
+        self.assertTrue(isinstance(doc['sub'], FrozenDict) and isinstance(doc['sub']['x'], FrozenDict))
+        self.assertRaises(UnsupportedOperation, doc['sub'].__setitem__, *('a', 2))
+        raw['sub']['a'] = 2
+        raw['sub']['x']['y'] = 2
+        self.assertEqual({'a': 1, 'x': {'y': 1}}, doc['sub'])
+        self.assertEqual((dict, dict), (type(raw['sub']), type(raw['sub']['x'])))
+
+    def test_read_only_pickle(self):
+        doc = Pickled.read_only({'_id': bson.ObjectId(), 'name': 'a', 'address': {'street': 'Main St.'}})
+        restored = pickle.loads(pickle.dumps(doc, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual((Pickled.read_only, doc), (type(restored), restored))
+        self.assertTrue(isinstance(restored['address'], FrozenDict))
+        self.assertRaises(UnsupportedOperation, restored.__setitem__, *('name', 'b'))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_pickle(self):
+        """Test pickling keeps data and pending diffs, unpickling does not validate"""
+        use_mongomock(Pickled)
+        doc = Pickled(name=six.u('a'), address={'street': six.u('Main St.')})
+        doc.insert()
+        doc.name = six.u('b')
+        doc['address']['street'] = six.u('Side St.')
+        doc['meta']['key'] = 1
+        doc['other'] = {'set': 'whole'}  # undefined, validation fails on save
+        with patch.object(Pickled, '__init__') as init:
+            restored = pickle.loads(pickle.dumps(doc, pickle.HIGHEST_PROTOCOL))
+            self.assertFalse(init.called)
+        self.assertEqual((Pickled, doc), (type(restored), restored))
+        self.assertEqual(doc.__nanodiff__, restored.__nanodiff__)
+        self.assertEqual(doc.get_sub_diff(), restored.get_sub_diff())
+        self.assertTrue(restored.__nanodiff__['$set']['other'] is restored['other'])
+        self.assertTrue(restored['address'].__nanoparent__ is None)
+        self.assertEqual('b', restored.name)
+        self.assertTrue(isinstance(restored.get_ref_field, types.MethodType))
+        self.assertRaises(ValidationError, restored.save)
+        dict.__delitem__(restored, 'other')
+        del restored.__nanodiff__['$set']['other']
+        restored.save()
+        self.assertEqual({'_id': doc['_id'], 'name': 'b', 'address': {'street': 'Side St.'}, 'meta': {'key': 1}},
+                         Pickled.get_collection().find_one(doc['_id']))
+        self.assertEqual({'$set': {}, '$unset': {}, '$addToSet': {}}, restored.__nanodiff__)
+        self.assertEqual(restored, copy.deepcopy(restored))
+
+    def test_shard_key_definition(self):
+        self.assertEqual([('tenant', 1), ('_id', 'hashed')], Sharded.nanomongo.shard_key)
+        self.assertEqual([], Pickled.nanomongo.shard_key)
+        for shard_key in ('tenant', [], ['undefined'], [('tenant', -1)], ['tenant', ('tenant', 1)], ['meta.key']):
+            self.assertRaises(TypeError, type, *('Bad', (BaseDocument,), {'tenant': Field(str), 'meta': Field(dict),
+                                                                          '__shard_key__': shard_key}))
+        self.assertRaises(TypeError, type, *('Bad', (BaseDocument,), {
+            'updated': Field(datetime.datetime, auto_update=True), '__shard_key__': ['updated']}))
+
+        class Child(Sharded):
+            extra = Field(int, required=False)
+
+        self.assertEqual(Sharded.nanomongo.shard_key, Child.nanomongo.shard_key)
+        doc = Sharded(_id=1, tenant=six.u('a'), name=six.u('n'))
+        self.assertEqual({'_id': 1, 'tenant': 'a'}, Sharded.nanomongo.identity(doc))
+        self.assertEqual({'_id': 1, 'tenant': 'a'}, Sharded.nanomongo.identity(bson.DBRef('sharded', 1, tenant='a')))
+        self.assertEqual({'_id': 1}, Sharded.nanomongo.identity(bson.DBRef('sharded', 1)))
+        self.assertRaises(ValidationError, Sharded.nanomongo.identity, *(Sharded(_id=1),))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_shard_key(self):
+        """Test saves and DBRef lookups are targeted with the shard key, shard key changes rejected"""
+        client = use_mongomock(Sharded)
+        doc = Sharded(_id=1, tenant=six.u('a'), name=six.u('n'))
+        doc.insert()
+        doc['name'] = six.u('m')
+        doc['meta']['key'] = 1
+        update_one = mongomock.collection.Collection.update_one
+        with patch.object(mongomock.collection.Collection, 'update_one', autospec=True,
+                          side_effect=update_one) as spy:
+            self.assertEqual(1, doc.save().matched_count)
+        self.assertEqual({'_id': 1, 't': 'a'}, spy.call_args[0][1])
+        dbref = doc.get_dbref()
+        self.assertEqual('a', dbref.tenant)
+        other = Sharded(_id=2, tenant=six.u('b'), name=six.u('o'), owner=dbref)
+        with patch.object(Sharded, 'find_one', wraps=Sharded.find_one) as find_one:
+            self.assertEqual((1, 'a'), itemgetter('_id', 't')(other.get_owner_field()))  # raw, not registered
+        self.assertEqual(dbref, find_one.call_args[0][0])
+        self.assertEqual(None, Sharded.find_one(bson.DBRef('sharded', 1, tenant='b')))
+        self.assertEqual(doc, Sharded.find_one(bson.DBRef('sharded', 1), read_only=True))
+        for key, value in (('tenant', six.u('b')), ('meta', {'tenant': 1})):
+            changed = Sharded(Sharded.get_collection().find_one(1, {'t': 0}), tenant=six.u('a'))
+            changed[key] = value
+            if key == 'tenant':
+                self.assertRaises(ValidationError, changed.save)
+            else:
+                changed.save()
+        missing = Sharded(_id=1, name=six.u('x'))
+        missing.reset_diff()
+        missing['name'] = six.u('y')
+        self.assertRaises(ValidationError, missing.save)
+        # register(check_shard_key=True) reads config.collections
+        self.assertRaises(ConfigurationError, Sharded.nanomongo.check_shard_key)
+        shards = client['config']['collections']
+        shards.insert_one({'_id': '%s.sharded' % TEST_DBNAME, 'key': bson.SON([('t', 1), ('_id', 1)])})
+        self.assertRaises(ConfigurationError, Sharded.nanomongo.check_shard_key)
+        shards.update_one({}, {'$set': {'key': bson.SON([('t', 1), ('_id', 'hashed')])}})
+        Sharded.nanomongo.check_shard_key()
+
+    def test_collection_declarations(self):
+        class Metric(BaseDocument):
+            time = Field(datetime.datetime, db_field='ts')
+            source = Field(dict)
+            value = Field(float)
+
+            __timeseries__ = {'timeField': 'time', 'metaField': 'source', 'granularity': 'minutes',
+                              'expireAfterSeconds': 3600}
+
+        class Log(BaseDocument):
+            line = Field(six.text_type)
+
+            __capped__ = {'size': 2 ** 20, 'max': 1000}
+
+        self.assertEqual({'timeseries': {'timeField': 'ts', 'metaField': 'source', 'granularity': 'minutes'},
+                          'expireAfterSeconds': 3600}, Metric.nanomongo.create_options())
+        self.assertEqual({'capped': True, 'size': 2 ** 20, 'max': 1000}, Log.nanomongo.create_options())
+        self.assertEqual({}, Pickled.nanomongo.create_options())
+        fields = {'time': Field(datetime.datetime), 'name': Field(six.text_type), 'meta': Field(dict)}
+        bad = [{'__timeseries__': [('timeField', 'time')]}, {'__timeseries__': {'metaField': 'meta'}},
+               {'__timeseries__': {'timeField': 'name'}}, {'__timeseries__': {'timeField': 'time', 'metaField': '_id'}},
+               {'__timeseries__': {'timeField': 'time', 'granularity': 'days'}},
+               {'__timeseries__': {'timeField': 'time', 'expireAfterSeconds': 0}},
+               {'__timeseries__': {'timeField': 'time', 'unknown': 1}},
+               {'__capped__': {'max': 10}}, {'__capped__': {'size': '1mb'}},
+               {'__capped__': {'size': 1}, '__timeseries__': {'timeField': 'time'}}]
+        for attrs in bad:
+            self.assertRaises(TypeError, type, *('Bad', (BaseDocument,), dict(fields, **attrs)))
+        # time-series batches grouped by metaField, in order of first appearance, sorted by time
+        t = [datetime.datetime(2020, 1, 1, minute) for minute in range(4)]
+        docs = [Metric(time=t[3], source={'host': 'a'}, value=1.0), Metric(time=t[2], source={'host': 'b'}, value=1.0),
+                Metric(time=t[1], source={'host': 'a'}, value=1.0), Metric(time=t[0], source={'host': 'b'}, value=1.0)]
+        self.assertEqual([docs[2], docs[0], docs[3], docs[1]], Metric.nanomongo.order_batch(docs))
+        self.assertEqual(docs, Log.nanomongo.order_batch(docs))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_create_collection(self):
+        """Test declared time-series and capped collections are created, insert_many options"""
+        class Metric(BaseDocument):
+            time = Field(datetime.datetime)
+            host = Field(six.text_type)
+
+            __timeseries__ = {'timeField': 'time', 'metaField': 'host'}
+
+        class Log(BaseDocument):
+            line = Field(six.text_type)
+
+            __capped__ = {'size': 4096}
+
+        use_mongomock(Metric, Log, Pickled)
+        collections = []  # mongomock has no list_collections or create options
+        database = mongomock.database.Database
+        with patch.object(database, 'list_collections', autospec=True,
+                          side_effect=lambda db, filter: [c for c in collections if c['name'] == filter['name']]), \
+                patch.object(database, 'create_collection', autospec=True,
+                             side_effect=lambda db, name, **options: collections.append(
+                                 {'name': name, 'options': options})) as create_collection:
+            self.assertTrue(Metric.nanomongo.create_collection())
+            self.assertFalse(Metric.nanomongo.create_collection())
+            self.assertEqual(1, create_collection.call_count)
+            self.assertEqual({'timeseries': {'timeField': 'time', 'metaField': 'host'}},
+                             create_collection.call_args[1])
+            self.assertFalse(Pickled.nanomongo.create_collection())
+            collections.append({'name': 'log', 'options': {}})
+            self.assertRaises(ConfigurationError, Log.nanomongo.create_collection)
+            collections[-1]['options'] = {'capped': True, 'size': 4096}
+            self.assertFalse(Log.nanomongo.create_collection())
+
+        class MotorCursor(object):
+            def __aiter__(self):
+                return self
+
+        with patch.object(database, 'list_collections', autospec=True, return_value=MotorCursor()), \
+                patch('nanomongo.document.logging') as mock_logging:
+            self.assertFalse(Metric.nanomongo.create_collection())
+            self.assertEqual(1, mock_logging.warning.call_count)
+        insert_many = mongomock.collection.Collection.insert_many
+        with patch.object(mongomock.collection.Collection, 'insert_many', autospec=True,
+                          side_effect=insert_many) as spy:
+            t = [datetime.datetime(2020, 1, 1, minute) for minute in range(3)]
+            docs = [Metric(time=t[2], host=six.u('a')), Metric(time=t[1], host=six.u('b')),
+                    Metric(time=t[0], host=six.u('a'))]
+            result = Metric.insert_many(docs)
+            self.assertEqual(False, spy.call_args[1]['ordered'])
+            self.assertEqual([docs[2]['_id'], docs[0]['_id'], docs[1]['_id']],
+                             [son['_id'] for son in spy.call_args[0][1]])
+            self.assertEqual([doc['_id'] for doc in docs], result.inserted_ids)  # in the given order
+            self.assertEqual([None] * 3, [doc._nanodiff for doc in docs])
+            Log.insert_many([Log(line=six.u('x'))])
+            self.assertEqual(True, spy.call_args[1]['ordered'])
+            Pickled.insert_many([Pickled(name=six.u('p'), address={'street': six.u('s')})])
+            self.assertEqual(True, spy.call_args[1]['ordered'])  # pymongo's default
+        self.assertRaises(ValidationError, Log.insert_many, *([Log()],))
+        self.assertRaises(TypeError, Log.insert_many, *([{'line': six.u('x')}],))
+        self.assertEqual(1, Log.get_collection().count_documents({}))
+
 
 class ClientTestCase(unittest.TestCase):
     def test_document_cient_bad(self):
@@ -223,6 +654,42 @@ class ClientTestCase(unittest.TestCase):
 
         Doc2.register(client=PYMONGO_CLIENT, db=TEST_DBNAME, collection='doc2_collection')
 
+    def test_collection_options(self):
+        """Test class collection options, per-call overrides and collection caching"""
+        client = pymongo.MongoClient(connect=False)
+
+        class Doc(BaseDocument):
+            client = pymongo.MongoClient(connect=False)
+            db = TEST_DBNAME
+            read_preference = 'secondaryPreferred'
+            max_staleness = 120
+            foo = Field(six.text_type)
+
+        self.assertFalse(hasattr(Doc, 'read_preference') or hasattr(Doc, 'max_staleness'))
+        collection = Doc.get_collection()
+        self.assertTrue(collection is Doc.get_collection())
+        self.assertEqual({'mode': 'secondaryPreferred', 'maxStalenessSeconds': 120},
+                         collection.read_preference.document)
+        self.assertEqual(1, len(collection.database.outgoing_copying_manipulators))
+        override = Doc.get_collection(read_preference='nearest', read_concern='majority')
+        self.assertTrue(override is Doc.get_collection(read_concern='majority', read_preference='nearest'))
+        self.assertEqual('nearest', override.read_preference.mongos_mode)
+        self.assertEqual(120, override.read_preference.max_staleness)
+        self.assertEqual('majority', override.read_concern.level)
+        self.assertEqual(pymongo.ReadPreference.SECONDARY_PREFERRED.mode, Doc.find().collection.read_preference.mode)
+        cursor = Doc.find({'foo': 'bar'}, read_preference='secondary')
+        self.assertEqual('secondary', cursor.collection.read_preference.mongos_mode)
+        self.assertRaises(TypeError, Doc.get_collection, **{'read_preference': 'secondary_sometimes'})
+        self.assertRaises(TypeError, Doc.get_collection, **{'read_preference': 'primary', 'max_staleness': 90})
+
+        class Doc2(BaseDocument):
+            foo = Field(six.text_type)
+
+        self.assertRaises(TypeError, Doc2.register, **{'client': client, 'db': TEST_DBNAME, 'write_concern': 1})
+        Doc2.register(client=client, db=TEST_DBNAME, write_concern={'w': 'majority'})
+        self.assertEqual({'w': 'majority'}, Doc2.get_collection().write_concern.document)
+        self.assertEqual(pymongo.ReadPreference.PRIMARY, Doc2.get_collection().read_preference)
+
 
 class MongoDocumentTestCase(unittest.TestCase):
     def setUp(self):
@@ -414,6 +881,130 @@ class MongoDocumentTestCase(unittest.TestCase):
         d.save()
         self.assertNotEqual(d.bar, dt_after_insert)
 
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_find_one_and_modify(self):
+        """Pymongo: Test find_one_and_update, find_one_and_replace, find_one_and_delete"""
+
+        class Doc(BaseDocument):
+            foo = Field(six.text_type)
+            bar = Field(int, required=False)
+            baz = Field(list, required=False)
+            updated = Field(datetime.datetime, auto_update=True)
+        Doc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+
+        self.assertEqual(None, Doc.find_one_and_update({'foo': 'inexistent'}, {'$set': {'bar': 1}}))
+        d = Doc(foo=six.u('foo value'), bar=1)
+        d.insert()
+        for update in ({'bar': 2}, {'$set': {'bar': '2'}}, {'$set': {'moo': 2}}, {'$unset': {'foo': 1}},
+                       {'$inc': {'foo': 1}}, {'$push': {'bar': 1}}):
+            self.assertRaises(ValidationError, Doc.find_one_and_update, *({'_id': d['_id']}, update))
+
+        dt = datetime.datetime(2000, 1, 1)
+        Doc.get_collection().update_one({'_id': d['_id']}, {'$set': {'updated': dt}})
+        before = Doc.find_one_and_update({'_id': d['_id']}, {'$inc': {'bar': 1}, '$push': {'baz': 42}})
+        self.assertEqual(type(before), Doc)
+        self.assertEqual(1, before['bar'])
+        self.assertFalse(any(before.get_sub_diff().values()) or any(before.__nanodiff__.values()))
+        after = Doc.find_one_and_update({'_id': d['_id']}, {'$inc': {'bar': 1}},
+                                        return_document=pymongo.ReturnDocument.AFTER)
+        self.assertEqual(3, after['bar'])
+        self.assertEqual([42], after['baz'])
+        self.assertEqual(dt, before['updated'])
+        self.assertTrue(after['updated'] > dt)  # auto_update field $set
+
+        self.assertRaises(ValidationError, Doc.find_one_and_replace, *({'_id': d['_id']}, {'foo': 42}))
+        replaced = Doc.find_one_and_replace({'_id': d['_id']}, {'foo': six.u('new value')},
+                                            return_document=pymongo.ReturnDocument.AFTER)
+        self.assertEqual(type(replaced), Doc)
+        self.assertEqual(six.u('new value'), replaced['foo'])
+        self.assertFalse('bar' in replaced)
+
+        deleted = Doc.find_one_and_delete({'foo': 'new value'})
+        self.assertEqual(type(deleted), Doc)
+        self.assertEqual(d['_id'], deleted['_id'])
+        self.assertEqual(None, Doc.find_one())
+
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_aggregate(self):
+        """Pymongo: Test aggregate with typed, custom and raw results"""
+
+        class Doc(BaseDocument):
+            foo = Field(six.text_type)
+            bar = Field(int)
+        Doc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+
+        class Total(BaseDocument):
+            _id = Field(six.text_type)
+            total = Field(int)
+
+        for i in range(5):
+            Doc(foo=six.u('even' if i % 2 else 'odd'), bar=i).insert()
+        Doc.nanomongo.set_check_spec_level('strict')
+        self.assertRaises(ValidationError, Doc.aggregate, [{'$match': {'bar': 'wrong type'}}])
+        self.assertRaises(TypeError, Doc.aggregate, {'$match': {'bar': 1}})
+
+        docs = list(Doc.aggregate([{'$match': {'bar': {'$gte': 1}}}, {'$sort': {'bar': -1}}], batchSize=2))
+        self.assertEqual([4, 3, 2, 1], [d['bar'] for d in docs])
+        self.assertTrue(all(type(d) is Doc for d in docs))
+
+        pipeline = [{'$group': {'_id': '$foo', 'total': {'$sum': '$bar'}}}, {'$sort': {'_id': 1}}]
+        totals = list(Doc.aggregate(pipeline, as_class=Total, allowDiskUse=True, maxTimeMS=10000))
+        self.assertEqual([Total(_id=six.u('even'), total=4), Total(_id=six.u('odd'), total=6)], totals)
+        self.assertEqual(type(totals[0]), Total)
+        self.assertEqual([type(doc) for doc in Doc.aggregate(pipeline)], [dict, dict])  # undefined fields, raw
+        self.assertEqual([4, 6], [doc['total'] for doc in Doc.aggregate(pipeline, as_class=dict)])
+        self.assertEqual([('even', 4), ('odd', 6)],
+                         list(Doc.aggregate(pipeline, as_class=lambda doc: (doc['_id'], doc['total']))))
+
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_db_field(self):
+        """Pymongo: Test documents with db_field aliases are stored with short field names"""
+
+        class Doc(BaseDocument):
+            dot_notation = True
+            notifications = Field(dict, db_field='n')
+            tags = Field(list, db_field='t', required=False)
+            foo = Field(six.text_type)
+        Doc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+        raw = PYMONGO_CLIENT[TEST_DBNAME][Doc.nanomongo.collection]
+
+        d = Doc(notifications={'email': True}, foo=six.u('foo value'))
+        d.insert()
+        self.assertEqual({'_id': d._id, 'n': {'email': True}, 'foo': 'foo value'}, raw.find_one())
+        self.assertEqual(d, Doc.find_one({'notifications.email': True}))
+        self.assertEqual(d, Doc.find_one({'notifications': {'email': True}}, projection={'notifications': 1, 'foo': 1}))
+
+        d.notifications['sms'] = False
+        d.add_to_set('tags', 'a')
+        d.save()
+        self.assertEqual({'_id': d._id, 'n': {'email': True, 'sms': False}, 'foo': 'foo value', 't': ['a']},
+                         raw.find_one())
+        self.assertEqual([d], list(Doc.find({'tags': 'a'}, sort=[('notifications.sms', 1)])))
+
+        updated = Doc.find_one_and_update({'tags': 'a'}, {'$push': {'tags': 'b'}},
+                                          return_document=pymongo.ReturnDocument.AFTER)
+        self.assertEqual(['a', 'b'], updated.tags)
+        self.assertEqual(['a', 'b'], raw.find_one()['t'])
+        self.assertEqual([['a', 'b']], [doc.tags for doc in Doc.aggregate([{'$match': {'tags': 'b'}}])])
+
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_field_types(self):
+        """Pymongo: Test documents with custom field types"""
+
+        class Doc(BaseDocument):
+            price = Field(decimal.Decimal)
+            sku = Field(uuid.UUID, required=False)
+        Doc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+
+        d = Doc(price=decimal.Decimal('9.99'), sku=uuid.uuid4())
+        d.insert()
+        raw = PYMONGO_CLIENT[TEST_DBNAME][Doc.nanomongo.collection].find_one()
+        self.assertEqual(bson.decimal128.Decimal128('9.99'), raw['price'])
+        self.assertEqual(d, Doc.find_one({'price': {'$gt': decimal.Decimal('9.98')}}))
+        d.price = decimal.Decimal('19.99')
+        d.save()
+        self.assertEqual(decimal.Decimal('19.99'), Doc.find_one({'sku': d['sku']})['price'])
+
     @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
     def test_document_dbref(self):
         """Test get_dbref functionality"""
@@ -1,12 +1,16 @@
+import collections
 import copy
 import datetime
 import unittest
 
-from bson import DBRef
+import bson
 import six
 
-from nanomongo.field import Field
+from bson import DBRef
+
+from nanomongo.field import Field, default_copier
 from nanomongo.errors import ValidationError
+from nanomongo.util import RecordingDict
 
 
 def wrap(*args, **kwargs):  # to wrap Field() declarations
@@ -42,7 +46,7 @@ class FieldTestCase(unittest.TestCase):
             wrap(six.binary_type, default=b'L33t'), wrap(six.text_type, default=six.u('L33t')),
             wrap(list, default=[]), wrap(six.text_type, default=None, required=False),
             wrap(datetime.datetime, auto_update=True),
-            wrap(DBRef, document_class='L33tClass'),
+            wrap(DBRef, document_class='L33tClass'), wrap(int, db_field='i'),
         ]
         invalid_defs = [
             wrap(), wrap(bool, default=1), wrap(dict, default=None),
@@ -51,6 +55,7 @@ class FieldTestCase(unittest.TestCase):
             wrap(six.text_type, default='', bad_kwarg=True), wrap(int, auto_update=True),
             wrap(datetime.datetime, auto_update='bad value'),
             wrap(DBRef, document_class=dict),
+            wrap(int, db_field=''), wrap(int, db_field='a.b'), wrap(int, db_field='$i'), wrap(int, db_field=1),
         ]
         [wrapped() for wrapped in valid_defs]
         [self.assertRaises(TypeError, wrapped) for wrapped in invalid_defs]
@@ -63,3 +68,21 @@ class FieldTestCase(unittest.TestCase):
         ]
         for dct in bad_dicts:
             self.assertRaises(ValidationError, Field(dict).validator, *(dct,))
+
+    def test_default_copier(self):
+        """Test copies of mutable default values"""
+        flat_list, nested_list = [1, six.u('a'), None], [[1], {'a': 1}]
+        flat_dict, nested_dict = {'a': 1, 'b': datetime.datetime(2020, 1, 1)}, {'a': {'b': [1]}}
+        for value in (flat_list, nested_list, flat_dict, nested_dict):
+            copier = default_copier(value)
+            copied = copier()
+            self.assertEqual(value, copied)
+            self.assertFalse(copied is value or copied is copier())
+            self.assertEqual(RecordingDict if isinstance(value, dict) else list, type(copied))
+        self.assertFalse(default_copier(nested_list)()[0] is nested_list[0])
+        self.assertFalse(default_copier(nested_dict)()['a'] is nested_dict['a'])
+        for value in (bson.SON([('a', 1)]), collections.OrderedDict([('a', {'x': 1})]), RecordingDict(a=1)):
+            self.assertEqual((RecordingDict, value), (type(default_copier(value)()), default_copier(value)()))
+        field = Field(dict, default=flat_dict)
+        self.assertTrue(field.default_value is field.default_copier)
+        self.assertFalse(hasattr(Field(int, default=1), 'default_copier'))
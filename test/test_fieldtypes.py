@@ -0,0 +1,137 @@
+import decimal
+import enum
+import unittest
+import uuid
+
+import bson
+import pymongo
+import six
+
+from bson.binary import Binary
+from bson.codec_options import TypeRegistry
+from bson.decimal128 import Decimal128
+
+from nanomongo.document import BaseDocument
+from nanomongo.errors import ValidationError
+from nanomongo.field import Field
+from nanomongo.fieldtypes import Decoder, DecimalType, Encoder, EnumType, FieldType, UUIDType, type_codecs
+
+
+class Color(enum.Enum):
+    RED = 'red'
+    GREEN = 'green'
+
+
+class Size(str, enum.Enum):
+    SMALL = 'S'
+    LARGE = 'L'
+
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+    def __eq__(self, other):
+        return isinstance(other, Point) and (self.x, self.y) == (other.x, other.y)
+
+
+class PointType(FieldType):
+    """Packs two small ints into a 2 byte binary"""
+    python_type = Point
+    bson_type = Binary
+    decode_in_bson = False
+
+    def transform_python(self, value):
+        return Binary(bytearray([value.x, value.y]))
+
+    def transform_bson(self, value):
+        return Point(*bytearray(value))
+
+    def validate(self, value, field_name=''):
+        if not (0 <= value.x < 256 and 0 <= value.y < 256):
+            raise ValidationError('%s: coordinates out of range' % field_name)
+
+
+class FieldTypeTestCase(unittest.TestCase):
+    def test_field_types(self):
+        self.assertTrue(isinstance(Field.field_types[decimal.Decimal], DecimalType))
+        self.assertTrue(isinstance(Field.field_types[uuid.UUID], UUIDType))
+        self.assertRaises(TypeError, Field.register_type, *(Point,))
+        self.assertRaises(TypeError, Field, *(type('Unregistered', (object,), {}),))
+        field_types = dict(Field.field_types)
+        field = Field(PointType())
+        self.assertEqual(Point, field.data_type)
+        self.assertEqual(Color, Field(EnumType(Color)).data_type)
+        self.assertEqual(field_types, Field.field_types)  # not registered
+        self.assertRaises(TypeError, Field, *(Color,))
+        self.assertRaises(TypeError, Field, *(Point,))
+        Field.register_type(field.field_type)
+        try:
+            self.assertTrue(Field(Point).field_type is field.field_type)
+        finally:
+            del Field.field_types[Point]
+        field.validator(Point(1, 2))
+        self.assertRaises(ValidationError, field.validator, *(Point(1, 256),))
+        self.assertRaises(ValidationError, field.validator, *((1, 2),))
+        self.assertRaises(ValidationError, Field(decimal.Decimal).validator, *(decimal.Decimal('1e9999'),))
+        self.assertRaises(TypeError, Field, *(decimal.Decimal,), **{'default': 1.5})
+
+    def test_type_codecs(self):
+        decimal_type, uuid_type, color_type, size_type = DecimalType(), UUIDType(), EnumType(Color), EnumType(Size)
+        self.assertFalse(decimal_type.encoded_natively())
+        self.assertTrue(uuid_type.encoded_natively())
+        self.assertTrue(size_type.encoded_natively())
+        self.assertEqual(str, color_type.bson_type)
+        codecs = type_codecs([decimal_type, uuid_type, color_type, size_type])
+        self.assertEqual(2, len(codecs))
+        self.assertTrue(decimal_type in codecs)
+        encoder = [codec for codec in codecs if isinstance(codec, Encoder)][0]
+        self.assertEqual(Color, encoder.python_type)
+        TypeRegistry(codecs)
+
+        class Natively(FieldType):  # encoded by bson, decoded in bson
+            python_type = int
+            bson_type = Decimal128
+
+            def transform_python(self, value):
+                return value
+
+            def transform_bson(self, value):
+                return int(value.to_decimal())
+
+        self.assertTrue(isinstance(type_codecs([Natively()])[0], Decoder))
+
+    def test_document_codec_options(self):
+        class Product(BaseDocument):
+            price = Field(decimal.Decimal)
+            color = Field(EnumType(Color))
+            size = Field(EnumType(Size), required=False)
+            position = Field(PointType(), required=False)
+            sku = Field(uuid.UUID, required=False)
+            name = Field(six.text_type, default=six.u('red'))
+
+        class Plain(BaseDocument):
+            foo = Field(six.text_type)
+
+        client = pymongo.MongoClient(connect=False)
+        for doc_class in (Product, Plain):
+            doc_class.nanomongo.set_client(client)
+            doc_class.nanomongo.set_db('nanotestdb')
+        self.assertEqual(None, Plain.nanomongo.codec_options())
+        self.assertEqual([], Plain.nanomongo.type_codecs)
+        self.assertEqual(client.codec_options, Plain.get_collection().codec_options)
+        codec_options = Product.get_collection().codec_options
+        self.assertEqual(3, len(Product.nanomongo.type_codecs))
+
+        sku = uuid.uuid4()
+        product = Product(price=decimal.Decimal('9.99'), color=Color.RED, size=Size.LARGE,
+                          position=Point(3, 4), sku=sku)
+        raw = bson.BSON.encode(product, codec_options=codec_options)
+        stored = bson.BSON(raw).decode()  # without the type registry
+        self.assertEqual((Decimal128('9.99'), 'red', 'L', b'\x03\x04'),
+                         (stored['price'], stored['color'], stored['size'], stored['position']))
+        decoded = bson.BSON(raw).decode(codec_options=codec_options)
+        self.assertEqual(decimal.Decimal('9.99'), decoded['price'])  # decoded in bson
+        self.assertEqual('red', decoded['color'])  # str is shared with name, decoded per field
+        self.assertEqual(product, Product(Product.nanomongo.from_db(decoded)))
+        self.assertEqual('red', decoded['name'])
@@ -0,0 +1,198 @@
+import decimal
+import enum
+import threading
+import unittest
+import uuid
+
+import bson
+import pymongo
+import six
+
+from bson.decimal128 import Decimal128
+
+from nanomongo.document import BaseDocument
+from nanomongo.errors import UnsupportedOperation
+from nanomongo.field import Field
+from nanomongo.fieldtypes import EnumType
+from nanomongo.materialized import Index, MaterializedCollection, matches, sort_key
+
+from . import TEST_DBNAME, mongomock, use_mongomock
+
+
+class Plan(BaseDocument):
+    _id = Field(int)
+    name = Field(six.text_type)
+    price = Field(int)
+    tags = Field(list, default=[])
+    limits = Field(dict, default={})
+
+    __indexes__ = [
+        pymongo.IndexModel('name', unique=True),
+        pymongo.IndexModel([('price', pymongo.ASCENDING), ('name', pymongo.ASCENDING)]),
+    ]
+
+
+class Color(enum.Enum):
+    RED = 'red'
+    BLUE = 'blue'
+
+
+class MatcherTestCase(unittest.TestCase):
+    def test_matches(self):
+        doc = {'_id': 1, 'foo': 42, 'tags': ['a', 'b'], 'sub': {'bar': 'x'}, 'subs': [{'bar': 1}, {'bar': 2}]}
+        for spec in ({}, {'foo': 42}, {'foo': 42.0}, {'tags': 'a'}, {'tags': ['a', 'b']}, {'sub.bar': 'x'},
+                     {'sub': {'bar': 'x'}}, {'subs.bar': 2}, {'foo': {'$in': [1, 42]}}, {'foo': {'$gte': 42}},
+                     {'foo': {'$gt': 1, '$lt': 50}}, {'foo': {'$ne': 1}}, {'missing': None},
+                     {'missing': {'$exists': False}}, {'tags': {'$nin': ['c']}}):
+            self.assertTrue(matches(doc, spec), spec)
+        for spec in ({'foo': 1}, {'foo': '42'}, {'foo': True}, {'tags': 'c'}, {'foo': {'$gt': 42}},
+                     {'foo': {'$lt': 'z'}}, {'sub.bar': 'y'}, {'foo': {'$exists': False}}, {'foo': None}):
+            self.assertFalse(matches(doc, spec), spec)
+
+    def test_sort_key(self):
+        values = [True, 'b', 2.5, None, {'a': 1}, 1, bson.ObjectId(), 'a', [1]]
+        self.assertEqual([None, 1, 2.5, 'a', 'b', {'a': 1}, [1]], sorted(values, key=sort_key)[:7])
+        self.assertEqual(True, sorted(values, key=sort_key)[-1])
+
+    def test_numbers(self):
+        docs = [{'_id': n, 'v': v} for n, v in enumerate([5, 10, 7.5, decimal.Decimal('7.5'), Decimal128('5'),
+                                                          decimal.Decimal('NaN')])]
+        self.assertEqual([1, 2, 3], [d['_id'] for d in docs if matches(d, {'v': {'$gt': decimal.Decimal('6')}})])
+        self.assertEqual([0, 4], [d['_id'] for d in docs if matches(d, {'v': 5})])
+        self.assertEqual([2, 3], [d['_id'] for d in docs if matches(d, {'v': {'$gte': 7, '$lte': Decimal128('8')}})])
+        ordered = sorted(docs, key=lambda d: sort_key(d['v']))
+        self.assertEqual([5, 0, 4, 2, 3, 1], [d['_id'] for d in ordered])  # NaN first, stable for equal values
+        index = Index('v')
+        for doc in docs:
+            index.add(doc['_id'], doc)
+        self.assertEqual({0, 4}, index.candidates(decimal.Decimal('5')))
+        self.assertEqual({2, 3}, index.candidates({'$in': [7.5]}))
+        self.assertEqual({1, 2, 3}, index.candidates({'$gt': 6}))
+
+    def test_index(self):
+        index = Index('price')
+        for _id, price in enumerate([10, 20, 20, 30, 'free']):
+            index.add(_id, {'_id': _id, 'price': price})
+        index.add(5, {'_id': 5})
+        self.assertEqual({1, 2}, index.candidates(20))
+        self.assertEqual({0, 3}, index.candidates({'$in': [10, 30]}))
+        self.assertEqual({1, 2, 3}, index.candidates({'$gte': 20}))
+        self.assertEqual({0, 1, 2}, index.candidates({'$gt': 5, '$lte': 20}))
+        self.assertEqual({4}, index.candidates({'$gte': ''}))
+        self.assertEqual({5}, index.candidates(None))
+        self.assertEqual(None, index.candidates({'$exists': True}))
+        index.remove(1, {'_id': 1, 'price': 20})
+        self.assertEqual({2}, index.candidates(20))
+        self.assertEqual({2, 3}, index.candidates({'$gt': 15}))
+
+
+@unittest.skipUnless(mongomock, 'mongomock not installed')
+class MaterializedTestCase(unittest.TestCase):
+    def setUp(self):
+        class MemPlan(Plan):
+            pass
+        client = use_mongomock(MemPlan)
+        self.collection = client[TEST_DBNAME]['memplan']
+        for n, (name, price) in enumerate([('free', 0), ('basic', 10), ('pro', 20), ('team', 20)]):
+            self.collection.insert_one({'_id': n, 'name': name, 'price': price, 'tags': ['t%d' % n], 'limits': {}})
+        self.Doc = MemPlan
+
+    def tearDown(self):
+        self.Doc.nanomongo.materialize(enabled=False)
+
+    def test_find(self):
+        Doc = self.Doc
+        Doc.nanomongo.materialize(refresh=None)
+        materialized = Doc.nanomongo.materialized
+        self.assertEqual(['_id', 'name', 'price'], sorted(materialized.indexes))
+        self.assertEqual('pro', Doc.find_one(2)['name'])
+        self.assertEqual(Doc, type(Doc.find_one({'name': 'basic'})))
+        self.assertEqual(None, Doc.find_one({'name': 'enterprise'}))
+        self.assertEqual(['pro', 'team'], [d['name'] for d in Doc.find({'price': 20}, sort=[('name', 1)])])
+        cursor = Doc.find({'price': {'$gte': 10}}).sort('name', pymongo.DESCENDING).skip(1).limit(1)
+        self.assertEqual(['pro'], [d['name'] for d in cursor])
+        self.assertEqual(3, Doc.find({'price': {'$gte': 10}}).count())
+        self.assertEqual(['t3'], Doc.find_one({'tags': 't3', 'price': {'$in': [20, 30]}})['tags'])
+        read_only = Doc.find_one({'name': 'basic'}, read_only=True)
+        self.assertEqual((Doc.read_only, ['t1']), (type(read_only), read_only['tags']))
+        self.assertEqual([Doc.read_only], [type(d) for d in Doc.find({'price': 20}, read_only=True).limit(1)])
+        # the cursor API of pymongo
+        cursor = Doc.find({}, sort=[('price', -1), ('_id', 1)])
+        self.assertEqual(('pro', 'free'), (cursor[0]['name'], cursor[3]['name']))
+        self.assertRaises(IndexError, cursor.__getitem__, *(4,))
+        self.assertTrue(cursor[1:3] is cursor)
+        clone = cursor.clone()
+        self.assertEqual((['team', 'basic'], ['team', 'basic']), ([d['name'] for d in cursor], [d['name'] for d in clone]))
+        self.assertFalse(cursor.alive)
+        self.assertEqual((['team', 'basic'], []), ([d['name'] for d in cursor.rewind()], list(cursor[2:2])))
+        with Doc.find({}) as cursor:
+            next(cursor)
+        self.assertEqual((False, []), (cursor.alive, list(cursor)))
+        # arrays sort by their smallest (ascending) or largest (descending) element
+        self.collection.update_one({'_id': 0}, {'$set': {'tags': ['t9', 'a']}})
+        self.collection.update_one({'_id': 1}, {'$set': {'tags': []}})
+        materialized.refresh()
+        self.assertEqual([1, 0, 2, 3], [d['_id'] for d in Doc.find({}, sort=[('tags', 1)])])
+        self.assertEqual([0, 3, 2, 1], [d['_id'] for d in Doc.find({}, sort=[('tags', -1)])])
+        # returned documents are copies
+        doc = Doc.find_one(0)
+        doc['tags'].append('changed')
+        self.assertEqual(['t9', 'a'], Doc.find_one(0)['tags'])
+        # unsupported in memory
+        self.assertRaises(UnsupportedOperation, materialized.find, {'$or': [{'price': 0}]})
+        self.assertRaises(UnsupportedOperation, materialized.find, {'name': {'$regex': 'p'}})
+        self.assertRaises(UnsupportedOperation, materialized.find, {}, projection=['name'])
+        self.assertTrue(isinstance(Doc.find({'name': {'$regex': 'p'}}).cursor, mongomock.collection.Cursor))
+
+    def test_refresh(self):
+        Doc = self.Doc
+        Doc.nanomongo.materialize(refresh=None)
+        materialized = Doc.nanomongo.materialized
+        self.collection.insert_one({'_id': 4, 'name': 'enterprise', 'price': 100, 'tags': [], 'limits': {}})
+        self.assertEqual(None, Doc.find_one({'name': 'enterprise'}))
+        materialized.refresh()
+        self.assertEqual(4, Doc.find_one({'name': 'enterprise'})['_id'])
+        # change stream events
+        materialized.apply_change({'operationType': 'update', 'documentKey': {'_id': 4},
+                                   'fullDocument': {'_id': 4, 'name': 'enterprise', 'price': 90}})
+        self.assertEqual([4], [d['_id'] for d in Doc.find({'price': {'$gt': 50, '$lt': 95}})])
+        materialized.apply_change({'operationType': 'delete', 'documentKey': {'_id': 4}})
+        self.assertEqual(None, Doc.find_one(4))
+        self.assertEqual(0, Doc.find({'price': {'$gt': 50}}).count())
+
+    def test_poll(self):
+        Doc = self.Doc
+        refreshed = threading.Event()
+
+        class PollingCollection(MaterializedCollection):
+            def refresh(self):
+                super(PollingCollection, self).refresh()
+                if self.thread is not None:
+                    refreshed.set()
+
+        Doc.nanomongo.materialized = PollingCollection(Doc.nanomongo, refresh='poll', interval=0.01)
+        Doc.nanomongo.materialized.start()
+        self.collection.delete_one({'_id': 0})
+        refreshed.clear()
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual(None, Doc.find_one(0))
+        self.assertRaises(TypeError, MaterializedCollection, *(Doc.nanomongo,), **{'refresh': 'always'})
+
+    def test_field_types(self):
+        class Paint(BaseDocument):
+            _id = Field(int)
+            color = Field(EnumType(Color))
+            price = Field(decimal.Decimal)
+            sku = Field(uuid.UUID, required=False)
+
+        Paint.nanomongo.set_client(pymongo.MongoClient(connect=False))
+        Paint.nanomongo.set_db(TEST_DBNAME)
+        materialized = MaterializedCollection(Paint.nanomongo, refresh=None)
+        sku = uuid.uuid4()
+        for n, (color, price) in enumerate([('red', '5'), ('blue', '10'), ('red', '7.5')]):
+            materialized.put({'_id': n, 'color': color, 'price': decimal.Decimal(price), 'sku': sku})
+        self.assertEqual([0, 2], [d['_id'] for d in materialized.find({'color': Color.RED}, sort=[('_id', 1)])])
+        self.assertEqual([1], [d['_id'] for d in materialized.find({'color': {'$in': [Color.BLUE]}})])
+        self.assertEqual(Color.RED, materialized.find_one({'price': {'$gt': decimal.Decimal('6'), '$lt': 8}})['color'])
+        self.assertEqual([0, 2, 1], [d['_id'] for d in materialized.find({'price': {'$gte': 5}}, sort=[('price', 1)])])
+        self.assertRaises(UnsupportedOperation, materialized.find, {'sku': sku})  # answered by the database
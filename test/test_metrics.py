@@ -0,0 +1,152 @@
+import datetime
+import unittest
+
+import mock
+import pymongo
+import six
+
+from nanomongo import metrics
+from nanomongo.field import Field
+from nanomongo.document import BaseDocument
+from nanomongo.util import TimedCursor
+
+from . import PYMONGO_CLIENT, TEST_DBNAME, mongomock, use_mongomock
+
+
+class MetricsTestCase(unittest.TestCase):
+    def tearDown(self):
+        metrics.disable()
+
+    def test_histogram(self):
+        hist = metrics.Histogram(buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            hist.observe(value)
+        self.assertEqual([(1, 2), (2, 3), (float('inf'), 4)], hist.cumulative())
+        self.assertEqual(6.0, hist.sum)
+
+    def test_disabled(self):
+        class Doc(BaseDocument):
+            foo = Field(list)
+
+        self.assertTrue(metrics.NULL_OPERATION is metrics.operation(Doc, 'find'))
+        Doc().add_to_set('foo', 42)
+        collector = metrics.enable()
+        metrics.disable()
+        Doc().add_to_set('foo', 42)
+        self.assertEqual({}, collector.latency)
+
+    def test_operation_metrics(self):
+        class Doc(BaseDocument):
+            foo = Field(list)
+
+        collector = metrics.enable(buckets=(10,))
+        Doc().add_to_set('foo', 42)
+        self.assertRaises(Exception, Doc().add_to_set, *('bar', 42))
+        with metrics.operation(Doc, 'insert') as op:
+            with op.phase('validate_all'):
+                pass
+        metrics.documents_decoded(Doc, 3)
+        self.assertEqual(2, collector.latency[('Doc', 'add_to_set')].count)
+        self.assertEqual(1, collector.failures[('Doc', 'add_to_set')])
+        self.assertEqual(1, collector.phases[('Doc', 'insert', 'validate_all')][1])
+        self.assertEqual(3, collector.documents[('Doc', 'find')])
+        text = collector.prometheus()
+        self.assertTrue('nanomongo_operation_duration_seconds_bucket{cls="Doc",le="10",operation="add_to_set"} 2' in text)
+        self.assertTrue('nanomongo_operation_duration_seconds_count{cls="Doc",operation="insert"} 1' in text)
+        self.assertTrue('nanomongo_documents_decoded_total{cls="Doc",operation="find"} 3' in text)
+        self.assertTrue('# TYPE nanomongo_phase_seconds_total counter' in text)
+
+    def test_command_listener(self):
+        class Doc(BaseDocument):
+            pass
+
+        collector = metrics.enable()
+        listener = collector.command_listener()
+        self.assertTrue(isinstance(listener, pymongo.monitoring.CommandListener))
+        started = pymongo.monitoring.CommandStartedEvent(
+            {'insert': 'doc', 'documents': [{'foo': 42}]}, TEST_DBNAME, 1, ('localhost', 27017), 1)
+        succeeded = pymongo.monitoring.CommandSucceededEvent(
+            datetime.timedelta(milliseconds=2), {'ok': 1}, 'insert', 1, ('localhost', 27017), 1)
+        with metrics.operation(Doc, 'insert'):
+            listener.started(started)
+            listener.succeeded(succeeded)
+        listener.started(started)  # outside of a nanomongo operation
+        listener.succeeded(succeeded)
+        self.assertEqual(0.002, collector.commands[('Doc', 'insert', 'insert')].sum)
+        self.assertEqual(1, collector.commands[('%s.doc' % TEST_DBNAME, 'insert', 'insert')].count)
+        self.assertTrue(collector.bson_bytes[('Doc', 'insert', 'sent')] > 0)
+        self.assertTrue(collector.bson_bytes[('Doc', 'insert', 'received')] > 0)
+        self.assertEqual({}, listener.pending)
+
+    def test_deferred(self):
+        class Doc(BaseDocument):
+            pass
+
+        class MotorCursor(object):
+            def __aiter__(self):
+                return self
+
+        collector = metrics.enable()
+        future = mock.Mock(spec=['add_done_callback', 'cancelled', 'exception'])  # a motor future
+        with metrics.operation(Doc, 'find_one') as op:
+            self.assertTrue(future is op.defer(future))
+        self.assertFalse(('Doc', 'find_one') in collector.latency)  # recorded once done
+        future.cancelled.return_value, future.exception.return_value = False, ValueError()
+        future.add_done_callback.call_args[0][0](future)
+        self.assertEqual((1, 1), (collector.latency[('Doc', 'find_one')].count, collector.failures[('Doc', 'find_one')]))
+        with metrics.operation(Doc, 'aggregate') as op:
+            op.defer(MotorCursor())  # lazy, not recorded
+        self.assertFalse(('Doc', 'aggregate') in collector.latency)
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_find_metrics(self):
+        class Doc(BaseDocument):
+            foo = Field(int)
+
+        use_mongomock(Doc)
+        Doc.get_collection().insert_many([{'foo': n} for n in range(3)])
+        collector = metrics.enable()
+        cursor = Doc.find({'foo': {'$gte': 1}}).sort('foo', pymongo.DESCENDING)
+        self.assertFalse(('Doc', 'find') in collector.latency)  # not sent yet
+        self.assertEqual([2, 1], [doc['foo'] for doc in cursor])
+        self.assertEqual(1, collector.latency[('Doc', 'find')].count)  # first document only
+        self.assertEqual([], list(Doc.find({'foo': 5})))
+        self.assertEqual((2, None), (collector.latency[('Doc', 'find')].count, collector.failures.get(('Doc', 'find'))))
+        # indexing, slicing and clones keep the cursor API and timing
+        cursor = Doc.find(sort=[('foo', 1)])
+        self.assertEqual(1, cursor[1]['foo'])
+        self.assertEqual(3, collector.latency[('Doc', 'find')].count)
+        self.assertTrue(cursor[1:] is cursor)
+        clone = cursor.clone()
+        self.assertTrue(isinstance(clone, TimedCursor) and clone is not cursor)
+        self.assertEqual(([1, 2], [1, 2]), ([doc['foo'] for doc in cursor], [doc['foo'] for doc in clone]))
+        self.assertEqual(5, collector.latency[('Doc', 'find')].count)
+        self.assertEqual([1, 2], [doc['foo'] for doc in clone.rewind()])
+        self.assertEqual(6, collector.latency[('Doc', 'find')].count)
+        metrics.disable()
+        cursor = Doc.find().limit(2)
+        self.assertTrue(isinstance(cursor, TimedCursor))  # the same API while disabled
+        self.assertEqual(([0, 1], 6), ([doc['foo'] for doc in cursor], collector.latency[('Doc', 'find')].count))
+
+    @unittest.skipUnless(PYMONGO_CLIENT, 'pymongo not installed or connection refused')
+    def test_document_metrics(self):
+        """Pymongo: Test metrics of insert, save, find, find_one"""
+
+        class Doc(BaseDocument):
+            dot_notation = True
+            foo = Field(six.text_type)
+        PYMONGO_CLIENT.drop_database(TEST_DBNAME)
+        Doc.register(client=PYMONGO_CLIENT, db=TEST_DBNAME)
+
+        collector = metrics.enable()
+        d = Doc(foo=six.u('foo'))
+        d.insert()
+        d.foo = six.u('bar')
+        d.save()
+        list(Doc.find())
+        Doc.find_one(d._id)
+        for op in ('insert', 'save', 'find', 'find_one'):
+            self.assertEqual(1, collector.latency[('Doc', op)].count)
+        self.assertEqual(1, collector.phases[('Doc', 'save', 'get_sub_diff')][1])
+        self.assertEqual(1, collector.documents[('Doc', 'find')])
+        self.assertEqual(1, collector.documents[('Doc', 'find_one')])
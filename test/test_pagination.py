@@ -0,0 +1,86 @@
+import unittest
+
+import pymongo
+import six
+
+from mock import patch
+
+from nanomongo.document import BaseDocument
+from nanomongo.field import Field
+from nanomongo.pagination import after_spec, check_sort, decode_token, encode_token, full_sort
+
+from . import mongomock, use_mongomock
+
+
+class Article(BaseDocument):
+    _id = Field(int)
+    author = Field(six.text_type)
+    score = Field(int)
+
+    __indexes__ = [
+        pymongo.IndexModel([('author', pymongo.ASCENDING), ('score', pymongo.DESCENDING),
+                            ('_id', pymongo.DESCENDING)]),
+    ]
+
+
+class PaginationTestCase(unittest.TestCase):
+    def test_full_sort(self):
+        self.assertEqual([('_id', 1)], full_sort(None))
+        self.assertEqual([('score', -1), ('_id', -1)], full_sort([('score', -1)]))
+        self.assertEqual([('_id', -1), ('score', 1)], full_sort([('_id', -1), ('score', 1)]))
+        for sort in ('score', [('score', 'text')], [('score', )]):
+            self.assertRaises(TypeError, full_sort, sort)
+
+    def test_after_spec(self):
+        sort = [('score', -1), ('_id', 1)]
+        self.assertEqual({'author': 'a', '$or': [{'score': {'$lt': 5}}, {'score': 5, '_id': {'$gt': 3}}]},
+                         after_spec({'author': 'a'}, sort, [5, 3]))
+        self.assertEqual({'$and': [{'$or': [{'author': 'a'}]}, {'$or': [{'_id': {'$gt': 3}}]}]},
+                         after_spec({'$or': [{'author': 'a'}]}, [('_id', 1)], [3]))
+
+    def test_token(self):
+        sort = [('score', -1), ('_id', -1)]
+        token = encode_token(sort, Article(_id=3, author=six.u('a'), score=5))
+        self.assertEqual([5, 3], decode_token(token, sort))
+        self.assertRaises(TypeError, decode_token, *(token, [('_id', -1)]))
+        self.assertRaises(TypeError, decode_token, *('not a token', sort))
+
+    def test_check_sort(self):
+        with patch('nanomongo.pagination.logging') as mock_logging:
+            check_sort(Article, {'author': 'a'}, [('score', -1), ('_id', -1)])
+            check_sort(Article, {}, [('_id', 1)])
+            check_sort(Article, {'author': 'a'}, [('score', 1), ('_id', 1)])  # reversed index order
+            self.assertFalse(mock_logging.warning.called)
+            check_sort(Article, {}, [('score', -1), ('_id', -1)])  # no author equality prefix
+            check_sort(Article, {}, [('score', -1), ('_id', -1)])  # warned once
+            self.assertEqual(1, mock_logging.warning.call_count)
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_paginate(self):
+        use_mongomock(Article)
+        for i in range(10):
+            Article.get_collection().insert_one({'_id': i, 'author': 'a' if i % 3 else 'b', 'score': i % 4})
+        expected = sorted(Article.get_collection().find({'author': 'a'}), key=lambda d: (-d['score'], -d['_id']))
+
+        self.assertRaises(TypeError, Article.paginate, *({}, ), **{'page_size': 0})
+        pages, token = [], None
+        while True:
+            page, token = Article.paginate({'author': 'a'}, sort=[('score', -1)], page_size=2, after=token)
+            pages.append([doc['_id'] for doc in page])
+            if token is None:
+                break
+        self.assertEqual([[7, 2], [5, 1], [8, 4]], pages)
+        self.assertEqual([doc['_id'] for doc in expected], sum(pages, []))
+        self.assertEqual(([], None), Article.paginate({'author': 'c'}))
+        # projection records, including the sort fields
+        Summary = Article.projection('score')
+        pages, token = [], None
+        while True:
+            page, token = Article.paginate({'author': 'a'}, sort=[('score', -1)], page_size=4, after=token,
+                                           projection=Summary)
+            pages.append([record._id for record in page])
+            if token is None:
+                break
+        self.assertEqual([[7, 2, 5, 1], [8, 4]], pages)
+        for record_class in (Article.projection('author'), Article.projection('score', with_id=False)):
+            self.assertRaises(TypeError, Article.paginate, *({},), **{'sort': [('score', 1)], 'projection': record_class})
@@ -0,0 +1,84 @@
+import copy
+import pickle
+import unittest
+
+import six
+
+from nanomongo.document import BaseDocument
+from nanomongo.errors import UnsupportedOperation
+from nanomongo.field import Field
+from nanomongo.projection import Projection, split_projection
+
+from . import mongomock, use_mongomock
+
+
+class User(BaseDocument):
+    _id = Field(int)
+    name = Field(six.text_type)
+    following = Field(list, db_field='f', default=[])
+    bio = Field(six.text_type, required=False)
+
+
+UserSummary = User.projection('name', 'following', name='UserSummary')
+
+
+class ProjectionTestCase(unittest.TestCase):
+    def test_projection_class(self):
+        self.assertTrue(issubclass(UserSummary, Projection))
+        self.assertEqual(('_id', 'name', 'following'), UserSummary.__slots__)
+        self.assertEqual({'_id': 1, 'name': 1, 'following': 1}, UserSummary.spec)
+        self.assertEqual({'name': 1, '_id': 0}, User.projection('name', with_id=False).spec)
+        for fields in ((), ('name', 'name'), ('undefined',)):
+            self.assertRaises(TypeError, User.projection, *fields, **{'with_id': False})
+
+        class Odd(BaseDocument):
+            get = Field(int)
+
+        self.assertRaises(TypeError, Odd.projection, 'get')
+
+    def test_record(self):
+        summary = UserSummary(1, six.u('a'), following=[2])
+        self.assertEqual((1, 'a', [2]), (summary._id, summary['name'], summary.following))
+        self.assertEqual({'_id': 1, 'name': 'a', 'following': [2]}, summary.as_dict())
+        self.assertEqual(None, UserSummary(1).name)
+        self.assertEqual(None, summary.get('bio'))
+        self.assertRaises(KeyError, lambda: summary['bio'])
+        self.assertRaises(UnsupportedOperation, setattr, *(summary, 'name', 'b'))
+        self.assertRaises(TypeError, UserSummary, *(1,), **{'_id': 2})
+        self.assertFalse(hasattr(summary, '__dict__'))
+        self.assertEqual(summary, copy.copy(summary))
+        self.assertEqual(summary, pickle.loads(pickle.dumps(summary)))
+        self.assertEqual("UserSummary(_id=1, name='a', following=[2])", repr(summary))
+
+    def test_from_son(self):
+        summary = UserSummary.from_son({'_id': 1, 'name': six.u('a'), 'f': [2]})
+        self.assertEqual(UserSummary(1, six.u('a'), [2]), summary)
+        args, kwargs, record_class = split_projection(({}, UserSummary), {})
+        self.assertEqual((({}, UserSummary.spec), UserSummary), (args, record_class))
+        args, kwargs, record_class = split_projection(({}, ), {'projection': {'name': 1}})
+        self.assertEqual((None, {'projection': {'name': 1}}), (record_class, kwargs))
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_find(self):
+        use_mongomock(User)
+        for i in range(3):
+            User.get_collection().insert_one({'_id': i, 'name': 'user%d' % i, 'f': [i + 1], 'bio': 'x' * 100})
+        summaries = list(User.find({'name': {'$ne': 'user1'}}, projection=UserSummary).sort('_id', -1))
+        self.assertEqual([UserSummary(2, 'user2', [3]), UserSummary(0, 'user0', [1])], summaries)
+        self.assertEqual(UserSummary(1, 'user1', [2]), UserSummary.find_one(1))
+        self.assertEqual([0, 1, 2], [s._id for s in UserSummary.find({}, sort=[('_id', 1)])])
+        self.assertEqual(None, User.find_one({'name': 'none'}, projection=UserSummary))
+
+        class Other(BaseDocument):
+            name = Field(six.text_type)
+
+        self.assertRaises(TypeError, Other.find, *({}, ), **{'projection': UserSummary})
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_aggregate(self):
+        use_mongomock(User)
+        for i in range(3):
+            User.get_collection().insert_one({'_id': i, 'name': 'user%d' % i, 'f': [i + 1], 'bio': 'x'})
+        pipeline = [{'$match': {'_id': {'$gte': 1}}}, {'$sort': {'_id': 1}}]
+        self.assertEqual([UserSummary(1, 'user1', [2]), UserSummary(2, 'user2', [3])],
+                         list(User.aggregate(pipeline, as_class=UserSummary)))
@@ -0,0 +1,153 @@
+import datetime
+import decimal
+import json
+import unittest
+import uuid
+
+import six
+
+from mock import patch
+
+from bson import json_util, DBRef, ObjectId
+from bson.decimal128 import Decimal128
+from bson.tz_util import FixedOffset
+
+from nanomongo.document import BaseDocument, EmbeddedDocument
+from nanomongo.errors import ExtraFieldError, ValidationError
+from nanomongo.field import Field
+from nanomongo import serialization
+from nanomongo.serialization import EXTENDED_JSON, JSONCodec, json_dumps, write_jsonl
+
+from . import mongomock, use_mongomock
+
+
+class Geo(EmbeddedDocument):
+    lat = Field(float)
+    lng = Field(float)
+
+
+class Address(EmbeddedDocument):
+    street = Field(six.text_type)
+    geo = Field(Geo, required=False)
+
+
+class Record(BaseDocument):
+    _id = Field(ObjectId)
+    name = Field(six.text_type, db_field='n')
+    count = Field(int)
+    ratio = Field(float)
+    active = Field(bool)
+    created = Field(datetime.datetime)
+    price = Field(decimal.Decimal)
+    sku = Field(uuid.UUID)
+    ref = Field(DBRef, required=False)
+    tags = Field(list)
+    meta = Field(dict)
+    address = Field(Address)
+
+
+class Event(BaseDocument):  # without Decimal, mongomock has no custom type registry support
+    _id = Field(ObjectId)
+    name = Field(six.text_type, db_field='n')
+    created = Field(datetime.datetime)
+    address = Field(Address)
+
+
+def make_record():
+    return Record(
+        _id=ObjectId(), name=six.u('r\xfcckw\xe4rts'), count=2 ** 40, ratio=0.5, active=True,
+        created=datetime.datetime(2020, 1, 2, 3, 4, 5, 123000), price=decimal.Decimal('9.99'),
+        sku=uuid.uuid4(), ref=DBRef('other', ObjectId()), tags=[1, ObjectId(), datetime.datetime(1960, 1, 1)],
+        meta={'nested': {'value': float('inf'), 'id': ObjectId()}},
+        address={'street': six.u('Main St.'), 'geo': {'lat': 1.5, 'lng': -2.0}},
+    )
+
+
+class SerializationTestCase(unittest.TestCase):
+    def test_json_util_compatible(self):
+        record = make_record()
+        expected = dict(record, price=Decimal128(record['price']))
+        for mode in ('relaxed', 'canonical'):
+            text = record.to_json(mode=mode)
+            self.assertEqual(json.loads(json_util.dumps(expected, json_options=EXTENDED_JSON[mode].options)),
+                             json.loads(text))
+            self.assertEqual(record, Record.from_json(text))
+        canonical = json.loads(record.to_json(mode='canonical'))
+        self.assertEqual({'$numberLong': str(2 ** 40)}, canonical['count'])
+        self.assertEqual({'$numberDouble': '-2.0'}, canonical['address']['geo']['lng'])
+        self.assertRaises(TypeError, record.to_json, **{'mode': 'strict'})
+
+    def test_datetimes(self):
+        values = [datetime.datetime(2020, 1, 2), datetime.datetime(2020, 1, 2, 3, 4, 5, 999),
+                  datetime.datetime(1969, 12, 31, 23, 59, 59, 999000), datetime.datetime(9999, 12, 31)]
+        aware = datetime.datetime(2020, 1, 2, tzinfo=FixedOffset(60, 'UTC+1'))
+        for mode in ('relaxed', 'canonical'):
+            extended = EXTENDED_JSON[mode]
+            for value in values:
+                self.assertEqual(json.loads(json_util.dumps(value, json_options=extended.options)),
+                                 extended.encode(value))
+            # converted to UTC, decoded naive like pymongo does by default
+            self.assertEqual(datetime.datetime(2020, 1, 1, 23), extended.decode(extended.encode(aware)))
+
+    def test_codec(self):
+        codec = Record.nanomongo.json_codec()
+        self.assertTrue(codec is Record.nanomongo.json_codec('relaxed'))
+        self.assertTrue(isinstance(codec, JSONCodec))
+        self.assertEqual((None, None), (codec.encoders['name'], codec.encoders['active']))
+        self.assertTrue(Record.nanomongo.json_codec('canonical').encoders['count'] is not None)
+        # values not of the field's type are converted anyway
+        self.assertEqual('{"name":{"$oid":"%s"}}' % ('0' * 24), codec.dumps({'name': ObjectId('0' * 24)}))
+        self.assertEqual({'name': None, 'tags': [1]}, codec.loads('{"name": null, "tags": [1]}'))
+        self.assertRaises(TypeError, codec.loads, '[1]')
+        created = datetime.datetime(2020, 1, 2, 3, 4, 5, 123000)
+        for text in ('"2020-01-02T03:04:05.123Z"', '"2020-01-02T04:04:05.123+0100"', '{"$numberLong": "1577934245123"}'):
+            self.assertEqual({'created': created}, codec.loads('{"created": {"$date": %s}}' % text))
+
+    def test_json_backends(self):
+        default = EXTENDED_JSON['relaxed'].encode
+        obj = {'a': [1, six.u('\xfc')], 'b': ObjectId('0' * 24)}
+        expected = '{"a":[1,"\xfc"],"b":{"$oid":"%s"}}' % ('0' * 24)
+        self.assertEqual(expected, json_dumps(default)(obj))
+        with patch.object(serialization, 'orjson', None):
+            self.assertEqual(expected, json_dumps(default)(obj))
+
+    def test_from_json_validates(self):
+        self.assertRaises(ExtraFieldError, Record.from_json, '{"undefined": 1}')
+        record = Record.from_json('{"name": "n", "count": 1}')
+        self.assertEqual(None, record._nanodiff)
+        self.assertEqual(({'name': 'n', 'count': 1}), dict(record))
+        self.assertRaises(ValidationError, Record.from_json, '{"count": "1"}')
+        self.assertRaises(ValidationError, Record.from_json, '{"address": {"geo": {"lat": "x"}}}')
+
+    def test_write_jsonl(self):
+        records = [make_record(), make_record()]
+        fp = six.StringIO()
+        self.assertEqual(3, write_jsonl(records + [{'_id': ObjectId('0' * 24)}], fp))
+        lines = fp.getvalue().splitlines()
+        self.assertEqual(records, [Record.from_json(line) for line in lines[:2]])
+        self.assertEqual('{"_id":{"$oid":"%s"}}' % ('0' * 24), lines[2])
+        fp = six.StringIO()
+        write_jsonl([{'count': 1}], fp, doc_class=Record, mode='canonical')
+        self.assertEqual('{"count":{"$numberInt":"1"}}\n', fp.getvalue())
+        self.assertRaises(TypeError, write_jsonl, *([], fp), **{'mode': 'strict'})
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_cursor_to_jsonl(self):
+        use_mongomock(Event)
+        events = [Event(_id=ObjectId(), name=six.u('r\xfcckw\xe4rts'), created=datetime.datetime(2020, 1, n + 1),
+                        address={'street': six.u('Main St.'), 'geo': {'lat': 1.5, 'lng': float(n)}}) for n in range(3)]
+        for event in events:
+            Event.get_collection().insert_one(Event.nanomongo.to_db(event))
+        fp = six.StringIO()
+        self.assertEqual(3, Event.find({}, read_only=True).sort('_id', 1).to_jsonl(fp))
+        self.assertEqual(events, [Event.from_json(line) for line in fp.getvalue().splitlines()])
+        self.assertEqual(json.loads(events[0].to_json()),
+                         json.loads(Event.find_one(events[0]['_id'], read_only=True).to_json()))
+        fp = six.StringIO()
+        Event.find({}, projection=Event.projection('name', with_id=False)).to_jsonl(fp)
+        self.assertEqual(['{"name":"r\xfcckw\xe4rts"}'] * 3, fp.getvalue().splitlines())
+        # documents of any find()
+        use_mongomock(Event, register=True, client=Event.nanomongo.client)
+        fp = six.StringIO()
+        self.assertEqual(3, Event.find({}).sort('_id', 1).to_jsonl(fp))
+        self.assertEqual(events, [Event.from_json(line) for line in fp.getvalue().splitlines()])
@@ -0,0 +1,134 @@
+import datetime
+import unittest
+
+import pymongo
+import six
+
+from bson import DBRef
+
+from nanomongo import metrics, slowlog
+from nanomongo.document import BaseDocument
+from nanomongo.field import Field
+
+from . import TEST_DBNAME, mongomock, use_mongomock
+
+
+class Author(BaseDocument):
+    _id = Field(int)
+    name = Field(six.text_type, db_field='n')
+
+
+class Book(BaseDocument):
+    title = Field(six.text_type)
+    author = Field(DBRef, required=False, document_class='Author')
+
+
+def command_events(command, reply, request_id, millis=5):
+    address = ('localhost', 27017)
+    started = pymongo.monitoring.CommandStartedEvent(command, TEST_DBNAME, request_id, address, request_id)
+    succeeded = pymongo.monitoring.CommandSucceededEvent(
+        datetime.timedelta(milliseconds=millis), reply, list(command)[0], request_id, address, request_id)
+    return started, succeeded
+
+
+class SlowLogTestCase(unittest.TestCase):
+    def tearDown(self):
+        slowlog.disable()
+        Author.nanomongo.set_slow_threshold(None)
+
+    def test_enable_disable(self):
+        self.assertTrue(metrics.NULL_OPERATION is metrics.operation(Author, 'find'))
+        log = slowlog.enable(threshold_ms=0)
+        self.assertTrue(metrics.slow_log is log)
+        with metrics.operation(Author, 'insert') as op:
+            self.assertTrue(metrics.NULL_OPERATION is op.phase('validate_all'))  # metrics disabled
+        self.assertEqual(['insert'], [entry.operation for entry in log.entries()])
+        slowlog.disable()
+        self.assertTrue(metrics.NULL_OPERATION is metrics.operation(Author, 'find'))
+        self.assertRaises(TypeError, slowlog.enable, **{'threshold_ms': -1})
+        self.assertRaises(TypeError, Author.nanomongo.set_slow_threshold, *('10',))
+
+    def test_redact(self):
+        spec = {'age': {'$gt': 30}, 'tags': {'$in': ['a', 'b', 1]}, '$or': [{'x': None}, {'x': None}]}
+        expected = {'age': {'$gt': '<int>'}, 'tags': {'$in': ['<str>', '<int>']}, '$or': [{'x': '<NoneType>'}]}
+        self.assertEqual(expected, slowlog.redact(spec))
+
+    def test_thresholds(self):
+        log = slowlog.enable(threshold_ms=0, size=2)
+        for count in range(3):
+            with metrics.operation(Author, 'find_one', count) as op:
+                op.result(count)
+        entries = log.entries()
+        self.assertEqual([1, 2], [entry.count for entry in entries])  # oldest dropped
+        entry = entries[-1]
+        self.assertEqual(('Author', 'find_one', {'_id': '<int>'}, None, False),
+                         (entry.cls, entry.operation, entry.shape, entry.server_ms, entry.failed))
+        self.assertTrue(entry.call_site.startswith(__file__.rstrip('c')), entry.call_site)
+        self.assertTrue(entry.call_site.endswith(' in test_thresholds'))
+        log.clear()
+        Author.nanomongo.set_slow_threshold(60000)
+        with metrics.operation(Author, 'find_one', 1):
+            pass
+        with metrics.operation(Book, 'find_one', 1):
+            pass
+        self.assertEqual(['Book'], [entry.cls for entry in log.entries()])
+        log.threshold_ms = 60000
+        Author.nanomongo.set_slow_threshold(0)
+        try:
+            with metrics.operation(Author, 'save', {'_id': 1}):
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual([('Book', False), ('Author', True)], [(entry.cls, entry.failed) for entry in log.entries()])
+
+    def test_command_listener(self):
+        log = slowlog.enable(threshold_ms=4)
+        listener = log.command_listener()
+        self.assertTrue(isinstance(listener, pymongo.monitoring.CommandListener))
+        started, succeeded = command_events({'insert': 'author', 'documents': [{'_id': 1}]}, {'ok': 1}, 1, millis=2)
+        with metrics.operation(Author, 'insert') as op:
+            listener.started(started)
+            listener.succeeded(succeeded)
+            listener.started(started)
+            listener.succeeded(succeeded)
+        self.assertEqual(4, op.server_seconds * 1000)
+        # cursor commands outside of operations, attributed to the last class doing find() on the namespace
+        Author.nanomongo.set_client(pymongo.MongoClient(connect=False))
+        Author.nanomongo.set_db(TEST_DBNAME)
+        Author.nanomongo.set_collection('author')
+        with metrics.operation(Author, 'find'):
+            pass
+        started, succeeded = command_events({'find': 'author', 'filter': {'n': 'x'}},
+                                            {'ok': 1, 'cursor': {'id': 7, 'firstBatch': [{}, {}]}}, 2)
+        listener.started(started)
+        listener.succeeded(succeeded)
+        started, succeeded = command_events({'getMore': 7, 'collection': 'other'},
+                                            {'ok': 1, 'cursor': {'id': 0, 'nextBatch': [{}]}}, 3)
+        listener.started(started)
+        listener.succeeded(succeeded)
+        started, succeeded = command_events({'find': 'author'}, {'ok': 1}, 4, millis=1)  # fast
+        listener.started(started)
+        listener.succeeded(succeeded)
+        entries = log.entries()
+        self.assertEqual([('Author', 'find', {'n': '<str>'}, 2, 5), ('%s.other' % TEST_DBNAME, 'getMore', None, 1, 5)],
+                         [(e.cls, e.operation, e.shape, e.count, e.server_ms) for e in entries])
+        self.assertEqual({}, listener.pending)
+
+    @unittest.skipUnless(mongomock, 'mongomock not installed')
+    def test_document_operations(self):
+        for doc_class in (Author, Book):
+            use_mongomock(doc_class)
+            doc_class.nanomongo.set_collection(doc_class.__name__.lower())
+        log = slowlog.enable(threshold_ms=0)
+        author = Author(_id=1, name=six.u('a'))
+        author.insert()
+        author['name'] = six.u('b')
+        author.save()
+        book = Book(title=six.u('t'), author=DBRef('author', 1))
+        Author.find_one({'name': 'b'}, read_only=True)
+        book.get_author_field()
+        entries = log.entries()
+        self.assertEqual([('insert', None, 1), ('save', {'_id': '<int>'}, 1), ('find_one', {'name': '<str>'}, 1),
+                          ('find_one', {'_id': '<int>'}, 1), ('dereference', {'_id': '<int>'}, 1)],
+                         [(entry.operation, entry.shape, entry.count) for entry in entries])
+        self.assertTrue(all(entry.call_site.endswith(' in test_document_operations') for entry in entries))
@@ -1,3 +1,6 @@
+import datetime
+import subprocess
+import sys
 import unittest
 
 from mock import patch
@@ -6,7 +9,8 @@ from nanomongo.field import Field
 from nanomongo.document import BaseDocument
 from nanomongo.util import (
     DotNotationMixin, valid_field, valid_client, RecordingDict, check_keys,
-    allow_client,
+    allow_client, check_spec, set_check_spec_level, spec_shape, check_spec_config, check_update,
+    check_pipeline,
 )
 from nanomongo.errors import ValidationError
 
@@ -32,6 +36,11 @@ class HelperFuncionsTestCase(unittest.TestCase):
     def test_valid_client_motor(self):
         self.assertTrue(valid_client(MOTOR_CLIENT))
 
+    def test_import_does_not_load_motor(self):
+        """Test that motor (and tornado) are not imported along with nanomongo"""
+        code = 'import sys, nanomongo; sys.exit(any(m in sys.modules for m in ("motor", "tornado")))'
+        self.assertEqual(0, subprocess.call([sys.executable, '-c', code]))
+
     def test_check_keys(self):
         bad_dicts = [
             {'foo.bar': 42}, {'$foo': 42}, {'foo': {'bar.foo': 42}},
@@ -70,6 +79,88 @@ class HelperFuncionsTestCase(unittest.TestCase):
             Doc.find({'foo_dict.foo': 42})
             self.assertFalse(mock_logging.warning.called)
 
+    def test_spec_shape(self):
+        self.assertEqual(spec_shape({'foo': 42, 'bar': {'$in': [1, 2]}}),
+                         spec_shape({'bar': {'$in': [3]}, 'foo': 1337}))
+        self.assertNotEqual(spec_shape({'foo': 42}), spec_shape({'foo': '42'}))
+        self.assertNotEqual(spec_shape({'foo': {'$gt': 1}}), spec_shape({'foo': {'$lt': 1}}))
+
+    def test_check_spec_levels(self):
+        """Test check_spec caching by query shape and check levels"""
+        class Doc(BaseDocument):
+            foo = Field(str)
+
+        self.assertRaises(TypeError, set_check_spec_level, 'loud')
+        self.assertRaises(TypeError, Doc.nanomongo.set_check_spec_level, 'loud')
+        with patch('nanomongo.util.logging') as mock_logging:
+            check_spec(Doc, {'foo': 42})
+            check_spec(Doc, {'foo': 1337})  # same shape, default level warns every time
+            self.assertEqual(2, mock_logging.warning.call_count)
+        self.assertEqual(1, len(Doc.nanomongo.spec_cache))
+
+        Doc.nanomongo.set_check_spec_level('warn_once')
+        with patch('nanomongo.util.logging') as mock_logging:
+            check_spec(Doc, {'foo': 42})  # shape already seen
+            check_spec(Doc, {'bar': 42})
+            check_spec(Doc, {'bar': 1337})
+            self.assertEqual(1, mock_logging.warning.call_count)
+
+        Doc.nanomongo.set_check_spec_level('strict')
+        self.assertRaises(ValidationError, check_spec, *(Doc, {'foo': 42}))
+        check_spec(Doc, {'foo': '42'})
+
+        Doc.nanomongo.set_check_spec_level('off')
+        with patch('nanomongo.util.logging') as mock_logging:
+            check_spec(Doc, {'foo.bar': 42})
+            self.assertFalse(mock_logging.warning.called)
+
+        Doc.nanomongo.set_check_spec_level(None)
+        set_check_spec_level('sampled', sample_rate=0)
+        try:
+            with patch('nanomongo.util.logging') as mock_logging:
+                check_spec(Doc, {'foo.bar': 42})
+                self.assertFalse(mock_logging.warning.called)
+        finally:
+            set_check_spec_level('warn', sample_rate=0.01)
+        self.assertEqual({'level': 'warn', 'sample_rate': 0.01}, check_spec_config)
+
+        class StrictDoc(BaseDocument):
+            check_spec_level = 'strict'
+            foo = Field(str)
+
+        self.assertFalse(hasattr(StrictDoc, 'check_spec_level'))
+        self.assertRaises(ValidationError, check_spec, *(StrictDoc, {'bar': 42}))
+
+    def test_check_update(self):
+        """Test update operator validation against fields"""
+        class Doc(BaseDocument):
+            foo = Field(str)
+            bar = Field(int, required=False)
+            baz = Field(dict, required=False)
+            moo = Field(list, required=False)
+            created = Field(datetime.datetime, required=False)
+
+        for update in ({'$set': {'bar': 1, 'baz.x': 'y'}}, {'$inc': {'bar': -1}}, {'$unset': {'bar': 1}},
+                       {'$push': {'moo': 1}, '$setOnInsert': {'foo': 'foo'}}, {'$currentDate': {'created': True}},
+                       {'$max': {'created': datetime.datetime.utcnow()}}):
+            check_update(Doc, update)
+        for update in ({}, {'bar': 1}, {'$set': 'bar'}, {'$set': {'bar': '1'}}, {'$set': {'undefined': 1}},
+                       {'$set': {'bar.x': 1}}, {'$unset': {'foo': 1}}, {'$inc': {'foo': 1}},
+                       {'$addToSet': {'baz': 1}}, {'$currentDate': {'bar': True}}):
+            self.assertRaises(ValidationError, check_update, *(Doc, update))
+
+    def test_check_pipeline(self):
+        """Test $match stages of aggregation pipelines are checked until documents are reshaped"""
+        class Doc(BaseDocument):
+            check_spec_level = 'strict'
+            foo = Field(str)
+
+        check_pipeline(Doc, [{'$match': {'foo': 'foo'}}, {'$sort': {'foo': 1}}, {'$limit': 2}])
+        check_pipeline(Doc, [{'$group': {'_id': '$foo', 'n': {'$sum': 1}}}, {'$match': {'n': 42}}])
+        self.assertRaises(ValidationError, check_pipeline, *(Doc, [{'$limit': 2}, {'$match': {'bar': 42}}]))
+        for pipeline in ({'$match': {}}, [{'$match': {}, '$limit': 1}], ['$match']):
+            self.assertRaises(TypeError, check_pipeline, *(Doc, pipeline))
+
     def test_allow_mock(self):
         class MockClient():
             pass
@@ -129,6 +220,21 @@ class RecordingDictTestCase(unittest.TestCase):
         d['sub']['bar'] = 1337  # same value set
         self.assertEqual(nanodiff_base, d.get_sub_diff())
 
+    def test_lazy_diff(self):
+        """Test that diff state is allocated on first change and freed on reset"""
+        d = RecordingDict(foo=1, sub=RecordingDict(bar=2))  # as loaded from a cursor
+        self.assertFalse(hasattr(d, '__dict__'))
+        self.assertTrue(d._nanodiff is None and d['sub']._nanodiff is None)
+        self.assertEqual({'$set': {}, '$unset': {}, '$addToSet': {}}, d.get_sub_diff())
+        d.check_can_update('$addToSet', 'foo')
+        self.assertTrue(d._nanodiff is None)
+        d['sub']['bar'] = 3
+        self.assertTrue(d._nanodiff is None)
+        self.assertEqual({'$set': {'bar': 3}, '$unset': {}, '$addToSet': {}}, d['sub']._nanodiff)
+        self.assertEqual({'sub.bar': 3}, d.get_sub_diff()['$set'])
+        d.reset_diff()
+        self.assertTrue(d['sub']._nanodiff is None)
+
 
 class MixinTestCase(unittest.TestCase):
     def test_mixin(self):
@@ -0,0 +1,136 @@
+import threading
+import unittest
+
+import six
+
+from six.moves import queue
+
+from nanomongo.document import BaseDocument
+from nanomongo.errors import UnsupportedOperation, ValidationError
+from nanomongo.field import Field
+from nanomongo.writer import DeferredWriter, open_writers
+
+from . import mongomock, use_mongomock
+
+
+@unittest.skipUnless(mongomock, 'mongomock not installed')
+class DeferredWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        class Event(BaseDocument):
+            name = Field(six.text_type)
+            count = Field(int, required=False)
+
+        use_mongomock(Event)
+        self.Event = Event
+        self.collection = Event.get_collection()
+
+    def tearDown(self):
+        if self.Event.nanomongo.writer is not None:
+            self.Event.nanomongo.writer.close()
+
+    def test_deferred_insert(self):
+        Event = self.Event
+        writer = Event.writer(batch_size=10, flush_interval=60)
+        self.assertTrue(writer is Event.writer())
+        self.assertRaises(ValidationError, Event(count=1).insert, **{'deferred': True})
+        self.assertRaises(TypeError, writer.put, *({'name': 'not a document'},))
+        docs = [Event(name=six.u('event %d' % n)) for n in range(25)]
+        for doc in docs:
+            self.assertEqual(None, doc.insert(deferred=True))
+        writer.flush()
+        self.assertEqual(25, self.collection.count_documents({}))
+        self.assertTrue(all('_id' in doc for doc in docs))
+        writer.close()
+        self.assertRaises(UnsupportedOperation, writer.put, *(Event(name=six.u('late')),))
+        self.assertFalse(writer is Event.writer())  # closed writer replaced
+        writer.flush()  # closed, nothing to wait for
+        self.assertRaises(TypeError, Event(name=six.u('x')).insert, **{'deferred': True, 'session': None})
+
+    def test_flush_after_replace(self):
+        Event = self.Event
+        writer = Event.writer()
+        Event(name=six.u('event')).insert(deferred=True)
+        replacement = Event.writer(batch_size=10)
+        self.assertTrue(writer.closed and not writer.thread.is_alive())
+        self.assertFalse(writer in open_writers)
+        self.assertTrue(replacement in open_writers)
+        writer.flush()
+        self.assertEqual(1, self.collection.count_documents({}))
+
+    def test_flush_interval(self):
+        Event = self.Event
+        writer = Event.writer(batch_size=100, flush_interval=0.01)
+        Event(name=six.u('event')).insert(deferred=True)
+        writer.thread.join(0.5)  # still running, but the interval passed
+        self.assertEqual(1, self.collection.count_documents({}))
+
+    def test_on_error_and_backpressure(self):
+        Event = self.Event
+        failures = []
+        doc = Event(name=six.u('event'))
+        doc.insert()
+        writer = Event.writer(on_error=lambda e, batch: failures.append((e, batch)), batch_size=1, max_queue=1)
+        duplicate = Event(name=six.u('duplicate'), _id=doc['_id'])
+        writer.put(duplicate)
+        writer.flush()
+        self.assertEqual(1, len(failures))
+        self.assertEqual([duplicate], failures[0][1])
+        # full queue blocks, then times out
+        release = threading.Event()
+        self.collection.insert_many = lambda *args, **kwargs: release.wait(5)
+        writer.put(Event(name=six.u('1')))  # taken by the writer thread, blocked in insert_many
+        writer.put(Event(name=six.u('2')), timeout=1)  # fills the queue, or waits for the thread to take 1
+        self.assertRaises(queue.Full, writer.put, *(Event(name=six.u('3')),), **{'timeout': 0.05})
+        release.set()
+        writer.flush()
+
+    def test_close_during_put(self):
+        Event = self.Event
+        writer = Event.writer()
+        writer.put(Event(name=six.u('1')))
+        validating, closed, errors = threading.Event(), threading.Event(), []
+        doc = Event(name=six.u('2'))
+        doc.validate = lambda: validating.set() or closed.wait(5)
+
+        def put():
+            try:
+                writer.put(doc)
+            except UnsupportedOperation as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=put)
+        thread.start()
+        validating.wait(5)
+        writer.close()  # the put passed the early closed check, it must not queue after the marker
+        closed.set()
+        thread.join(5)
+        self.assertEqual(1, len(errors))
+        self.assertEqual(1, self.collection.count_documents({}))
+
+    def test_db_field(self):
+        class Click(BaseDocument):
+            url = Field(six.text_type, db_field='u')
+
+        use_mongomock(Click)
+        doc = Click(url=six.u('/'))
+        doc.insert(deferred=True)
+        Click.writer().flush()
+        Click.writer().close()
+        self.assertEqual({'_id': doc['_id'], 'u': '/'}, Click.get_collection().find_one())
+
+    def test_bad_options(self):
+        self.assertRaises(TypeError, DeferredWriter, *(self.Event,), **{'batch_size': 0})
+
+    def test_registered(self):
+        class Visit(BaseDocument):
+            url = Field(six.text_type, db_field='u')
+
+        use_mongomock(Visit, register=True)
+        docs = [Visit(url=six.u('/%d' % n)) for n in range(3)]
+        for doc in docs:
+            doc.insert(deferred=True)
+        Visit.writer().flush()
+        Visit.writer().close()
+        found = list(Visit.find({}, sort=[('u', 1)]))
+        self.assertTrue(all(isinstance(doc, Visit) for doc in found))
+        self.assertEqual(docs, found)